@@ -0,0 +1,343 @@
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from contact.models import ContactInquiry, QuoteRequest
+
+from . import dimensions, timings
+from .models import Visitor, PageView, TrafficSource, SessionData, Event, PageTiming, DailyStats
+from .querysets import range_q
+from .sessionization import sessionized_until
+
+DashboardMetrics = namedtuple('DashboardMetrics', [
+    'total_visitors', 'unique_visitors', 'total_page_views', 'total_sessions',
+    'bounce_rate', 'avg_duration', 'hourly_traffic', 'daily_traffic',
+    'top_pages', 'traffic_sources', 'device_breakdown', 'browser_breakdown',
+    'country_breakdown', 'visits', 'conversions', 'converted_visitors', 'conversion_rate',
+    'engagement_score', 'avg_load_time', 'page_timings', 'device_mix', 'geographic_data',
+])
+
+
+def percentage(part, whole):
+    return round((part / whole) * 100, 1) if whole > 0 else 0
+
+
+def plan_range(start_date, end_date):
+    """Split a date range into final DailyStats rows and days to scan raw.
+
+    Closed days with a final rollup are served from DailyStats; the open
+    day and any day that has not been rolled up yet fall back to the raw
+    tracking tables.
+    """
+    rollups = list(DailyStats.objects.filter(
+        date__range=[start_date, min(end_date, timezone.localdate() - timedelta(days=1))],
+        is_final=True,
+    ))
+    rolled_up = {stats.date for stats in rollups}
+    raw_days = [
+        day for day in (start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1))
+        if day not in rolled_up
+    ]
+    return rollups, raw_days
+
+
+def summary_metrics(start_date, end_date, plan=None):
+    """Headline totals for a date range, from rollups plus the open edge"""
+    rollups, raw_days = plan or plan_range(start_date, end_date)
+
+    total_visitors = sum(stats.total_visitors for stats in rollups)
+    total_page_views = sum(stats.total_page_views for stats in rollups)
+    total_sessions = sum(stats.total_sessions for stats in rollups)
+    visits = sum(stats.visits for stats in rollups)
+    bounces = sum(round(stats.bounce_rate * stats.visits / 100) for stats in rollups)
+    time_spent = sum(
+        (stats.avg_session_duration * stats.visits
+         for stats in rollups if stats.avg_session_duration is not None),
+        timedelta(0)
+    )
+
+    if raw_days:
+        total_visitors += Visitor.objects.on_dates(raw_days).count()
+        total_page_views += PageView.objects.on_dates(raw_days).count()
+        total_sessions += SessionData.objects.on_dates(raw_days).count()
+        watermark = sessionized_until()
+        if watermark is not None:
+            # Views past the watermark have no session flags yet
+            sessions = PageView.objects.on_dates(raw_days).filter(timestamp__lt=watermark).aggregate(
+                visits=Count('id', filter=Q(exit_page=True)),
+                bounces=Count('id', filter=Q(bounce=True)),
+                time_spent=Sum('time_spent'),
+            )
+            visits += sessions['visits']
+            bounces += sessions['bounces']
+            time_spent += sessions['time_spent'] or timedelta(0)
+
+    bounce_rate = (bounces / visits * 100) if visits > 0 else 0
+    return {
+        'total_visitors': total_visitors,
+        'unique_visitors': total_visitors,
+        'total_page_views': total_page_views,
+        'total_sessions': total_sessions,
+        'visits': visits,
+        'bounce_rate': bounce_rate,
+        'avg_duration': time_spent / visits if visits else None,
+    }
+
+
+def hourly_histogram(start_date, end_date, plan=None):
+    """Page views per hour of day, from rollups plus one grouped query"""
+    rollups, raw_days = plan or plan_range(start_date, end_date)
+    counts = [0] * 24
+    for stats in rollups:
+        for hour, count in enumerate(stats.hourly_page_views or []):
+            counts[hour] += count
+    if raw_days:
+        for hour, count in PageView.objects.on_dates(raw_days).annotate(
+            hour=ExtractHour('timestamp')
+        ).order_by().values('hour').annotate(
+            count=Count('id')
+        ).values_list('hour', 'count'):
+            counts[hour] += count
+    return [{'hour': hour, 'count': counts[hour]} for hour in range(24)]
+
+
+def daily_series(end_date, days=7):
+    """Page views per day for the last ``days`` days up to end_date"""
+    start_date = end_date - timedelta(days=days - 1)
+    rollups, raw_days = plan_range(start_date, end_date)
+    counts = {stats.date: stats.total_page_views for stats in rollups}
+    if raw_days:
+        counts.update(
+            PageView.objects.on_dates(raw_days).annotate(
+                day=TruncDate('timestamp')
+            ).order_by().values('day').annotate(
+                count=Count('id')
+            ).values_list('day', 'count')
+        )
+    return [
+        {'date': day.strftime('%Y-%m-%d'), 'count': counts.get(day, 0)}
+        for day in (start_date + timedelta(days=offset) for offset in range(days))
+    ]
+
+
+def breakdown(dimension, start_date, end_date, plan=None):
+    """{(value, label): count} for a breakdown, from daily rollups plus the open edge"""
+    rollups, raw_days = plan or plan_range(start_date, end_date)
+    counts = dimensions.load_rollups(dimension, [stats.date for stats in rollups])
+    if raw_days:
+        dimensions.collect(dimension, raw_days, counts)
+    # Ties are ordered by value so rollups and raw scans list them alike
+    return sorted(counts.items(), key=lambda item: (-item[1], repr(item[0])))
+
+
+def top_pages(start_date, end_date, total_page_views, limit=10, plan=None):
+    """Most viewed pages with their share of all page views"""
+    return [
+        {'path': path, 'page_title': page_title, 'views': views, 'percentage': percentage(views, total_page_views)}
+        for (path, page_title), views in breakdown('page', start_date, end_date, plan)[:limit]
+    ]
+
+
+def traffic_sources(start_date, end_date, unique_visitors, plan=None):
+    """Traffic sources with distinct visitor counts and percentages"""
+    return [
+        {
+            'source_type': source_type,
+            'source_name': source_name,
+            'visitors': visitors,
+            'percentage': percentage(visitors, unique_visitors),
+        }
+        for (source_type, source_name), visitors in breakdown('source', start_date, end_date, plan)
+    ]
+
+
+def visitor_breakdown(field, start_date, end_date, limit=None, plan=None):
+    """Visitor counts grouped by a Visitor column"""
+    rows = [
+        {field: value, 'count': count}
+        for (value, _), count in breakdown(field, start_date, end_date, plan)
+        if value is not None or field != 'country'
+    ]
+    return rows[:limit] if limit else rows
+
+
+def conversions(start_date, end_date):
+    """Contact and quote submissions, and the visitors they can be traced to.
+
+    Submissions are stored on the CRM side without a visitor, so each one
+    is matched to the nearest unmatched form_submit event on a conversion
+    page within ANALYTICS_CONVERSION_WINDOW seconds. Submissions made with
+    the tracking script blocked count as submissions but not as converted
+    visitors.
+    """
+    submitted = sorted(
+        list(ContactInquiry.objects.filter(range_q('created_at', start_date, end_date)).values_list('created_at', flat=True))
+        + list(QuoteRequest.objects.filter(range_q('created_at', start_date, end_date)).values_list('created_at', flat=True))
+    )
+    if not submitted:
+        return 0, 0
+
+    window = timedelta(seconds=getattr(settings, 'ANALYTICS_CONVERSION_WINDOW', 120))
+    pages = Q(pk__in=[])
+    for path in getattr(settings, 'ANALYTICS_CONVERSION_PATHS', ['/contact/']):
+        pages |= Q(page_url__contains=path)
+    submits = list(Event.objects.filter(
+        pages, event_type='form_submit', timestamp__gte=submitted[0] - window, timestamp__lte=submitted[-1] + window
+    ).order_by('timestamp').values_list('timestamp', 'visitor_id'))
+    times = [timestamp for timestamp, _ in submits]
+
+    used = set()
+    visitors = set()
+    for created_at in submitted:
+        best = None
+        index = bisect_left(times, created_at - window)
+        while index < len(times) and times[index] <= created_at + window:
+            if index not in used and (best is None or abs(times[index] - created_at) < abs(times[best] - created_at)):
+                best = index
+            index += 1
+        if best is not None:
+            used.add(best)
+            visitors.add(submits[best][1])
+    return len(submitted), len(visitors)
+
+
+def engagement_score(summary):
+    """0-10 score: equal parts non-bounce share, pages per visit and visit length"""
+    visits = summary['visits']
+    if not visits:
+        return 0.0
+    target_pages = getattr(settings, 'ANALYTICS_ENGAGEMENT_TARGET_PAGES', 5)
+    target_duration = timedelta(seconds=getattr(settings, 'ANALYTICS_ENGAGEMENT_TARGET_SECONDS', 180))
+    parts = [
+        1 - summary['bounce_rate'] / 100,
+        min(summary['total_page_views'] / visits / target_pages, 1),
+        min((summary['avg_duration'] or timedelta(0)) / target_duration, 1),
+    ]
+    return round(sum(parts) / len(parts) * 10, 1)
+
+
+def device_mix(devices):
+    """Share of visitors per device type"""
+    total = sum(device['count'] for device in devices)
+    counts = {device['device_type']: device['count'] for device in devices}
+    return {name: percentage(counts.get(name, 0), total) for name in ('mobile', 'desktop', 'tablet')}
+
+
+def geographic_data(countries, limit=5):
+    """Largest countries plus an Others slice, as shares of located visitors"""
+    total = sum(country['count'] for country in countries)
+    data = [
+        {'country': country['country'], 'visitors': country['count'], 'percentage': percentage(country['count'], total)}
+        for country in countries[:limit]
+    ]
+    others = sum(country['count'] for country in countries[limit:])
+    if others:
+        data.append({'country': 'Others', 'visitors': others, 'percentage': percentage(others, total)})
+    return data
+
+
+def timing_histograms(start_date, end_date, path=None, plan=None):
+    """Timing histograms per (path, metric), from daily digests plus the open edge"""
+    rollups, raw_days = plan or plan_range(start_date, end_date)
+    histograms = timings.load_digests([stats.date for stats in rollups], path=path)
+    if raw_days:
+        samples = PageTiming.objects.on_dates(raw_days)
+        if path is not None:
+            samples = samples.filter(path=path)
+        timings.collect(samples, histograms)
+    return histograms
+
+
+def timing_summary(histograms, quantiles=(0.5, 0.75, 0.95)):
+    """Sample count, mean and percentiles of every timing metric"""
+    summary = {}
+    for metric, histogram in timings.by_metric(histograms).items():
+        summary[metric] = {'count': histogram.count, 'mean': histogram.mean}
+        for q in quantiles:
+            summary[metric][f'p{round(q * 100)}'] = histogram.quantile(q)
+    return summary
+
+
+def slowest_pages(histograms, metric='load', limit=10):
+    """Paths with the highest 75th percentile of a metric"""
+    min_samples = getattr(settings, 'ANALYTICS_TIMING_MIN_SAMPLES', 5)
+    pages = [
+        {'path': path, 'count': histogram.count, 'p75': histogram.quantile(0.75), 'mean': histogram.mean}
+        for (path, name), histogram in histograms.items()
+        if name == metric and histogram.count >= min_samples
+    ]
+    return sorted(pages, key=lambda page: page['p75'], reverse=True)[:limit]
+
+
+def timing_series(end_date, metric='load', days=30, path=None):
+    """Daily 75th percentile of a metric, to spot regressions after a deploy"""
+    start_date = end_date - timedelta(days=days - 1)
+    rollups, raw_days = plan_range(start_date, end_date)
+    daily = timings.daily_digests([stats.date for stats in rollups], metric, path=path)
+    if raw_days and metric in PageTiming.METRICS:
+        # One pass over the unrolled days, split by local date in Python
+        samples = PageTiming.objects.on_dates(raw_days).filter(**{f'{metric}__isnull': False})
+        if path is not None:
+            samples = samples.filter(path=path)
+        for timestamp, value in samples.order_by().values_list('timestamp', metric).iterator(chunk_size=2000):
+            daily[timezone.localdate(timestamp)].add(value)
+    series = []
+    for day in (start_date + timedelta(days=offset) for offset in range(days)):
+        histogram = daily.get(day)
+        series.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'count': histogram.count if histogram else 0,
+            'p75': histogram.quantile(0.75) if histogram else None,
+        })
+    return series
+
+
+def dashboard_metrics(start_date, end_date):
+    """Compute every dashboard aggregate for a date range"""
+    # Which days come from rollups is decided once for every panel
+    plan = plan_range(start_date, end_date)
+    summary = summary_metrics(start_date, end_date, plan=plan)
+    devices = visitor_breakdown('device_type', start_date, end_date, plan=plan)
+    countries = visitor_breakdown('country', start_date, end_date, plan=plan)
+    submissions, converted_visitors = conversions(start_date, end_date)
+    page_timings = timing_summary(timing_histograms(start_date, end_date, plan=plan))
+    load = page_timings.get('load')
+    return DashboardMetrics(
+        total_visitors=summary['total_visitors'],
+        unique_visitors=summary['unique_visitors'],
+        total_page_views=summary['total_page_views'],
+        total_sessions=summary['total_sessions'],
+        bounce_rate=summary['bounce_rate'],
+        avg_duration=summary['avg_duration'],
+        hourly_traffic=hourly_histogram(start_date, end_date, plan=plan),
+        daily_traffic=daily_series(end_date),
+        top_pages=top_pages(start_date, end_date, summary['total_page_views'], plan=plan),
+        traffic_sources=traffic_sources(start_date, end_date, summary['unique_visitors'], plan=plan),
+        device_breakdown=devices,
+        browser_breakdown=visitor_breakdown('browser', start_date, end_date, plan=plan),
+        country_breakdown=countries[:10],
+        visits=summary['visits'],
+        conversions=submissions,
+        converted_visitors=converted_visitors,
+        conversion_rate=percentage(converted_visitors, summary['unique_visitors']),
+        engagement_score=engagement_score(summary),
+        avg_load_time=load['mean'] / 1000 if load else None,
+        page_timings=page_timings,
+        device_mix=device_mix(devices),
+        geographic_data=geographic_data(countries),
+    )
+
+
+def cached_dashboard_metrics(start_date, end_date):
+    """dashboard_metrics, recomputed at most once per ANALYTICS_DASHBOARD_CACHE_SECONDS"""
+    return cache.get_or_set(
+        f'analytics:dashboard:{start_date}:{end_date}',
+        lambda: dashboard_metrics(start_date, end_date),
+        getattr(settings, 'ANALYTICS_DASHBOARD_CACHE_SECONDS', 300)
+    )
@@ -4,3 +4,8 @@ class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
     verbose_name = 'Website Analytics'
+    
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .routers import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='analytics_configure_sqlite')
@@ -0,0 +1,270 @@
+import atexit
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .counters import CounterBatch
+from .models import PageView, TrafficSource, SessionData
+from .routers import analytics_db
+
+# Compact record queued by AnalyticsMiddleware for every tracked page view
+TrackingRecord = namedtuple('TrackingRecord', [
+    'visitor_id', 'session_key', 'repeat_visit', 'timestamp',
+    'url', 'path', 'page_title', 'referrer', 'source', 'utm',
+])
+
+UTM_FIELDS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content')
+
+
+def buffered_writes_enabled():
+    """Check whether tracking writes should go through the buffer"""
+    return getattr(settings, 'ANALYTICS_BUFFERED_WRITES', False)
+
+
+class TrackingBuffer:
+    """Bounded in-process queue flushed to the database in batches.
+
+    Records are coalesced into bulk_create/bulk_update calls by a daemon
+    thread whenever ``batch_size`` records are waiting or ``flush_interval``
+    seconds have passed. When the queue is full new records are dropped and
+    counted instead of blocking the request.
+    """
+
+    def __init__(self, max_size=10000, batch_size=500, flush_interval=2.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_size)
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, record):
+        """Add a record without blocking; returns False if it was dropped"""
+        self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def start(self):
+        """Start the background flusher once per process"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='analytics-flusher', daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Stop the flusher and write out everything still queued"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Drain the queue synchronously"""
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stats(self):
+        """Return buffer counters"""
+        with self._lock:
+            return {
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'pending': self.queue.qsize(),
+            }
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    continue
+            if batch:
+                self._write(batch)
+
+    def _take(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._flush_lock:
+            close_old_connections()
+            try:
+                write_batch(batch)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                print(f"Error flushing analytics buffer: {e}")
+            else:
+                with self._lock:
+                    self.flushed += len(batch)
+            finally:
+                close_old_connections()
+
+
+def write_batch(records):
+    """Persist a batch of tracking records with bulk queries"""
+    counters = CounterBatch()
+    with transaction.atomic(using=analytics_db()):
+        _write_traffic_sources(records)
+        _write_sessions(records, counters)
+        _write_page_views(records)
+        _write_visitors(records, counters)
+        counters.apply()
+
+
+def _write_page_views(records):
+    PageView.objects.bulk_create([
+        PageView(
+            visitor_id=record.visitor_id,
+            url=record.url,
+            path=record.path,
+            page_title=record.page_title,
+            referrer=record.referrer or None,
+            timestamp=record.timestamp,
+        )
+        for record in records
+    ], batch_size=500)
+
+
+def _write_visitors(records, counters):
+    for record in records:
+        counters.add_visitor(
+            record.visitor_id,
+            last_visit=record.timestamp,
+            total_page_views=1,
+            total_visits=1 if record.repeat_visit else 0,
+        )
+
+
+def _write_sessions(records, counters):
+    counts = {}
+    first_record = {}
+    for record in records:
+        if not record.session_key:
+            continue
+        counts[record.session_key] = counts.get(record.session_key, 0) + 1
+        first_record.setdefault(record.session_key, record)
+    if not counts:
+        return
+
+    # Missing sessions are inserted empty and every session is then counted
+    # with F() increments, so no views are lost when another worker inserted
+    # the same session first
+    SessionData.objects.bulk_create([
+        SessionData(
+            visitor_id=first_record[session_key].visitor_id,
+            session_key=session_key,
+            start_time=first_record[session_key].timestamp,
+            **dict(zip(UTM_FIELDS, first_record[session_key].utm)),
+        )
+        for session_key in counts
+    ], batch_size=500, ignore_conflicts=True)
+    for session_key, count in counts.items():
+        counters.add_session(session_key, page_views_count=count)
+
+
+def _write_traffic_sources(records):
+    wanted = {}
+    for record in records:
+        wanted.setdefault((record.visitor_id, record.source['type']), record)
+
+    visitor_ids = {visitor_id for visitor_id, _ in wanted}
+    existing = set(TrafficSource.objects.filter(
+        visitor_id__in=visitor_ids
+    ).values_list('visitor_id', 'source_type'))
+
+    TrafficSource.objects.bulk_create([
+        TrafficSource(
+            visitor_id=visitor_id,
+            source_type=source_type,
+            source_name=record.source['name'],
+            source_url=record.source['url'],
+            campaign_name=record.source.get('campaign'),
+            medium=record.source.get('medium'),
+            first_visit=record.timestamp,
+        )
+        for (visitor_id, source_type), record in wanted.items()
+        if (visitor_id, source_type) not in existing
+    ], batch_size=500)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Return the process-wide tracking buffer"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = TrackingBuffer(
+                    max_size=getattr(settings, 'ANALYTICS_BUFFER_MAX_SIZE', 10000),
+                    batch_size=getattr(settings, 'ANALYTICS_BUFFER_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'ANALYTICS_BUFFER_FLUSH_INTERVAL', 2.0),
+                )
+    return _buffer
+
+
+def enqueue(record):
+    """Queue a tracking record on the process-wide buffer"""
+    return get_buffer().enqueue(record)
+
+
+def make_record(request, visitor, page_title, source):
+    """Build a tracking record from the current request"""
+    return TrackingRecord(
+        visitor_id=visitor.pk,
+        session_key=request.session.session_key,
+        repeat_visit=getattr(request, 'analytics_repeat_visit', False),
+        timestamp=timezone.now(),
+        url=request.build_absolute_uri(),
+        path=request.path,
+        page_title=page_title,
+        referrer=request.META.get('HTTP_REFERER', ''),
+        source=source,
+        utm=tuple(request.GET.get(field) for field in UTM_FIELDS),
+    )
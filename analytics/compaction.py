@@ -0,0 +1,205 @@
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+
+from . import eventlog, geolocation, user_agents
+from .counters import CounterBatch
+from .models import Visitor, PageView, Event, SessionData, PageTiming, EventLogSegment
+from .routers import analytics_db
+from .tracking_views import (
+    EVENT_BUILDERS, build_event, build_page_timing, build_page_view, clean_event
+)
+from .utils import explicit_timestamps, get_geolocation
+
+CompactionResult = namedtuple('CompactionResult', ['segment', 'records', 'seconds', 'skipped'])
+
+
+def record_time(record):
+    return datetime.fromtimestamp(record['t'], tz=dt_timezone.utc)
+
+
+def visitor_key(record):
+    """Records share a visitor by session, or by address and browser without one"""
+    return record.get('s') or f"{record.get('ip')}|{record.get('ua')}"
+
+
+def resolve_visitors(records):
+    """Map every record's visitor key to a Visitor pk, creating the missing ones in bulk"""
+    resolved = {}
+    session_keys = {record['s'] for record in records if record.get('s')}
+    for pk, session_key in Visitor.objects.filter(
+        session_key__in=session_keys
+    ).order_by('first_visit').values_list('pk', 'session_key'):
+        resolved.setdefault(session_key, pk)
+
+    missing = {}
+    for record in records:
+        key = visitor_key(record)
+        if key not in resolved:
+            missing.setdefault(key, record)
+
+    visitors = []
+    for record in missing.values():
+        user_agent = record.get('ua') or ''
+        info = user_agents.classify(user_agent)
+        geo_info = get_geolocation(record.get('ip'))
+        seen = record_time(record)
+        visitors.append(Visitor(
+            session_key=record.get('s'),
+            ip_address=record.get('ip') or '0.0.0.0',
+            user_agent=user_agent,
+            is_bot=info.is_bot,
+            country=geo_info.get('country'),
+            city=geo_info.get('city'),
+            device_type=info.device_type,
+            browser=info.browser,
+            operating_system=info.os,
+            first_visit=seen,
+            last_visit=seen,
+        ))
+    Visitor.objects.bulk_create(visitors, batch_size=500)
+    for key, visitor in zip(missing, visitors):
+        resolved[key] = visitor.pk
+        if visitor.country is None:
+            # The background lookup only sees the row once the segment has committed
+            transaction.on_commit(partial(geolocation.fill_in_later, visitor), using=analytics_db())
+    return resolved
+
+
+def latest_page_views(pairs, batch_size=500):
+    """Map (visitor pk, url) to the pk of that visitor's latest view of the url"""
+    latest = {}
+    visitor_ids = sorted({visitor_id for visitor_id, url in pairs})
+    urls = {url for visitor_id, url in pairs}
+    for start in range(0, len(visitor_ids), batch_size):
+        rows = PageView.objects.filter(
+            visitor_id__in=visitor_ids[start:start + batch_size], url__in=urls
+        ).order_by('timestamp', 'pk').values_list('pk', 'visitor_id', 'url')
+        for pk, visitor_id, url in rows:
+            if (visitor_id, url) in pairs:
+                latest[visitor_id, url] = pk
+    return latest
+
+
+def apply_time_spent(unloads, counters):
+    """Bulk version of record_time_spent for a chunk of unload records"""
+    if not unloads:
+        return
+    pairs = {(visitor.pk, data.get('url', '')) for visitor, data in unloads}
+    latest = latest_page_views(pairs)
+    spent = {}
+    for visitor, data in unloads:
+        pk = latest.get((visitor.pk, data.get('url', '')))
+        if pk is None:
+            continue
+        # Like record_time_spent: the view keeps the last unload, the visitor adds every one
+        spent[pk] = timedelta(milliseconds=data['time_spent'])
+        counters.add_visitor(visitor.pk, total_time_spent=spent[pk])
+    PageView.objects.bulk_update(
+        [PageView(pk=pk, time_spent=time_spent) for pk, time_spent in spent.items()],
+        ['time_spent'],
+        batch_size=500
+    )
+
+
+def load(records):
+    """Bulk-load one chunk of log records into the analytics tables"""
+    visitors = resolve_visitors(records)
+    counters = CounterBatch()
+    page_views = []
+    events = []
+    page_timings = []
+    unloads = []
+    session_views = {}
+    session_starts = {}
+
+    for record in records:
+        visitor = Visitor(pk=visitors[visitor_key(record)])
+        seen = record_time(record)
+        event_type = record['e']
+        data = record.get('d') or {}
+        counters.add_visitor(visitor.pk, last_visit=seen)
+        if record.get('s'):
+            session_starts.setdefault(record['s'], (visitor.pk, seen))
+            session_views.setdefault(record['s'], 0)
+
+        if event_type == 'page_view':
+            page_views.append(build_page_view(visitor, data, seen))
+            counters.add_visitor(visitor.pk, total_page_views=1)
+            if record.get('s'):
+                session_views[record['s']] += 1
+        elif event_type == 'page_timing':
+            page_timings.append(build_page_timing(visitor, data, seen))
+        elif event_type == 'page_unload':
+            # Segments written by older versions may still hold uncleaned values
+            data = clean_event(event_type, data)
+            if data is not None:
+                unloads.append((visitor, data))
+        elif event_type in EVENT_BUILDERS:
+            events.append(build_event(event_type, visitor, data, seen))
+
+    PageView.objects.bulk_create(page_views, batch_size=500)
+    Event.objects.bulk_create(events, batch_size=500)
+    PageTiming.objects.bulk_create(page_timings, batch_size=500)
+    apply_time_spent(unloads, counters)
+
+    # Counted with F() increments after the insert, like buffer._write_sessions
+    SessionData.objects.bulk_create([
+        SessionData(
+            visitor_id=session_starts[session_key][0],
+            session_key=session_key,
+            start_time=session_starts[session_key][1],
+        )
+        for session_key in session_views
+    ], batch_size=500, ignore_conflicts=True)
+    for session_key, count in session_views.items():
+        counters.add_session(session_key, page_views_count=count)
+
+    counters.apply()
+    return len(records)
+
+
+def compact_segment(path, replay=False, chunk_size=None):
+    """Load a sealed segment exactly once, in chunks inside one transaction"""
+    chunk_size = chunk_size or getattr(settings, 'ANALYTICS_EVENT_LOG_CHUNK_SIZE', 5000)
+    name = os.path.basename(path)
+    started = time.monotonic()
+    if not replay and EventLogSegment.objects.filter(name=name).exists():
+        # Loaded before a crash stopped it from being moved
+        eventlog.mark_done(path)
+        return CompactionResult(name, 0, time.monotonic() - started, True)
+
+    loaded = 0
+    records = eventlog.read_segment(path)
+    with explicit_timestamps(
+        Visitor._meta.get_field('first_visit'), Visitor._meta.get_field('last_visit'),
+        PageView._meta.get_field('timestamp'), Event._meta.get_field('timestamp'),
+        PageTiming._meta.get_field('timestamp'),
+        SessionData._meta.get_field('start_time'),
+    ), transaction.atomic(using=analytics_db()):
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            loaded += load(chunk)
+        EventLogSegment.objects.update_or_create(name=name, defaults={'records': loaded})
+
+    if not replay:
+        eventlog.mark_done(path)
+    return CompactionResult(name, loaded, time.monotonic() - started, False)
+
+
+def compact(replay=False, limit=None, directory=None):
+    """Compact every sealed segment (or re-load compacted ones when replaying)"""
+    if not replay:
+        eventlog.seal_orphans(directory)
+    segments = eventlog.sealed_segments(directory, replay=replay)
+    if limit:
+        segments = segments[:limit]
+    return [compact_segment(path, replay=replay) for path in segments]
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from .models import Visitor, SessionData
+
+
+def increments(deltas):
+    """Turn {field: delta} into F() expressions for QuerySet.update"""
+    return {field: F(field) + delta for field, delta in deltas.items() if delta}
+
+
+def increment_visitor(visitor_id, last_visit=None, **deltas):
+    """Atomically add deltas to a visitor's counters in a single UPDATE"""
+    values = increments(deltas)
+    if last_visit is not None:
+        values['last_visit'] = last_visit
+    if not values:
+        return 0
+    return Visitor.objects.filter(pk=visitor_id).update(**values)
+
+
+def increment_session(session_key, **deltas):
+    """Atomically add deltas to a session's counters; returns rows updated"""
+    return SessionData.objects.filter(session_key=session_key).update(
+        is_active=True, **increments(deltas)
+    )
+
+
+class CounterBatch:
+    """Per-row counter deltas collected over a flush window.
+
+    Deltas are summed in memory and applied as F() increments, so
+    concurrent workers never overwrite each other's counts. Rows that
+    share the same deltas are updated with one statement.
+    """
+
+    def __init__(self):
+        self.visitors = defaultdict(dict)
+        self.last_visits = {}
+        self.sessions = defaultdict(dict)
+
+    def add_visitor(self, visitor_id, last_visit=None, **deltas):
+        row = self.visitors[visitor_id]
+        add_deltas(row, deltas)
+        if last_visit is not None:
+            seen = self.last_visits.get(visitor_id)
+            self.last_visits[visitor_id] = last_visit if seen is None else max(seen, last_visit)
+
+    def add_session(self, session_key, **deltas):
+        row = self.sessions[session_key]
+        add_deltas(row, deltas)
+
+    def apply(self, batch_size=500):
+        apply_grouped(Visitor.objects.all(), 'pk', self.visitors, batch_size)
+        apply_grouped(SessionData.objects.all(), 'session_key', self.sessions, batch_size, is_active=True)
+        Visitor.objects.bulk_update(
+            [Visitor(pk=pk, last_visit=seen) for pk, seen in self.last_visits.items()],
+            ['last_visit'],
+            batch_size=batch_size
+        )
+
+
+def add_deltas(row, deltas):
+    # Deltas may be ints or timedeltas, so there is no common zero to start from
+    for field, delta in deltas.items():
+        row[field] = row[field] + delta if field in row else delta
+
+
+def apply_grouped(queryset, key_field, rows, batch_size, **extra):
+    """One UPDATE per distinct set of deltas (and per batch of keys)"""
+    groups = defaultdict(list)
+    for key, deltas in rows.items():
+        groups[tuple(sorted((field, delta) for field, delta in deltas.items() if delta))].append(key)
+    for deltas, keys in groups.items():
+        values = dict(extra, **increments(dict(deltas)))
+        if not values:
+            continue
+        for start in range(0, len(keys), batch_size):
+            queryset.filter(**{f'{key_field}__in': keys[start:start + batch_size]}).update(**values)
@@ -0,0 +1,52 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Visitor, PageView, TrafficSource, DailyDimension
+from .routers import analytics_db
+
+# dimension: (model, value field, label field, count per group)
+DIMENSIONS = {
+    'page': (PageView, 'path', 'page_title', Count('id')),
+    # One source row per visitor and source type, so daily counts add up
+    'source': (TrafficSource, 'source_type', 'source_name', Count('visitor', distinct=True)),
+    'device_type': (Visitor, 'device_type', None, Count('id')),
+    'browser': (Visitor, 'browser', None, Count('id')),
+    'country': (Visitor, 'country', None, Count('id')),
+}
+
+
+def collect(dimension, days, counts=None):
+    """Count raw rows on the given days into {(value, label): count}"""
+    counts = counts if counts is not None else Counter()
+    model, value_field, label_field, count = DIMENSIONS[dimension]
+    fields = [value_field, label_field] if label_field else [value_field]
+    rows = model.objects.on_dates(days).order_by().values(*fields).annotate(count=count)
+    for row in rows.values_list(*fields, 'count'):
+        counts[row[0], row[1] if label_field else None] += row[-1]
+    return counts
+
+
+def load_rollups(dimension, days, counts=None):
+    """Sum stored daily counts into {(value, label): count}"""
+    counts = counts if counts is not None else Counter()
+    rows = DailyDimension.objects.filter(date__in=days, dimension=dimension).order_by().values(
+        'value', 'label'
+    ).annotate(total=Sum('count')).values_list('value', 'label', 'total')
+    for value, label, total in rows:
+        counts[value, label] += total
+    return counts
+
+
+def rollup_dimensions_day(day):
+    """Replace a day's breakdown rows with counts of its raw rows"""
+    rows = [
+        DailyDimension(date=day, dimension=dimension, value=value, label=label, count=count)
+        for dimension in DIMENSIONS
+        for (value, label), count in collect(dimension, [day]).items()
+    ]
+    with transaction.atomic(using=analytics_db()):
+        DailyDimension.objects.filter(date=day).delete()
+        DailyDimension.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,217 @@
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+from django.conf import settings
+
+# Segment layout: MAGIC, then records of uint32 length + uint32 crc32 + payload
+MAGIC = b'MWLOG1\n'
+RECORD_HEADER = struct.Struct('>II')
+
+OPEN_DIR = 'open'
+SEALED_DIR = 'sealed'
+DONE_DIR = 'done'
+
+
+def event_log_enabled():
+    """Check whether the tracking endpoints append to the segment log"""
+    return getattr(settings, 'ANALYTICS_EVENT_LOG_ENABLED', False)
+
+
+def log_dir():
+    return getattr(settings, 'ANALYTICS_EVENT_LOG_DIR', None) or os.path.join(settings.BASE_DIR, 'eventlog')
+
+
+def encode(record):
+    """Compact JSON payload framed with its length and checksum"""
+    payload = json.dumps(record, separators=(',', ':'), default=str).encode()
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_segment(path):
+    """Yield the records of a segment, stopping at a torn or corrupt tail"""
+    with open(path, 'rb') as segment:
+        if segment.read(len(MAGIC)) != MAGIC:
+            return
+        while True:
+            header = segment.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, checksum = RECORD_HEADER.unpack(header)
+            payload = segment.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                print(f"Skipping corrupt tail of analytics segment {path}")
+                return
+            yield json.loads(payload)
+
+
+class SegmentLog:
+    """Append-only log of tracking records, one open segment per process.
+
+    Appends go to the OS on every call but are fsynced at most once per
+    fsync interval. Segments are sealed (moved from open/ to sealed/)
+    once they reach the size or age limit; the compactor only ever reads
+    sealed segments, so writers and the compactor never share a file.
+    """
+
+    def __init__(self, directory=None, max_bytes=None, max_age=None, fsync_interval=None):
+        self.directory = directory or log_dir()
+        self.max_bytes = max_bytes or getattr(settings, 'ANALYTICS_EVENT_LOG_SEGMENT_BYTES', 64 * 1024 * 1024)
+        self.max_age = max_age or getattr(settings, 'ANALYTICS_EVENT_LOG_SEGMENT_SECONDS', 60)
+        if fsync_interval is None:
+            fsync_interval = getattr(settings, 'ANALYTICS_EVENT_LOG_FSYNC_INTERVAL', 1.0)
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._opened_at = 0
+        self._synced_at = 0
+        self._size = 0
+        self._sequence = 0
+        for name in (OPEN_DIR, SEALED_DIR, DONE_DIR):
+            os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+
+    def append(self, records):
+        """Append records; returns once they have reached the OS"""
+        data = b''.join(encode(record) for record in records)
+        with self._lock:
+            now = time.monotonic()
+            if self._file is not None and (self._size >= self.max_bytes or now - self._opened_at >= self.max_age):
+                self._seal()
+            if self._file is None:
+                self._open(now)
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            if now - self._synced_at >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._synced_at = now
+
+    def rotate_idle(self):
+        """Seal the open segment once it is old enough, even without traffic"""
+        with self._lock:
+            if self._file is not None and time.monotonic() - self._opened_at >= self.max_age:
+                self._seal()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._seal()
+
+    def _open(self, now):
+        self._sequence += 1
+        name = f'{time.time_ns() // 1000000:015d}-{os.getpid()}-{self._sequence:06d}.log'
+        self._path = os.path.join(self.directory, OPEN_DIR, name)
+        self._file = open(self._path, 'ab')
+        self._file.write(MAGIC)
+        self._opened_at = self._synced_at = now
+        self._size = len(MAGIC)
+
+    def _seal(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        try:
+            os.replace(self._path, os.path.join(self.directory, SEALED_DIR, os.path.basename(self._path)))
+        except FileNotFoundError:
+            # Idle past max_age, so seal_orphans() already moved it
+            pass
+        self._file = None
+        self._path = None
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = SegmentLog()
+                atexit.register(_log.close)
+                # Segments left open by workers that died before sealing them
+                seal_orphans(_log.directory, _log.max_age)
+    return _log
+
+
+def append(records):
+    get_log().append(records)
+
+
+def rotate_idle():
+    """Scheduler hook: seal this worker's idle segment"""
+    if _log is not None:
+        _log.rotate_idle()
+
+
+def segment_pid(name):
+    """PID of the process that wrote a segment, from its name"""
+    try:
+        return int(name.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def seal_orphans(directory=None, max_age=None):
+    """Seal open segments whose writer is gone or that have been idle past max_age.
+
+    A live writer never appends to a segment older than max_age without
+    sealing it first, so moving an idle one cannot lose appends. PIDs are
+    only checked on this host; the age check covers the others.
+    """
+    directory = directory or log_dir()
+    max_age = max_age or getattr(settings, 'ANALYTICS_EVENT_LOG_SEGMENT_SECONDS', 60)
+    folder = os.path.join(directory, OPEN_DIR)
+    if not os.path.isdir(folder):
+        return []
+    own = _log._path if _log is not None else None
+    sealed = []
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not name.endswith('.log') or path == own:
+            continue
+        pid = segment_pid(name)
+        try:
+            idle = time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            continue
+        # This process only ever has one segment open, so older ones under its PID are a predecessor's
+        orphaned = pid is None or pid == os.getpid() or not pid_alive(pid)
+        if not orphaned and idle < max_age:
+            continue
+        try:
+            os.replace(path, os.path.join(directory, SEALED_DIR, name))
+        except FileNotFoundError:
+            continue
+        sealed.append(name)
+    return sealed
+
+
+def sealed_segments(directory=None, replay=False):
+    """Sealed segments in write order (or the compacted ones, for replay)"""
+    folder = os.path.join(directory or log_dir(), DONE_DIR if replay else SEALED_DIR)
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.log')]
+
+
+def mark_done(path):
+    """Move a compacted segment from sealed/ to done/ (kept for replays)"""
+    root = os.path.dirname(os.path.dirname(path))
+    os.replace(path, os.path.join(root, DONE_DIR, os.path.basename(path)))
@@ -0,0 +1,178 @@
+import csv
+import json
+import struct
+import zlib
+from datetime import date, datetime, timedelta
+from uuid import UUID
+
+from .models import Visitor, PageView, TrafficSource
+
+# data type -> (model, date field, exported columns)
+EXPORTS = {
+    'visitors': (Visitor, 'first_visit', [
+        'visitor_id', 'ip_address', 'first_visit', 'last_visit',
+        'total_visits', 'total_page_views', 'country', 'city',
+        'device_type', 'browser', 'operating_system',
+    ]),
+    'page_views': (PageView, 'timestamp', [
+        'visitor__visitor_id', 'url', 'path', 'page_title',
+        'timestamp', 'time_spent', 'referrer',
+    ]),
+    'traffic_sources': (TrafficSource, 'first_visit', [
+        'visitor__visitor_id', 'source_type', 'source_name',
+        'source_url', 'campaign_name', 'first_visit',
+    ]),
+}
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/octet-stream',
+}
+
+EXTENSIONS = {
+    'json': 'json',
+    'csv': 'csv',
+    'ndjson': 'ndjson',
+    'columnar': 'mwcol',
+}
+
+COLUMNAR_MAGIC = b'MWCOL1\n'
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def export_rows(data_type, start_date, end_date, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of exported rows, one keyset page at a time.
+
+    Pages are fetched with ``pk > last_pk`` instead of OFFSET, so every
+    query is an index range scan and at most one page is held in memory.
+    """
+    model, date_field, fields = EXPORTS[data_type]
+    queryset = model.objects.in_date_range(start_date, end_date, date_field).order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page.values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield [row[1:] for row in rows]
+        if len(rows) < chunk_size:
+            return
+
+
+def export_value(value):
+    """Convert a column value to something JSON and CSV can hold"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+class Echo:
+    """File-like object that hands back whatever csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(fields, pages):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for rows in pages:
+        yield ''.join(
+            writer.writerow([export_value(value) for value in row]) for row in rows
+        )
+
+
+def json_stream(fields, pages):
+    """A single JSON array, written element by element"""
+    opened = False
+    for rows in pages:
+        body = ','.join(json.dumps(dict(zip(fields, map(export_value, row)))) for row in rows)
+        yield (',' if opened else '[') + body
+        opened = True
+    yield ']' if opened else '[]'
+
+
+def ndjson_stream(fields, pages):
+    for rows in pages:
+        yield ''.join(
+            json.dumps(dict(zip(fields, map(export_value, row)))) + '\n' for row in rows
+        )
+
+
+def columnar_stream(fields, pages):
+    """Length-prefixed column blocks.
+
+    Layout: magic, uint32 header length, JSON header with the column
+    names, then one block per page: uint32 row count followed by each
+    column as uint32 length + JSON array. A zero row count ends the file.
+    Storing columns together keeps repeated values adjacent, which is
+    what makes the gzip variant small.
+    """
+    header = json.dumps({'columns': fields}).encode()
+    yield COLUMNAR_MAGIC + struct.pack('>I', len(header)) + header
+    for rows in pages:
+        block = [struct.pack('>I', len(rows))]
+        for column in zip(*rows):
+            payload = json.dumps([export_value(value) for value in column]).encode()
+            block.append(struct.pack('>I', len(payload)))
+            block.append(payload)
+        yield b''.join(block)
+    yield struct.pack('>I', 0)
+
+
+def read_columnar(stream):
+    """Decode a columnar export back into row dicts"""
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Not a columnar analytics export')
+    (header_length,) = struct.unpack('>I', stream.read(4))
+    fields = json.loads(stream.read(header_length))['columns']
+    while True:
+        (row_count,) = struct.unpack('>I', stream.read(4))
+        if not row_count:
+            return
+        columns = []
+        for _ in fields:
+            (length,) = struct.unpack('>I', stream.read(4))
+            columns.append(json.loads(stream.read(length)))
+        for row in zip(*columns):
+            yield dict(zip(fields, row))
+
+
+def gzip_stream(chunks):
+    """Compress a stream of chunks on the fly into a gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+STREAMS = {
+    'json': json_stream,
+    'csv': csv_stream,
+    'ndjson': ndjson_stream,
+    'columnar': columnar_stream,
+}
+
+
+def export_stream(data_type, format_type, start_date, end_date, compress=False,
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """Chunks of an export in the requested format, optionally gzipped"""
+    fields = EXPORTS[data_type][2]
+    chunks = STREAMS[format_type](fields, export_rows(data_type, start_date, end_date, chunk_size))
+    return gzip_stream(chunks) if compress else chunks
+
+
+def export_filename(data_type, format_type, start_date, end_date, compress=False):
+    name = f'{data_type}_{start_date}_{end_date}.{EXTENSIONS[format_type]}'
+    return f'{name}.gz' if compress else name
@@ -0,0 +1,290 @@
+import csv
+import ipaddress
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+LOCAL = {'country': 'Local', 'city': 'Local'}
+UNKNOWN = {'country': 'Unknown', 'city': 'Unknown'}
+
+
+class GeoCache:
+    """LRU cache with per-entry expiry, keyed by network prefix"""
+
+    def __init__(self, max_size=10000, ttl=86400):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(ip):
+        # Addresses in the same /24 (IPv4) or /48 (IPv6) share a location
+        prefix = 24 if ip.version == 4 else 48
+        return ipaddress.ip_network(f'{ip}/{prefix}', strict=False)
+
+    def get(self, ip):
+        key = self.key_for(ip)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, ip, value):
+        key = self.key_for(ip)
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+
+class LookupQueue:
+    """Background remote lookups with a bounded backlog.
+
+    At most max_pending addresses wait for a worker at once. A visitor
+    whose address is already waiting joins that lookup; when the backlog
+    is full the visitor is dropped (and counted) and keeps no location.
+    """
+
+    def __init__(self, max_pending=1000, workers=2):
+        self.max_pending = max_pending
+        self.workers = workers
+        self.dropped = 0
+        self._pending = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, visitor_pk, ip_address):
+        with self._lock:
+            waiting = self._pending.get(ip_address)
+            if waiting is not None:
+                waiting.add(visitor_pk)
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending[ip_address] = {visitor_pk}
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='analytics-geoip')
+        self._executor.submit(self.run, ip_address)
+        return True
+
+    def run(self, ip_address):
+        close_old_connections()
+        try:
+            location = resolve_remote(ip_address)
+        except Exception as e:
+            print(f"Error resolving visitor location: {e}")
+            location = None
+        # Visitors that joined while the lookup ran are updated with it
+        with self._lock:
+            visitor_pks = self._pending.pop(ip_address, set())
+        try:
+            if location is not None:
+                _update_visitor_locations(visitor_pks, location)
+        except Exception as e:
+            print(f"Error saving visitor location: {e}")
+        finally:
+            close_old_connections()
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class RangeTableBackend:
+    """Local IP range database loaded into sorted arrays.
+
+    Reads a CSV file with ``start_ip,end_ip,country,city`` rows (addresses
+    as dotted strings or integers) and answers lookups with a bisect search,
+    so it never touches the network.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'ANALYTICS_GEOIP_DATABASE', None)
+        self._tables = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        tables = {4: ([], [], []), 6: ([], [], [])}
+        rows = []
+        if self.path:
+            with open(self.path, newline='', encoding='utf-8') as f:
+                for row in csv.reader(f):
+                    if len(row) < 3 or row[0].startswith('#'):
+                        continue
+                    try:
+                        start = _parse_address(row[0])
+                        end = _parse_address(row[1])
+                    except ValueError:
+                        continue  # Header or malformed line
+                    city = row[3] if len(row) > 3 else ''
+                    rows.append((start.version, int(start), int(end), {
+                        'country': row[2] or 'Unknown',
+                        'city': city or 'Unknown',
+                    }))
+        rows.sort(key=lambda row: (row[0], row[1]))
+        for version, start, end, location in rows:
+            starts, ends, locations = tables[version]
+            starts.append(start)
+            ends.append(end)
+            locations.append(location)
+        return tables
+
+    def lookup(self, ip):
+        if self._tables is None:
+            with self._lock:
+                if self._tables is None:
+                    self._tables = self.load()
+        starts, ends, locations = self._tables[ip.version]
+        value = int(ip)
+        index = bisect_right(starts, value) - 1
+        if index >= 0 and value <= ends[index]:
+            return locations[index]
+        return None
+
+
+class RemoteBackend:
+    """HTTP geolocation service; only ever called off the request path"""
+
+    def __init__(self, url=None, timeout=5):
+        self.url = url or getattr(settings, 'ANALYTICS_GEOIP_REMOTE_URL', 'http://ip-api.com/json/{ip}')
+        self.timeout = timeout
+
+    def lookup(self, ip):
+        response = requests.get(self.url.format(ip=ip), timeout=self.timeout)
+        if response.status_code != 200:
+            return None
+        data = response.json()
+        return {
+            'country': data.get('country') or 'Unknown',
+            'city': data.get('city') or 'Unknown',
+        }
+
+
+def _parse_address(value):
+    value = value.strip()
+    if value.isdigit():
+        return ipaddress.ip_address(int(value))
+    return ipaddress.ip_address(value)
+
+
+_cache = None
+_backend = None
+_remote = None
+_lookup_queue = None
+_state_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _state_lock:
+            if _cache is None:
+                _cache = GeoCache(
+                    max_size=getattr(settings, 'ANALYTICS_GEOIP_CACHE_SIZE', 10000),
+                    ttl=getattr(settings, 'ANALYTICS_GEOIP_CACHE_TTL', 86400),
+                )
+    return _cache
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _state_lock:
+            if _backend is None:
+                backend_path = getattr(
+                    settings, 'ANALYTICS_GEOIP_BACKEND', 'analytics.geolocation.RangeTableBackend'
+                )
+                _backend = import_string(backend_path)()
+    return _backend
+
+
+def get_lookup_queue():
+    global _lookup_queue
+    if _lookup_queue is None:
+        with _state_lock:
+            if _lookup_queue is None:
+                _lookup_queue = LookupQueue(max_pending=getattr(settings, 'ANALYTICS_GEOIP_MAX_PENDING', 1000))
+    return _lookup_queue
+
+
+def deferred_lookups_enabled():
+    """Check whether unresolved visitors should be geolocated in the background"""
+    return getattr(settings, 'ANALYTICS_GEOIP_DEFERRED', True)
+
+
+def lookup(ip_address):
+    """Resolve an IP from the cache or local backend without network access.
+
+    Returns None when the location is not known locally.
+    """
+    try:
+        ip = ipaddress.ip_address(ip_address.strip())
+    except (AttributeError, ValueError):
+        return UNKNOWN
+    if ip.is_private or ip.is_loopback or ip.is_link_local:
+        return LOCAL
+
+    cache = get_cache()
+    location = cache.get(ip)
+    if location is not None:
+        return location
+    try:
+        location = get_backend().lookup(ip)
+    except Exception as e:
+        print(f"Error reading geolocation database: {e}")
+        location = None
+    if location is not None:
+        cache.set(ip, location)
+    return location
+
+
+def resolve_remote(ip_address):
+    """Resolve an IP through the remote service and cache the answer"""
+    global _remote
+    if _remote is None:
+        _remote = RemoteBackend()
+    location = lookup(ip_address)
+    if location is not None:
+        return location
+    ip = ipaddress.ip_address(ip_address.strip())
+    location = _remote.lookup(ip) or UNKNOWN
+    get_cache().set(ip, location)
+    return location
+
+
+def fill_in_later(visitor):
+    """Queue a background lookup for a visitor created without a location"""
+    if visitor.country is not None or not deferred_lookups_enabled():
+        return False
+    return get_lookup_queue().submit(visitor.pk, visitor.ip_address)
+
+
+def _update_visitor_locations(visitor_pks, location):
+    from .models import Visitor
+
+    Visitor.objects.filter(pk__in=visitor_pks, country__isnull=True).update(
+        country=location['country'],
+        city=location['city'],
+    )
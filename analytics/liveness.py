@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import counters
+from .models import Visitor
+from .realtime import shared_cache
+
+KEY_PREFIX = 'analytics:live'
+FLUSHED_KEY = f'{KEY_PREFIX}:flushed'
+# Closed intervals stay in the cache this long, so a flush missed while
+# every worker was down still happens after a restart
+KEEP_INTERVALS = 10
+# Ticks computed just before an interval ended may still be arriving
+GRACE_SECONDS = 5
+
+
+def flush_interval():
+    return getattr(settings, 'ANALYTICS_LIVENESS_FLUSH_INTERVAL', 60)
+
+
+def interval_for(now):
+    return int(now.timestamp()) // flush_interval()
+
+
+def seen_key(visitor_id):
+    return f'{KEY_PREFIX}:seen:{visitor_id}'
+
+
+def interval_key(interval, name):
+    return f'{KEY_PREFIX}:{interval}:{name}'
+
+
+def touch(visitor, now=None):
+    """Record that a visitor is still active.
+
+    Last-seen times live in the shared cache, so every worker coalesces
+    into the same entry: each tick overwrites the visitor's time, and
+    only its first tick in a flush interval lists the visitor in that
+    interval's numbered slots. Once an interval has closed, one worker
+    writes its visitors with a single bulk_update. Without a shared
+    cache every tick updates last_visit directly. Session end times and
+    durations belong to the sessionizer.
+    """
+    now = now or timezone.now()
+    cache = shared_cache()
+    if cache is None:
+        counters.increment_visitor(visitor.pk, last_visit=now)
+        return
+    timeout = flush_interval() * (KEEP_INTERVALS + 1)
+    interval = interval_for(now)
+    cache.set(seen_key(visitor.pk), now, timeout)
+    if cache.add(interval_key(interval, f'visitor:{visitor.pk}'), True, timeout):
+        cache.add(interval_key(interval, 'slots'), 0, timeout)
+        slot = cache.incr(interval_key(interval, 'slots'))
+        cache.set(interval_key(interval, slot), visitor.pk, timeout)
+    flush_due(now)
+
+
+_checked_interval = None
+
+
+def flush_due(now=None):
+    """Flush from the request path, trying once per closed interval per process"""
+    global _checked_interval
+    closed = interval_for((now or timezone.now()) - timedelta(seconds=GRACE_SECONDS)) - 1
+    if closed == _checked_interval:
+        return 0
+    _checked_interval = closed
+    return flush(now)
+
+
+def flush(now=None):
+    """Write last-seen times for every closed interval not written yet"""
+    cache = shared_cache()
+    if cache is None:
+        return 0
+    now = now or timezone.now()
+    timeout = flush_interval() * (KEEP_INTERVALS + 1)
+    closed = interval_for(now - timedelta(seconds=GRACE_SECONDS)) - 1
+    flushed = cache.get(FLUSHED_KEY)
+    first = closed - KEEP_INTERVALS + 1 if flushed is None else max(flushed + 1, closed - KEEP_INTERVALS + 1)
+    written = 0
+    for interval in range(first, closed + 1):
+        # Whichever worker claims an interval writes it
+        if cache.add(interval_key(interval, 'claimed'), True, timeout):
+            written += flush_interval_visitors(cache, interval)
+    if flushed is None or closed > flushed:
+        cache.set(FLUSHED_KEY, closed, timeout)
+    return written
+
+
+def flush_interval_visitors(cache, interval):
+    """Write the visitors listed in one closed interval"""
+    batch_size = getattr(settings, 'ANALYTICS_BUFFER_BATCH_SIZE', 500)
+    slots = cache.get(interval_key(interval, 'slots')) or 0
+    written = 0
+    for start in range(1, slots + 1, batch_size):
+        keys = [interval_key(interval, slot) for slot in range(start, min(start + batch_size, slots + 1))]
+        visitor_ids = set(cache.get_many(keys).values())
+        seen = cache.get_many([seen_key(visitor_id) for visitor_id in visitor_ids])
+        last_visits = {
+            visitor_id: seen[seen_key(visitor_id)] for visitor_id in visitor_ids if seen_key(visitor_id) in seen
+        }
+        write_last_seen(last_visits, batch_size)
+        written += len(last_visits)
+    return written
+
+
+def write_last_seen(last_visits, batch_size=500):
+    """Persist last-seen times with one bulk UPDATE per batch"""
+    Visitor.objects.bulk_update(
+        [Visitor(pk=pk, last_visit=seen) for pk, seen in last_visits.items()],
+        ['last_visit'],
+        batch_size=batch_size
+    )
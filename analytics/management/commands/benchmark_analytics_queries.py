@@ -0,0 +1,154 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from analytics.models import Visitor, PageView, TrafficSource, Event
+from analytics.routers import analytics_db
+from analytics.utils import explicit_timestamps
+
+PATHS = ['/', '/services/', '/doctors/', '/contact/', '/about/', '/blog/', '/appointments/', '/faq/']
+SOURCES = ['direct', 'google', 'facebook', 'whatsapp', 'referral']
+
+
+def uses_index(plan):
+    """True unless the plan contains a full table scan"""
+    for line in plan.splitlines():
+        if 'Seq Scan' in line:
+            return False
+        words = line.replace('--', ' ').split()
+        if 'SCAN' in words and 'USING' not in words and 'CONSTANT' not in words:
+            return False
+    return True
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic analytics rows in a rolled-back transaction and time the hot queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of PageView rows to seed')
+        parser.add_argument('--days', type=int, default=365, help='Spread rows over this many days')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--assert-plans', action='store_true', help='Fail if any query does a full table scan')
+
+    def handle(self, *args, **options):
+        alias = analytics_db()
+        with transaction.atomic(using=alias):
+            self.seed(options['rows'], options['days'])
+            results = self.run_queries(options['repeat'])
+            transaction.set_rollback(True, using=alias)
+
+        scans = []
+        for label, elapsed, plan in results:
+            indexed = uses_index(plan)
+            if not indexed:
+                scans.append(label)
+            self.stdout.write(f'{label:<40} {elapsed * 1000:9.2f} ms  {"index" if indexed else "FULL SCAN"}')
+            if options['verbosity'] > 1:
+                self.stdout.write(f'    {plan}')
+
+        if scans and options['assert_plans']:
+            raise CommandError(f'Full table scans in: {", ".join(scans)}')
+
+    def seed(self, rows, days):
+        now = timezone.now()
+        visitor_count = max(rows // 10, 1)
+        started = time.perf_counter()
+
+        with explicit_timestamps(
+            Visitor._meta.get_field('first_visit'), Visitor._meta.get_field('last_visit'),
+            PageView._meta.get_field('timestamp'), TrafficSource._meta.get_field('first_visit'),
+            Event._meta.get_field('timestamp'),
+        ):
+            visitors = []
+            for _ in range(visitor_count):
+                first_visit = now - timedelta(seconds=random.randint(0, days * 86400))
+                visitors.append(Visitor(
+                    visitor_id=uuid.uuid4(),
+                    session_key=uuid.uuid4().hex if random.random() < 0.9 else None,
+                    ip_address='10.0.0.1',
+                    user_agent='benchmark',
+                    first_visit=first_visit,
+                    last_visit=first_visit,
+                    device_type=random.choice(['desktop', 'mobile', 'tablet']),
+                ))
+            Visitor.objects.bulk_create(visitors, batch_size=5000)
+            visitors = list(Visitor.objects.values_list('pk', 'first_visit'))
+
+            TrafficSource.objects.bulk_create([
+                TrafficSource(
+                    visitor_id=pk, source_type=random.choice(SOURCES),
+                    source_name='benchmark', first_visit=first_visit
+                )
+                for pk, first_visit in visitors
+            ], batch_size=5000)
+
+            for start in range(0, rows, 5000):
+                page_views = []
+                events = []
+                for _ in range(min(5000, rows - start)):
+                    pk, first_visit = random.choice(visitors)
+                    timestamp = first_visit + timedelta(seconds=random.randint(0, 3600))
+                    path = random.choice(PATHS)
+                    page_views.append(PageView(
+                        visitor_id=pk, url=f'https://example.com{path}', path=path,
+                        timestamp=timestamp
+                    ))
+                    if random.random() < 0.2:
+                        events.append(Event(
+                            visitor_id=pk, event_type='click', event_name='Click: a',
+                            page_url=f'https://example.com{path}', timestamp=timestamp
+                        ))
+                PageView.objects.bulk_create(page_views)
+                Event.objects.bulk_create(events)
+
+        self.stdout.write(
+            f'Seeded {visitor_count} visitors and {rows} page views '
+            f'in {time.perf_counter() - started:.1f}s ({connections[analytics_db()].vendor})'
+        )
+
+    def run_queries(self, repeat):
+        now = timezone.now()
+        start, end = now - timedelta(days=30), now
+        visitor = Visitor.objects.filter(session_key__isnull=False).order_by('?').values('pk', 'session_key').first()
+        url = PageView.objects.filter(visitor_id=visitor['pk']).values_list('url', flat=True).first() or ''
+
+        page_views_in_range = PageView.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        queries = [
+            ('middleware: visitor by session',
+             Visitor.objects.filter(session_key=visitor['session_key'])[:1], None),
+            ('middleware: existing traffic source',
+             TrafficSource.objects.filter(visitor_id=visitor['pk'], source_type='direct')[:1], None),
+            ('tracking: latest view of a url',
+             PageView.objects.filter(visitor_id=visitor['pk'], url=url).order_by('-timestamp')[:1], None),
+            ('tracking: visitor events',
+             Event.objects.filter(visitor_id=visitor['pk']).order_by('-timestamp')[:50], None),
+            ('dashboard: page views in range',
+             page_views_in_range.values('pk'), page_views_in_range.count),
+            ('dashboard: new visitors in range',
+             Visitor.objects.filter(first_visit__gte=start, first_visit__lt=end).values('pk'),
+             Visitor.objects.filter(first_visit__gte=start, first_visit__lt=end).count),
+            ('dashboard: top pages',
+             page_views_in_range.order_by().values('path').annotate(views=Count('id')).order_by('-views')[:10],
+             None),
+            ('dashboard: path history',
+             PageView.objects.filter(path='/contact/', timestamp__gte=start).values('pk'),
+             PageView.objects.filter(path='/contact/', timestamp__gte=start).count),
+        ]
+
+        results = []
+        for label, queryset, run in queries:
+            run = run or (lambda queryset=queryset: list(queryset.all()))
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            results.append((label, statistics.median(timings), queryset.explain()))
+        return results
@@ -0,0 +1,71 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest, HttpResponse
+from django.test import Client, override_settings
+
+from analytics.middleware import AnalyticsMiddleware
+
+# Filler shaped like a long blog article body
+PARAGRAPH = (
+    '<p>Patients increasingly find their doctor online: a fast clinic website, '
+    'accurate Google Business listings and timely follow-ups all shape the first '
+    'appointment. <a href="/services/">Read more</a> &amp; book a consultation.</p>\n'
+)
+
+
+def legacy_extract_page_title(content):
+    """The whole-body decode this extraction replaced"""
+    try:
+        content_str = content.decode('utf-8')
+        title_match = re.search(r'<title>(.*?)</title>', content_str, re.IGNORECASE | re.DOTALL)
+        if title_match:
+            return title_match.group(1).strip()
+    except:
+        pass
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark page title extraction on a large rendered page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/blog/', help='Page to render')
+        parser.add_argument('--pad-kb', type=int, default=512, help='Article-like HTML added to the body, in KB')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            rendered = Client().get(options['path'])
+        if rendered.status_code >= 400:
+            raise CommandError(f'{options["path"]} answered {rendered.status_code}')
+        padding = PARAGRAPH * (options['pad_kb'] * 1024 // len(PARAGRAPH))
+        content = rendered.content.replace(b'</body>', padding.encode() + b'</body>', 1)
+        captured = getattr(rendered.wsgi_request, 'page_title', None)
+
+        response = HttpResponse(content)
+        middleware = AnalyticsMiddleware(lambda request: response)
+        scan_request = HttpRequest()
+        captured_request = HttpRequest()
+        captured_request.page_title = captured
+        iterations = options['iterations']
+
+        results = []
+        for label, extract in [
+            ('legacy full decode', lambda: legacy_extract_page_title(response.content)),
+            ('bounded byte scan', lambda: middleware.extract_page_title(scan_request, response)),
+            ('captured at render', lambda: middleware.extract_page_title(captured_request, response)),
+        ]:
+            title = extract()
+            start = time.perf_counter()
+            for _ in range(iterations):
+                extract()
+            elapsed = time.perf_counter() - start
+            results.append((label, title, elapsed))
+
+        self.stdout.write(f'{options["path"]}: {len(content) / 1024:.0f} KB, {iterations} extractions')
+        for label, title, elapsed in results:
+            self.stdout.write(f'  {label:<20} {elapsed / iterations * 1e6:9.2f} us/page  {title!r}')
+        if captured is None:
+            self.stdout.write(self.style.WARNING('The page did not record its title while rendering'))
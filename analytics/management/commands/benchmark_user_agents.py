@@ -0,0 +1,134 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics import user_agents
+
+# Sample of real-world user agents seen on the public site
+CORPUS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 Edg/120.0.0.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0',
+    'Mozilla/5.0 (Linux; Android 13; SM-A536E) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.6099.144 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 12; Redmi Note 11) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (Linux; Android 14; Pixel 7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/120.0.6099.119 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (iPad; CPU OS 17_1 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 13; SM-X200) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36 OPR/105.0.0.0',
+    'Opera/9.80 (J2ME/MIDP; Opera Mini/9.80 (S60; SymbOS; Opera Mobi/23.348; U; en) Presto/2.5.25 Version/10.54',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+    'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+    'Mozilla/5.0 (compatible; YandexBot/3.0; +http://yandex.com/bots)',
+    'Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)',
+    'Mozilla/5.0 (compatible; Yahoo! Slurp; http://help.yahoo.com/help/us/ysearch/slurp)',
+    'facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)',
+    'WhatsApp/2.23.24.76 A',
+    'Mozilla/5.0 (Windows Phone 10.0; Android 6.0.1; Microsoft; Lumia 950) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/52.0.2743.116 Mobile Safari/537.36 Edge/15.15063',
+    'curl/8.4.0',
+]
+
+LEGACY_BOT_PATTERNS = [
+    'bot', 'crawler', 'spider', 'scraper', 'crawler',
+    'googlebot', 'bingbot', 'slurp', 'duckduckbot',
+    'baiduspider', 'yandexbot', 'facebookexternalhit'
+]
+
+
+def legacy_parse_user_agent(user_agent):
+    """The substring-scanning parser this engine replaced"""
+    device_type = 'desktop'
+    browser = 'Unknown'
+    os = 'Unknown'
+    user_agent_lower = user_agent.lower()
+    if any(mobile in user_agent_lower for mobile in ['mobile', 'android', 'iphone']):
+        device_type = 'mobile'
+    elif any(tablet in user_agent_lower for tablet in ['tablet', 'ipad']):
+        device_type = 'tablet'
+    if 'chrome' in user_agent_lower and 'edg' not in user_agent_lower:
+        browser = 'Chrome'
+    elif 'firefox' in user_agent_lower:
+        browser = 'Firefox'
+    elif 'safari' in user_agent_lower and 'chrome' not in user_agent_lower:
+        browser = 'Safari'
+    elif 'edg' in user_agent_lower:
+        browser = 'Edge'
+    elif 'opera' in user_agent_lower:
+        browser = 'Opera'
+    if 'windows' in user_agent_lower:
+        os = 'Windows'
+    elif 'mac' in user_agent_lower:
+        os = 'macOS'
+    elif 'linux' in user_agent_lower:
+        os = 'Linux'
+    elif 'android' in user_agent_lower:
+        os = 'Android'
+    elif 'ios' in user_agent_lower or 'iphone' in user_agent_lower or 'ipad' in user_agent_lower:
+        os = 'iOS'
+    is_bot = any(pattern in user_agent_lower for pattern in LEGACY_BOT_PATTERNS)
+    return device_type, browser, os, is_bot
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the user agent classifier against the legacy substring parser'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='File with one user agent per line (defaults to the built-in corpus)')
+        parser.add_argument('--requests', type=int, default=100000, help='Number of simulated lookups')
+
+    def handle(self, *args, **options):
+        corpus = CORPUS
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                corpus = [line.strip() for line in f if line.strip()]
+
+        # Traffic is heavily skewed towards a few browsers, like real logs
+        rng = random.Random(42)
+        weights = [1.0 / (rank + 1) for rank in range(len(corpus))]
+        stream = rng.choices(corpus, weights=weights, k=options['requests'])
+
+        mismatches = []
+        for user_agent in corpus:
+            info = user_agents.classify.__wrapped__(user_agent)
+            if (info.device_type, info.browser, info.os, info.is_bot) != legacy_parse_user_agent(user_agent):
+                mismatches.append(user_agent)
+
+        start = time.perf_counter()
+        for user_agent in stream:
+            legacy_parse_user_agent(user_agent)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for user_agent in stream:
+            user_agents.classify.__wrapped__(user_agent)
+        uncached_time = time.perf_counter() - start
+
+        user_agents.clear_cache()
+        start = time.perf_counter()
+        for user_agent in stream:
+            user_agents.classify(user_agent)
+        cached_time = time.perf_counter() - start
+        stats = user_agents.cache_stats()
+
+        self.stdout.write(f'{len(stream)} lookups over {len(corpus)} distinct user agents')
+        for label, elapsed in [
+            ('legacy substring scan', legacy_time),
+            ('compiled classifier', uncached_time),
+            ('compiled classifier + LRU', cached_time),
+        ]:
+            per_call = elapsed / len(stream) * 1e6
+            self.stdout.write(f'  {label:<28} {elapsed * 1000:9.1f} ms  {per_call:6.2f} us/lookup')
+        self.stdout.write(f"  cache hit rate: {stats['hit_rate']}%")
+
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} user agents classified differently:'))
+            for user_agent in mismatches:
+                self.stdout.write(f'  {user_agent}')
+        else:
+            self.stdout.write(self.style.SUCCESS('Classifier agrees with the legacy parser on the whole corpus'))
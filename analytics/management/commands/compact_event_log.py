@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics import eventlog
+from analytics.compaction import compact
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load sealed tracking event log segments into the analytics tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Event log directory (defaults to ANALYTICS_EVENT_LOG_DIR)')
+        parser.add_argument('--follow', action='store_true', help='Keep tailing for new sealed segments')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --follow')
+        parser.add_argument('--limit', type=int, help='Compact at most this many segments per pass')
+        parser.add_argument(
+            '--replay', action='store_true',
+            help='Load the already compacted segments again (e.g. into rebuilt tables after a schema change)'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or eventlog.log_dir()
+        self.stdout.write(f'Compacting segments from {directory}')
+        while True:
+            results = compact(replay=options['replay'], limit=options['limit'], directory=directory)
+            for result in results:
+                if result.skipped:
+                    self.stdout.write(self.style.WARNING(f'{result.segment}: already loaded, moved to done/'))
+                    continue
+                rate = result.records / result.seconds if result.seconds else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f'{result.segment}: {result.records} records in {result.seconds:.2f}s ({rate:.0f} records/s)'
+                ))
+            if not options['follow'] or options['replay']:
+                if not results:
+                    self.stdout.write('No sealed segments.')
+                return
+            time.sleep(options['interval'])
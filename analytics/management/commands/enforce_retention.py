@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete or archive page views and events older than the retention period, in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Override AnalyticsSettings.data_retention_days')
+        parser.add_argument('--archive-dir', help='Append expired rows to gzipped NDJSON files here first')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+        parser.add_argument('--time-budget', type=float, help='Stop after this many seconds; rerun to resume')
+        parser.add_argument('--dry-run', action='store_true', help='Only count expired rows')
+        parser.add_argument(
+            '--partition', action='store_true',
+            help='Convert the tables to monthly partitions first (PostgreSQL only, rewrites the tables)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = retention.retention_cutoff(options['days'])
+        self.stdout.write(f'Retention cutoff: {cutoff:%Y-%m-%d %H:%M %Z}')
+
+        if options['dry_run']:
+            for model in retention.EXPIRING_MODELS:
+                expired = model.objects.filter(**{f'{model.DATE_FIELD}__lt': cutoff}).count()
+                self.stdout.write(f'{model._meta.label}: {expired} expired rows')
+            return
+
+        if options['partition']:
+            if not retention.partitioning_supported():
+                raise CommandError('Monthly partitioning needs PostgreSQL')
+            for model in retention.EXPIRING_MODELS:
+                if retention.convert_to_partitioned(model):
+                    self.stdout.write(self.style.SUCCESS(f'Partitioned {model._meta.db_table} by month'))
+
+        results = retention.enforce(
+            days=options['days'],
+            archive_dir=options['archive_dir'],
+            time_budget=options['time_budget'],
+            batch_size=options['batch_size'],
+        )
+        for result in results:
+            line = (
+                f'{result.model}: deleted {result.deleted} rows in {result.seconds:.1f}s '
+                f'({retention.rows_per_second(result):.0f} rows/s)'
+            )
+            if result.archived:
+                line += f', archived {result.archived}'
+            if result.partitions_dropped:
+                line += f', dropped partitions {", ".join(result.partitions_dropped)}'
+            if result.complete:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(self.style.WARNING(f'{line}; stopped early, run again to resume'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import rollup
+
+
+class Command(BaseCommand):
+    help = 'Roll up raw analytics rows into DailyStats (closed days once, the current day every run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Only look this many days back')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute final days as well')
+
+    def handle(self, *args, **options):
+        days = rollup(days=options['days'], rebuild=options['rebuild'])
+        if days:
+            self.stdout.write(
+                self.style.SUCCESS(f'Rolled up {len(days)} day(s): {days[0]} to {days[-1]}')
+            )
+        else:
+            self.stdout.write(self.style.WARNING('Nothing to roll up.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from analytics.sessionization import sessionize
+
+
+class Command(BaseCommand):
+    help = 'Flag exit and bounce page views and close sessions up to the sessionization watermark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Visitors per batch (defaults to ANALYTICS_SESSIONIZE_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        result = sessionize(chunk_size=options['chunk_size'])
+        rate = result.page_views / result.seconds if result.seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Sessionized {result.page_views} page views ({result.updated} changed, '
+            f'{result.sessions} sessions closed) in {result.seconds:.2f}s ({rate:.0f} views/s); '
+            f'watermark now {result.watermark}'
+        ))
@@ -4,15 +4,23 @@ from django.contrib.sessions.models import Session
 from django.db import transaction
 from django.conf import settings
 import uuid
+import html
 import json
 import re
 from urllib.parse import urlparse, parse_qs
 from .models import Visitor, PageView, TrafficSource, SessionData, Event
 from .utils import get_visitor_info, parse_user_agent, get_geolocation
+from . import buffer, counters, geolocation, realtime, scheduler, user_agents
+
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
 
 class AnalyticsMiddleware(MiddlewareMixin):
     """Middleware to automatically track page views and visitor behavior"""
     
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        scheduler.start()
+    
     def process_request(self, request):
         # Skip tracking for certain paths
         skip_paths = ['/admin/', '/static/', '/media/', '/favicon.ico', '/robots.txt']
@@ -24,6 +32,18 @@ class AnalyticsMiddleware(MiddlewareMixin):
         if not visitor:
             return None
         
+        # Determine traffic source once for every consumer below
+        request.analytics_source = self.determine_traffic_source(
+            request.META.get('HTTP_REFERER', ''),
+            request.GET.get('utm_source'),
+            request
+        )
+        
+        # Buffered mode defers every write to the background flusher
+        if buffer.buffered_writes_enabled():
+            request.analytics_visitor = visitor
+            return None
+        
         # Track session
         self.track_session(request, visitor)
         
@@ -38,7 +58,17 @@ class AnalyticsMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         # Track page view
         if hasattr(request, 'analytics_visitor'):
-            self.track_page_view(request, response)
+            if buffer.buffered_writes_enabled():
+                self.enqueue_page_view(request, response)
+            else:
+                self.track_page_view(request, response)
+            
+            source = request.analytics_source
+            realtime.record(
+                request.analytics_visitor.pk,
+                request.path,
+                (source['type'], source['name'])
+            )
         
         return response
     
@@ -49,9 +79,10 @@ class AnalyticsMiddleware(MiddlewareMixin):
             if request.session.session_key:
                 visitor = Visitor.objects.filter(session_key=request.session.session_key).first()
                 if visitor:
-                    visitor.last_visit = timezone.now()
-                    visitor.total_visits += 1
-                    visitor.save()
+                    if buffer.buffered_writes_enabled():
+                        request.analytics_repeat_visit = True
+                    else:
+                        counters.increment_visitor(visitor.pk, last_visit=timezone.now(), total_visits=1)
                     return visitor
             
             # Get visitor info
@@ -79,6 +110,7 @@ class AnalyticsMiddleware(MiddlewareMixin):
                 browser=device_info.get('browser'),
                 operating_system=device_info.get('os')
             )
+            geolocation.fill_in_later(visitor)
             
             return visitor
             
@@ -104,17 +136,13 @@ class AnalyticsMiddleware(MiddlewareMixin):
             }
         )
         
-        if not created:
+        if not created and not session_data.is_active:
             session_data.is_active = True
-            session_data.save()
+            session_data.save(update_fields=['is_active'])
     
     def track_traffic_source(self, request, visitor):
         """Track where the visitor came from"""
-        referrer = request.META.get('HTTP_REFERER', '')
-        utm_source = request.GET.get('utm_source')
-        
-        # Determine traffic source
-        source_info = self.determine_traffic_source(referrer, utm_source, request)
+        source_info = request.analytics_source
         
         # Check if we already have this traffic source for this visitor
         existing_source = TrafficSource.objects.filter(
@@ -138,8 +166,7 @@ class AnalyticsMiddleware(MiddlewareMixin):
             visitor = request.analytics_visitor
             referrer = request.META.get('HTTP_REFERER', '')
             
-            # Get page title from response content
-            page_title = self.extract_page_title(response.content)
+            page_title = self.extract_page_title(request, response)
             
             # Create page view
             page_view = PageView.objects.create(
@@ -150,22 +177,24 @@ class AnalyticsMiddleware(MiddlewareMixin):
                 referrer=referrer if referrer else None
             )
             
-            # Update visitor stats
-            visitor.total_page_views += 1
-            visitor.save()
-            
-            # Update session stats
+            # Update visitor and session stats atomically
+            counters.increment_visitor(visitor.pk, total_page_views=1)
             if request.session.session_key:
-                session_data = SessionData.objects.filter(
-                    session_key=request.session.session_key
-                ).first()
-                if session_data:
-                    session_data.page_views_count += 1
-                    session_data.save()
+                counters.increment_session(request.session.session_key, page_views_count=1)
             
         except Exception as e:
             print(f"Error tracking page view: {e}")
     
+    def enqueue_page_view(self, request, response):
+        """Queue page view, session and traffic source writes for the flusher"""
+        try:
+            page_title = self.extract_page_title(request, response)
+            buffer.enqueue(buffer.make_record(
+                request, request.analytics_visitor, page_title, request.analytics_source
+            ))
+        except Exception as e:
+            print(f"Error queueing page view: {e}")
+    
     def determine_traffic_source(self, referrer, utm_source, request):
         """Determine traffic source based on referrer and UTM parameters"""
         if utm_source:
@@ -256,21 +285,18 @@ class AnalyticsMiddleware(MiddlewareMixin):
     
     def is_bot(self, user_agent):
         """Check if user agent is a bot"""
-        bot_patterns = [
-            'bot', 'crawler', 'spider', 'scraper', 'crawler',
-            'googlebot', 'bingbot', 'slurp', 'duckduckbot',
-            'baiduspider', 'yandexbot', 'facebookexternalhit'
-        ]
-        user_agent_lower = user_agent.lower()
-        return any(pattern in user_agent_lower for pattern in bot_patterns)
+        return user_agents.classify(user_agent).is_bot
     
-    def extract_page_title(self, content):
-        """Extract page title from HTML content"""
-        try:
-            content_str = content.decode('utf-8')
-            title_match = re.search(r'<title>(.*?)</title>', content_str, re.IGNORECASE | re.DOTALL)
-            if title_match:
-                return title_match.group(1).strip()
-        except:
-            pass
-        return None
+    def extract_page_title(self, request, response):
+        """Page title recorded while rendering, else read from the start of the HTML"""
+        title = getattr(response, 'page_title', None) or getattr(request, 'page_title', None)
+        if title is None:
+            if response.streaming or 'html' not in response.get('Content-Type', ''):
+                return None
+            limit = getattr(settings, 'ANALYTICS_TITLE_SCAN_BYTES', 8192)
+            title_match = TITLE_PATTERN.search(response.content[:limit])
+            if not title_match:
+                return None
+            title = title_match.group(1).decode(response.charset or 'utf-8', errors='replace')
+        title = ' '.join(html.unescape(title).split())
+        return title[:200] or None
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystats',
+            name='computed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='hourly_page_views',
+            field=models.JSONField(blank=True, default=list, help_text='Page views per hour of day'),
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='is_final',
+            field=models.BooleanField(default=False, help_text='Computed after the day closed'),
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='timed_page_views',
+            field=models.PositiveIntegerField(default=0, help_text='Page views with a recorded time spent'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_dailystats_rollup_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['visitor', 'timestamp'], name='analytics_event_visitor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'timestamp'], name='analytics_event_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['timestamp', 'path'], name='analytics_pageview_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['path', 'timestamp'], name='analytics_pageview_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['visitor', 'timestamp'], name='analytics_pageview_visitor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessiondata',
+            index=models.Index(fields=['start_time'], name='analytics_session_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficsource',
+            index=models.Index(fields=['visitor', 'source_type'], name='analytics_source_visitor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trafficsource',
+            index=models.Index(fields=['first_visit'], name='analytics_source_first_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(condition=models.Q(('session_key__isnull', False)), fields=['session_key'], name='analytics_visitor_session_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['first_visit'], name='analytics_visitor_first_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['last_visit'], name='analytics_visitor_last_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventLogSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('records', models.PositiveIntegerField(default=0)),
+                ('compacted_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-compacted_at'],
+            },
+        ),
+    ]
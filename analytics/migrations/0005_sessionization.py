@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_eventlogsegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dailystats',
+            name='visits',
+            field=models.PositiveIntegerField(default=0, help_text='Sessions that ended on this day'),
+        ),
+    ]
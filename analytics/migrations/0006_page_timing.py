@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_sessionization'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500)),
+                ('ttfb', models.FloatField(blank=True, help_text='Time to first byte', null=True)),
+                ('fcp', models.FloatField(blank=True, help_text='First contentful paint', null=True)),
+                ('dom_content_loaded', models.FloatField(blank=True, null=True)),
+                ('load', models.FloatField(blank=True, null=True)),
+                ('lcp', models.FloatField(blank=True, help_text='Largest contentful paint', null=True)),
+                ('cls', models.FloatField(blank=True, help_text='Cumulative layout shift', null=True)),
+                ('inp', models.FloatField(blank=True, help_text='Slowest interaction to next paint', null=True)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['timestamp', 'path'], name='analytics_timing_ts_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TimingDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('path', models.CharField(max_length=500)),
+                ('metric', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('buckets', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-date', 'path', 'metric'],
+                'unique_together': {('date', 'path', 'metric')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_page_timing'),
+    ]
+
+    # Only the Python-side default changes; the columns stay as they are, so
+    # SQLite does not have to rebuild the (large) tables
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='pageview',
+                name='timestamp',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+            migrations.AlterField(
+                model_name='sessiondata',
+                name='start_time',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+            migrations.AlterField(
+                model_name='trafficsource',
+                name='first_visit',
+                field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+            ),
+        ]),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:46
+
+from django.db import migrations, models
+
+
+def reopen_rollups(apps, schema_editor):
+    # Days rolled up before dimensions existed have none; the next rollup recomputes them
+    DailyStats = apps.get_model('analytics', 'DailyStats')
+    DailyStats.objects.using(schema_editor.connection.alias).update(is_final=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_recorded_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDimension',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('dimension', models.CharField(choices=[('page', 'Page views by path and title'), ('source', 'Visitors by source type and name'), ('device_type', 'New visitors by device type'), ('browser', 'New visitors by browser'), ('country', 'New visitors by country')], max_length=20)),
+                ('value', models.CharField(blank=True, max_length=500, null=True)),
+                ('label', models.CharField(blank=True, help_text='Page title or source name', max_length=200, null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date', 'dimension', '-count'],
+                'indexes': [models.Index(fields=['date', 'dimension'], name='analytics_dimension_date_idx')],
+            },
+        ),
+        migrations.RunPython(reopen_rollups, migrations.RunPython.noop),
+    ]
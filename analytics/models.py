@@ -5,8 +5,12 @@ from django.contrib.sessions.models import Session
 import uuid
 import json
 
+from .querysets import DateRangeQuerySet
+
 class Visitor(models.Model):
     """Track unique visitors to the website"""
+    DATE_FIELD = 'first_visit'
+    
     visitor_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     session_key = models.CharField(max_length=40, blank=True, null=True)
     ip_address = models.GenericIPAddressField()
@@ -23,32 +27,56 @@ class Visitor(models.Model):
     browser = models.CharField(max_length=100, blank=True, null=True)
     operating_system = models.CharField(max_length=100, blank=True, null=True)
     
+    objects = DateRangeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-last_visit']
+        indexes = [
+            # Looked up on every tracked request; anonymous rows have no key
+            models.Index(
+                fields=['session_key'], name='analytics_visitor_session_idx',
+                condition=models.Q(session_key__isnull=False)
+            ),
+            models.Index(fields=['first_visit'], name='analytics_visitor_first_idx'),
+            models.Index(fields=['last_visit'], name='analytics_visitor_last_idx'),
+        ]
     
     def __str__(self):
         return f"Visitor {self.visitor_id} - {self.ip_address}"
 
 class PageView(models.Model):
     """Track individual page views"""
+    DATE_FIELD = 'timestamp'
+    
     visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='page_views')
     url = models.URLField()
     path = models.CharField(max_length=500)
     page_title = models.CharField(max_length=200, blank=True, null=True)
     referrer = models.URLField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Buffered writes store when the view happened, not when it was flushed
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     time_spent = models.DurationField(blank=True, null=True)
     exit_page = models.BooleanField(default=False)
     bounce = models.BooleanField(default=False)
     
+    objects = DateRangeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Range scans; carrying path makes the top-pages grouping index-only
+            models.Index(fields=['timestamp', 'path'], name='analytics_pageview_ts_idx'),
+            models.Index(fields=['path', 'timestamp'], name='analytics_pageview_path_idx'),
+            models.Index(fields=['visitor', 'timestamp'], name='analytics_pageview_visitor_idx'),
+        ]
     
     def __str__(self):
         return f"{self.visitor.visitor_id} - {self.path}"
 
 class TrafficSource(models.Model):
     """Track where visitors came from"""
+    DATE_FIELD = 'first_visit'
+    
     SOURCE_CHOICES = [
         ('direct', 'Direct'),
         ('google', 'Google'),
@@ -74,19 +102,27 @@ class TrafficSource(models.Model):
     source_url = models.URLField(blank=True, null=True)
     campaign_name = models.CharField(max_length=100, blank=True, null=True)
     medium = models.CharField(max_length=50, blank=True, null=True)
-    first_visit = models.DateTimeField(auto_now_add=True)
+    first_visit = models.DateTimeField(default=timezone.now, editable=False)
+    
+    objects = DateRangeQuerySet.as_manager()
     
     class Meta:
         ordering = ['-first_visit']
+        indexes = [
+            models.Index(fields=['visitor', 'source_type'], name='analytics_source_visitor_idx'),
+            models.Index(fields=['first_visit'], name='analytics_source_first_idx'),
+        ]
     
     def __str__(self):
         return f"{self.visitor.visitor_id} - {self.source_name}"
 
 class SessionData(models.Model):
     """Track session-level data"""
+    DATE_FIELD = 'start_time'
+    
     visitor = models.ForeignKey(Visitor, on_delete=models.CASCADE, related_name='sessions')
     session_key = models.CharField(max_length=40, unique=True)
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now, editable=False)
     end_time = models.DateTimeField(blank=True, null=True)
     duration = models.DurationField(blank=True, null=True)
     page_views_count = models.PositiveIntegerField(default=0)
@@ -97,14 +133,21 @@ class SessionData(models.Model):
     utm_term = models.CharField(max_length=100, blank=True, null=True)
     utm_content = models.CharField(max_length=100, blank=True, null=True)
     
+    objects = DateRangeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['start_time'], name='analytics_session_start_idx'),
+        ]
     
     def __str__(self):
         return f"Session {self.session_key} - {self.visitor.visitor_id}"
 
 class Event(models.Model):
     """Track custom events (clicks, form submissions, etc.)"""
+    DATE_FIELD = 'timestamp'
+    
     EVENT_TYPES = [
         ('click', 'Click'),
         ('form_submit', 'Form Submit'),
@@ -123,8 +166,14 @@ class Event(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     metadata = models.JSONField(default=dict, blank=True)
     
+    objects = DateRangeQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['visitor', 'timestamp'], name='analytics_event_visitor_idx'),
+            models.Index(fields=['event_type', 'timestamp'], name='analytics_event_type_idx'),
+        ]
     
     def __str__(self):
         return f"{self.visitor.visitor_id} - {self.event_name}"
@@ -180,6 +229,15 @@ class DailyStats(models.Model):
     mobile_visitors = models.PositiveIntegerField(default=0)
     tablet_visitors = models.PositiveIntegerField(default=0)
     
+    # Sessions split on inactivity by analytics.sessionization
+    visits = models.PositiveIntegerField(default=0, help_text="Sessions that ended on this day")
+    
+    # Rollup bookkeeping
+    timed_page_views = models.PositiveIntegerField(default=0, help_text="Page views with a recorded time spent")
+    hourly_page_views = models.JSONField(default=list, blank=True, help_text="Page views per hour of day")
+    is_final = models.BooleanField(default=False, help_text="Computed after the day closed")
+    computed_at = models.DateTimeField(blank=True, null=True)
+    
     class Meta:
         ordering = ['-date']
         verbose_name = "Daily Statistics"
@@ -187,3 +245,91 @@ class DailyStats(models.Model):
     
     def __str__(self):
         return f"Stats for {self.date}"
+
+class EventLogSegment(models.Model):
+    """Event log segments already loaded by the compactor"""
+    name = models.CharField(max_length=100, unique=True)
+    records = models.PositiveIntegerField(default=0)
+    compacted_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-compacted_at']
+    
+    def __str__(self):
+        return f"Segment {self.name}"
+
+class Watermark(models.Model):
+    """How far an incremental analytics job has processed"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} up to {self.position}"
+
+class PageTiming(models.Model):
+    """Real-user timings of one page load, in milliseconds (CLS is unitless)"""
+    DATE_FIELD = 'timestamp'
+    METRICS = ['ttfb', 'fcp', 'dom_content_loaded', 'load', 'lcp', 'cls', 'inp']
+    
+    path = models.CharField(max_length=500)
+    ttfb = models.FloatField(blank=True, null=True, help_text="Time to first byte")
+    fcp = models.FloatField(blank=True, null=True, help_text="First contentful paint")
+    dom_content_loaded = models.FloatField(blank=True, null=True)
+    load = models.FloatField(blank=True, null=True)
+    lcp = models.FloatField(blank=True, null=True, help_text="Largest contentful paint")
+    cls = models.FloatField(blank=True, null=True, help_text="Cumulative layout shift")
+    inp = models.FloatField(blank=True, null=True, help_text="Slowest interaction to next paint")
+    timestamp = models.DateTimeField(auto_now_add=True)
+    
+    objects = DateRangeQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'path'], name='analytics_timing_ts_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.path} at {self.timestamp}"
+
+class TimingDigest(models.Model):
+    """One day's histogram of a timing metric for a path (see analytics.histograms)"""
+    date = models.DateField()
+    path = models.CharField(max_length=500)
+    metric = models.CharField(max_length=20)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    buckets = models.JSONField(default=dict)
+    
+    class Meta:
+        ordering = ['-date', 'path', 'metric']
+        unique_together = ['date', 'path', 'metric']
+    
+    def __str__(self):
+        return f"{self.metric} for {self.path} on {self.date}"
+
+class DailyDimension(models.Model):
+    """One day's count for a dashboard breakdown row (top pages, sources, devices, ...)"""
+    DIMENSION_CHOICES = [
+        ('page', 'Page views by path and title'),
+        ('source', 'Visitors by source type and name'),
+        ('device_type', 'New visitors by device type'),
+        ('browser', 'New visitors by browser'),
+        ('country', 'New visitors by country'),
+    ]
+    
+    date = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=500, blank=True, null=True)
+    label = models.CharField(max_length=200, blank=True, null=True, help_text="Page title or source name")
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date', 'dimension', '-count']
+        indexes = [
+            models.Index(fields=['date', 'dimension'], name='analytics_dimension_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.dimension} {self.value} on {self.date}"
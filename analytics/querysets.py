@@ -0,0 +1,57 @@
+from datetime import datetime, time, timedelta
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_start(day):
+    """Aware datetime for local midnight at the start of a day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def date_bounds(start_date, end_date):
+    """Half-open [start, end) aware datetimes covering local dates start..end"""
+    return day_start(start_date), day_start(end_date + timedelta(days=1))
+
+
+def day_runs(days):
+    """Collapse dates into (first, last) runs of consecutive days"""
+    runs = []
+    for day in sorted(set(days)):
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def range_q(field, start_date, end_date):
+    start, end = date_bounds(start_date, end_date)
+    return Q(**{f'{field}__gte': start, f'{field}__lt': end})
+
+
+def days_q(field, days):
+    """Match any of the given local dates with one range per consecutive run"""
+    q = Q(pk__in=[])
+    for first, last in day_runs(days):
+        q |= range_q(field, first, last)
+    return q
+
+
+class DateRangeQuerySet(models.QuerySet):
+    """Filters on a model's timestamp column using sargable datetime bounds.
+
+    ``field__date__range`` casts the column per row (after a time zone
+    conversion with USE_TZ), so no index can be used. These filters
+    compare the raw column against aware local-midnight bounds instead.
+    """
+
+    def in_date_range(self, start_date, end_date, field=None):
+        return self.filter(range_q(field or self.model.DATE_FIELD, start_date, end_date))
+
+    def on_date(self, day, field=None):
+        return self.in_date_range(day, day, field)
+
+    def on_dates(self, days, field=None):
+        return self.filter(days_q(field or self.model.DATE_FIELD, days))
@@ -0,0 +1,176 @@
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count
+from django.utils import timezone
+
+WINDOW_SECONDS = 300
+KEY_PREFIX = 'analytics:rt'
+SINCE_KEY = f'{KEY_PREFIX}:since'
+REGISTER_EVERY = 10
+
+
+def bucket_key(shard, second):
+    return f'{KEY_PREFIX}:{shard}:{second}'
+
+
+def slot_key(slot):
+    return f'{KEY_PREFIX}:slot:{slot}'
+
+
+def shared_cache():
+    """The cache every worker sees, or None when the configured one is per-process"""
+    backend = caches[getattr(settings, 'ANALYTICS_REALTIME_CACHE', 'default')]
+    if isinstance(backend, (LocMemCache, DummyCache)):
+        return None
+    return backend
+
+
+class SlidingWindowCounter:
+    """Per-second ring buffer of live traffic kept in a shared cache backend.
+
+    Each worker writes only its own shard, so increments never contend
+    across processes. Shards register in numbered slots claimed with
+    cache.add and kept alive with cache.touch, so registration needs no
+    read-modify-write. Readers merge every live shard's buckets for the
+    window, which costs O(window) cache reads whatever the table sizes.
+    """
+
+    def __init__(self, window=WINDOW_SECONDS, shard=None, max_shards=None):
+        self.window = window
+        self.shard = shard or f'{socket.gethostname()}:{os.getpid()}'
+        self.max_shards = max_shards or getattr(settings, 'ANALYTICS_REALTIME_MAX_SHARDS', 64)
+        self._lock = threading.Lock()
+        self._second = None
+        self._bucket = None
+        self._registered_at = 0
+        self._slot = None
+
+    def record(self, visitor_id, path=None, source=None, now=None):
+        """Count a hit for the current second"""
+        cache = shared_cache()
+        if cache is None:
+            return
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            if second != self._second:
+                self._second = second
+                self._bucket = {'visitors': set(), 'paths': Counter(), 'sources': Counter()}
+            bucket = self._bucket
+            bucket['visitors'].add(visitor_id)
+            if path:
+                bucket['paths'][path] += 1
+            if source:
+                bucket['sources'][source] += 1
+            snapshot = {
+                'visitors': set(bucket['visitors']),
+                'paths': Counter(bucket['paths']),
+                'sources': Counter(bucket['sources']),
+            }
+            register = second - self._registered_at >= REGISTER_EVERY
+            if register:
+                self._registered_at = second
+        cache.set(bucket_key(self.shard, second), snapshot, timeout=self.window + 60)
+        if register:
+            self.register(second, cache)
+
+    def register(self, now, cache):
+        """Keep this shard's slot alive for a window, claiming a free one if it lapsed"""
+        # The first registration marks when counting started; readers wait a full window
+        cache.add(SINCE_KEY, now, timeout=self.window * 2)
+        cache.touch(SINCE_KEY, timeout=self.window * 2)
+        if self._slot is not None and cache.get(slot_key(self._slot)) == self.shard:
+            cache.touch(slot_key(self._slot), timeout=self.window)
+            return
+        self._slot = None
+        for slot in range(self.max_shards):
+            if cache.add(slot_key(slot), self.shard, timeout=self.window):
+                self._slot = slot
+                return
+        print(f"Real-time counters: all {self.max_shards} shard slots are taken")
+
+    def snapshot(self, now=None):
+        """Merge all live shards; returns None while the cache is cold or per-process"""
+        cache = shared_cache()
+        if cache is None:
+            return None
+        now = int(now if now is not None else time.time())
+        registry = cache.get_many([SINCE_KEY] + [slot_key(slot) for slot in range(self.max_shards)])
+        since = registry.pop(SINCE_KEY, None)
+        if since is None or since > now - self.window:
+            return None
+        keys = [
+            bucket_key(shard, second)
+            for shard in set(registry.values())
+            for second in range(now - self.window + 1, now + 1)
+        ]
+        visitors = set()
+        paths = Counter()
+        sources = Counter()
+        for bucket in cache.get_many(keys).values():
+            visitors |= bucket['visitors']
+            paths.update(bucket['paths'])
+            sources.update(bucket['sources'])
+        return build_snapshot(visitors, paths, sources)
+
+
+def build_snapshot(visitor_ids, paths, sources):
+    return {
+        'visitor_ids': visitor_ids,
+        'active_visitors': len(visitor_ids),
+        'page_views': sum(paths.values()),
+        'top_paths': [{'path': path, 'count': count} for path, count in paths.most_common(10)],
+        'sources': [
+            {'source_type': source_type, 'source_name': source_name, 'count': count}
+            for (source_type, source_name), count in sources.most_common()
+        ],
+    }
+
+
+def db_snapshot(window=WINDOW_SECONDS):
+    """Compute the same snapshot from the database"""
+    from .models import Visitor, PageView, TrafficSource
+
+    cutoff = timezone.now() - timedelta(seconds=window)
+    visitor_ids = set(Visitor.objects.filter(last_visit__gte=cutoff).values_list('pk', flat=True))
+    paths = Counter(dict(
+        PageView.objects.filter(timestamp__gte=cutoff).order_by().values('path').annotate(
+            count=Count('id')
+        ).values_list('path', 'count')
+    ))
+    sources = Counter({
+        (row['source_type'], row['source_name']): row['count']
+        for row in TrafficSource.objects.filter(first_visit__gte=cutoff).order_by().values(
+            'source_type', 'source_name'
+        ).annotate(count=Count('id'))
+    })
+    return build_snapshot(visitor_ids, paths, sources)
+
+
+counter = SlidingWindowCounter()
+
+
+def record(visitor_id, path=None, source=None):
+    """Record a live hit; never raises into the request path"""
+    try:
+        counter.record(visitor_id, path, source)
+    except Exception as e:
+        print(f"Error recording real-time hit: {e}")
+
+
+def snapshot():
+    """Live traffic for the last window, falling back to the DB when cold or unshared"""
+    try:
+        live = counter.snapshot()
+    except Exception as e:
+        print(f"Error reading real-time counters: {e}")
+        live = None
+    return live if live is not None else db_snapshot(counter.window)
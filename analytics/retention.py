@@ -0,0 +1,261 @@
+import gzip
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .exports import export_value
+from .models import PageView, Event, PageTiming, AnalyticsSettings
+from .querysets import day_start
+from .routers import analytics_db
+
+# Tables that grow with traffic and are expired by timestamp
+EXPIRING_MODELS = [PageView, Event, PageTiming]
+
+RetentionResult = namedtuple('RetentionResult', [
+    'model', 'deleted', 'archived', 'partitions_dropped', 'seconds', 'complete',
+])
+
+
+def retention_days():
+    """Days of raw tracking data to keep (AnalyticsSettings wins over settings)"""
+    analytics_settings = AnalyticsSettings.objects.first()
+    if analytics_settings:
+        return analytics_settings.data_retention_days
+    return getattr(settings, 'ANALYTICS_RETENTION_DAYS', 365)
+
+
+def retention_cutoff(days=None, today=None):
+    """Rows older than local midnight ``days`` days ago are expired"""
+    days = retention_days() if days is None else days
+    return day_start((today or timezone.localdate()) - timedelta(days=days))
+
+
+def rows_per_second(result):
+    return result.deleted / result.seconds if result.seconds else 0.0
+
+
+class Archive:
+    """Appends expired rows to a gzipped NDJSON file per model and cutoff.
+
+    Each batch is written as its own gzip member, so an interrupted run
+    leaves a valid file and a resumed run simply appends to it.
+    """
+
+    def __init__(self, directory, model, cutoff):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(
+            directory, f'{model._meta.db_table}_before_{timezone.localdate(cutoff)}.ndjson.gz'
+        )
+
+    def write(self, rows):
+        with gzip.open(self.path, 'at') as archive:
+            for row in rows:
+                archive.write(json.dumps({field: export_value(value) for field, value in row.items()}) + '\n')
+
+
+def expire(model, cutoff, batch_size=None, archive_dir=None, time_budget=None, pause=None):
+    """Delete (and optionally archive) rows older than cutoff in small batches.
+
+    Every batch is its own short transaction that deletes at most
+    ``batch_size`` rows picked through the timestamp index, so writers
+    are never blocked for long. The work is defined only by the cutoff,
+    which makes it resumable: stopping at the time budget or crashing
+    loses nothing, and the next run carries on where this one stopped.
+    """
+    batch_size = batch_size or getattr(settings, 'ANALYTICS_RETENTION_BATCH_SIZE', 5000)
+    pause = getattr(settings, 'ANALYTICS_RETENTION_PAUSE', 0.05) if pause is None else pause
+    started = time.monotonic()
+    field = model.DATE_FIELD
+
+    # Whole expired months go at once, unless their rows must be archived first
+    partitions_dropped = []
+    if not archive_dir and is_partitioned(model):
+        partitions_dropped = drop_expired_partitions(model, cutoff)
+
+    archive = Archive(archive_dir, model, cutoff) if archive_dir else None
+    expired = model.objects.filter(**{f'{field}__lt': cutoff}).order_by(field)
+    deleted = archived = 0
+    complete = False
+    while True:
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            break
+        with transaction.atomic(using=analytics_db()):
+            if archive:
+                rows = list(expired.values()[:batch_size])
+                pks = [row['id'] for row in rows]
+            else:
+                pks = list(expired.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                complete = True
+                break
+            if archive:
+                archive.write(rows)
+                archived += len(rows)
+            deleted += model.objects.filter(pk__in=pks).delete()[0]
+        if len(pks) < batch_size:
+            complete = True
+            break
+        if pause:
+            time.sleep(pause)
+
+    return RetentionResult(
+        model=model._meta.label,
+        deleted=deleted,
+        archived=archived,
+        partitions_dropped=partitions_dropped,
+        seconds=time.monotonic() - started,
+        complete=complete,
+    )
+
+
+def enforce(days=None, archive_dir=None, time_budget=None, batch_size=None):
+    """Apply the retention policy to every expiring table"""
+    cutoff = retention_cutoff(days)
+    archive_dir = archive_dir or getattr(settings, 'ANALYTICS_RETENTION_ARCHIVE_DIR', None)
+    if time_budget is None:
+        time_budget = getattr(settings, 'ANALYTICS_RETENTION_TIME_BUDGET', None)
+    results = []
+    for model in EXPIRING_MODELS:
+        started = time.monotonic()
+        if is_partitioned(model):
+            ensure_partitions(model)
+        results.append(expire(
+            model, cutoff, batch_size=batch_size, archive_dir=archive_dir, time_budget=time_budget
+        ))
+        if time_budget is not None:
+            time_budget = max(time_budget - (time.monotonic() - started), 0)
+    return results
+
+
+# PostgreSQL monthly partitioning. A partitioned table turns expiry of a
+# whole month into DROP TABLE instead of a row-by-row delete.
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(day):
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(model, month):
+    return f'{model._meta.db_table}_p{month:%Y%m}'
+
+
+def partitioning_supported():
+    return connections[analytics_db()].vendor == 'postgresql'
+
+
+def is_partitioned(model):
+    if not partitioning_supported():
+        return False
+    with connections[analytics_db()].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [model._meta.db_table]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(model):
+    """(name, upper bound) of every partition of a partitioned table"""
+    with connections[analytics_db()].cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [model._meta.db_table]
+        )
+        rows = cursor.fetchall()
+    bounds = []
+    for name, expression in rows:
+        # FOR VALUES FROM ('...') TO ('...')
+        if 'TO (' not in expression:
+            continue
+        upper = expression.split('TO (', 1)[1].strip(")' ")
+        bounds.append((name, upper))
+    return bounds
+
+
+def create_partition(model, month, cursor):
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(model, month)}" '
+        f'PARTITION OF "{model._meta.db_table}" FOR VALUES FROM (%s) TO (%s)',
+        [day_start(month), day_start(next_month(month))]
+    )
+
+
+def ensure_partitions(model, months_ahead=2):
+    """Create this month's partition and the next few"""
+    month = month_start(timezone.localdate())
+    with connections[analytics_db()].cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            create_partition(model, month, cursor)
+            month = next_month(month)
+
+
+def drop_expired_partitions(model, cutoff):
+    """Drop partitions that lie entirely before the cutoff"""
+    dropped = []
+    with connections[analytics_db()].cursor() as cursor:
+        for name, upper in partitions(model):
+            cursor.execute('SELECT %s::timestamptz <= %s::timestamptz', [upper, cutoff])
+            if not cursor.fetchone()[0]:
+                continue
+            cursor.execute(f'ALTER TABLE "{model._meta.db_table}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+            dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(model, months_ahead=2):
+    """Rebuild a table as a monthly range-partitioned table (PostgreSQL only).
+
+    The primary key becomes (id, timestamp) because PostgreSQL requires
+    the partition key in every unique constraint, and the id sequence is
+    carried past the highest copied id. The visitor foreign key is not
+    recreated (the ORM already cascades deletes). Runs in one transaction
+    and copies every row, so schedule it in a maintenance window.
+    """
+    if not partitioning_supported():
+        raise RuntimeError('Monthly partitioning needs PostgreSQL')
+    if is_partitioned(model):
+        return False
+
+    table = model._meta.db_table
+    legacy = f'{table}_unpartitioned'
+    column = model._meta.get_field(model.DATE_FIELD).column
+    alias = analytics_db()
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute(f'SELECT min("{column}") FROM "{table}"')
+        first = cursor.fetchone()[0]
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS, '
+            f'PRIMARY KEY (id, "{column}")) PARTITION BY RANGE ("{column}")'
+        )
+        month = month_start(timezone.localdate(first) if first else timezone.localdate())
+        last = next_month(month_start(timezone.localdate()))
+        for _ in range(months_ahead):
+            last = next_month(last)
+        while month < last:
+            create_partition(model, month, cursor)
+            month = next_month(month)
+        # Catches rows outside the prepared months instead of failing inserts
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+        cursor.execute(f'INSERT INTO "{table}" OVERRIDING SYSTEM VALUE SELECT * FROM "{legacy}"')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f'coalesce((SELECT max(id) FROM "{table}"), 0) + 1, false)'
+        )
+        cursor.execute(f'DROP TABLE "{legacy}"')
+        for index in model._meta.indexes:
+            fields = ', '.join(f'"{model._meta.get_field(name).column}"' for name in index.fields)
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "{index.name}" ON "{table}" ({fields})')
+    return True
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .models import Visitor, PageView, TrafficSource, SessionData, DailyStats
+from .dimensions import rollup_dimensions_day
+from .querysets import day_start
+from .sessionization import sessionize, sessionized_until
+from .timings import rollup_timing_day
+
+
+def compute_day(day):
+    """Aggregate raw tracking rows for one local day into DailyStats fields"""
+    visitors = Visitor.objects.on_date(day).aggregate(
+        total=Count('id'),
+        desktop=Count('id', filter=Q(device_type='desktop')),
+        mobile=Count('id', filter=Q(device_type='mobile')),
+        tablet=Count('id', filter=Q(device_type='tablet')),
+    )
+    page_views = PageView.objects.on_date(day).aggregate(
+        total=Count('id'),
+        timed=Count('time_spent'),
+        active_visitors=Count('visitor', distinct=True),
+        returning=Count('visitor', distinct=True, filter=Q(visitor__first_visit__lt=day_start(day))),
+    )
+    # Sessions are counted on the day of their exit view
+    sessions = PageView.objects.on_date(day).aggregate(
+        visits=Count('id', filter=Q(exit_page=True)),
+        bounces=Count('id', filter=Q(bounce=True)),
+        time_spent=Sum('time_spent'),
+    )
+    hourly = dict(
+        PageView.objects.on_date(day).annotate(
+            hour=ExtractHour('timestamp')
+        ).order_by().values('hour').annotate(
+            count=Count('id')
+        ).values_list('hour', 'count')
+    )
+    sources = TrafficSource.objects.on_date(day).aggregate(
+        direct=Count('visitor', distinct=True, filter=Q(source_type='direct')),
+        google=Count('visitor', distinct=True, filter=Q(source_type='google') | Q(source_name__iexact='google')),
+        facebook=Count('visitor', distinct=True, filter=Q(source_type='facebook') | Q(source_name__iexact='facebook')),
+        whatsapp=Count('visitor', distinct=True, filter=Q(source_type='whatsapp')),
+        referral=Count('visitor', distinct=True, filter=Q(source_type='referral')),
+        organic=Count('visitor', distinct=True, filter=Q(source_type='organic')),
+    )
+    total_sessions = SessionData.objects.on_date(day).count()
+
+    total_visitors = visitors['total']
+    return {
+        'total_visitors': total_visitors,
+        'unique_visitors': page_views['active_visitors'],
+        'total_page_views': page_views['total'],
+        'total_sessions': total_sessions,
+        'visits': sessions['visits'],
+        'avg_session_duration': (sessions['time_spent'] or timedelta(0)) / sessions['visits'] if sessions['visits'] else None,
+        'bounce_rate': (sessions['bounces'] / sessions['visits'] * 100) if sessions['visits'] else 0.0,
+        'new_visitors': total_visitors,
+        'returning_visitors': page_views['returning'],
+        'direct_traffic': sources['direct'],
+        'google_traffic': sources['google'],
+        'facebook_traffic': sources['facebook'],
+        'whatsapp_traffic': sources['whatsapp'],
+        'referral_traffic': sources['referral'],
+        'organic_traffic': sources['organic'],
+        'desktop_visitors': visitors['desktop'],
+        'mobile_visitors': visitors['mobile'],
+        'tablet_visitors': visitors['tablet'],
+        'timed_page_views': page_views['timed'],
+        'hourly_page_views': [hourly.get(hour, 0) for hour in range(24)],
+    }
+
+
+def rollup_day(day, today=None):
+    """Compute and store the rollup row for a day"""
+    today = today or timezone.localdate()
+    values = compute_day(day)
+    rollup_timing_day(day)
+    rollup_dimensions_day(day)
+    # A closed day is final once sessionization has passed its end
+    watermark = sessionized_until()
+    values['is_final'] = day < today and watermark is not None and watermark >= day_start(day + timedelta(days=1))
+    values['computed_at'] = timezone.now()
+    stats, _ = DailyStats.objects.update_or_create(date=day, defaults=values)
+    return stats
+
+
+def pending_days(start_date, end_date, today=None):
+    """Days in a range whose rollup is missing or was computed while open"""
+    today = today or timezone.localdate()
+    final_days = set(DailyStats.objects.filter(
+        date__range=[start_date, end_date], is_final=True
+    ).values_list('date', flat=True))
+    days = []
+    day = start_date
+    while day <= end_date:
+        if day not in final_days or day >= today:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def rollup(days=None, rebuild=False):
+    """Roll up every day that is not final yet, plus the current day.
+
+    Closed days are computed once and then marked final; only the open
+    day is recomputed on every run. ``days`` limits how far back to look,
+    otherwise the job starts at the first recorded page view.
+    Sessionization is brought up to date first, since the bounce rate
+    and session durations are read from its flags.
+    """
+    sessionize()
+    today = timezone.localdate()
+    if days is not None:
+        start_date = today - timedelta(days=days)
+    else:
+        first_view = PageView.objects.aggregate(first=Min('timestamp'))['first']
+        start_date = timezone.localdate(first_view) if first_view else today
+
+    if rebuild:
+        targets = [start_date + timedelta(days=offset) for offset in range((today - start_date).days + 1)]
+    else:
+        targets = pending_days(start_date, today, today=today)
+
+    for day in targets:
+        rollup_day(day, today=today)
+    return targets
@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connections
+
+APP_LABEL = 'analytics'
+
+_state = Local()
+
+
+def analytics_db():
+    """Alias that owns the analytics tables (falls back to default)"""
+    alias = getattr(settings, 'ANALYTICS_DATABASE', 'analytics')
+    return alias if alias in connections.databases else 'default'
+
+
+def replica_db():
+    """Read replica alias for dashboards, or None when there isn't one"""
+    alias = getattr(settings, 'ANALYTICS_REPLICA_DATABASE', 'analytics_replica')
+    return alias if alias in connections.databases else None
+
+
+@contextmanager
+def read_from_replica():
+    """Route analytics reads in this block to the replica, if configured"""
+    previous = getattr(_state, 'replica', False)
+    _state.replica = True
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def replica_reads(view):
+    """View decorator: the dashboards tolerate replica lag, tracking does not"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        with read_from_replica():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def stream_from_replica(chunks):
+    """Keep replica routing for a generator consumed after the view returns"""
+    with read_from_replica():
+        yield from chunks
+
+
+class AnalyticsRouter:
+    """Keeps tracking writes off the CRM database.
+
+    Analytics models live on ANALYTICS_DATABASE; reads made inside
+    read_from_replica() go to ANALYTICS_REPLICA_DATABASE. Either alias
+    may be left out of DATABASES, in which case everything stays on
+    default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        if getattr(_state, 'replica', False):
+            return replica_db() or analytics_db()
+        return analytics_db()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return analytics_db()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if APP_LABEL in (obj1._meta.app_label, obj2._meta.app_label):
+            return obj1._meta.app_label == obj2._meta.app_label
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica_db():
+            return False
+        if app_label == APP_LABEL:
+            return db == analytics_db()
+        if db == analytics_db() and db != 'default':
+            return False
+        return None
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply ANALYTICS_SQLITE_PRAGMAS to new SQLite analytics connections.
+
+    WAL lets readers run alongside the single writer and
+    synchronous=NORMAL only fsyncs at checkpoints, which suits a
+    single-node deployment where tracking writes are frequent. Other
+    aliases, including default with the CRM data, keep SQLite's
+    durable defaults.
+    """
+    aliases = {
+        getattr(settings, 'ANALYTICS_DATABASE', 'analytics'),
+        getattr(settings, 'ANALYTICS_REPLICA_DATABASE', 'analytics_replica'),
+    }
+    if connection.vendor != 'sqlite' or connection.alias not in aliases:
+        return
+    pragmas = getattr(settings, 'ANALYTICS_SQLITE_PRAGMAS', None) or {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+# (name, interval setting, default interval in seconds, callable path)
+TASKS = [
+    ('rollup_daily_stats', 'ANALYTICS_ROLLUP_INTERVAL', 900, 'analytics.rollups.rollup'),
+    ('enforce_retention', 'ANALYTICS_RETENTION_INTERVAL', 3600, 'analytics.retention.enforce'),
+]
+
+# Same shape, but run by every worker because they flush in-process state
+WORKER_TASKS = [
+    ('flush_liveness', 'ANALYTICS_LIVENESS_FLUSH_INTERVAL', 60, 'analytics.liveness.flush'),
+    ('rotate_event_log', 'ANALYTICS_EVENT_LOG_SEGMENT_SECONDS', 60, 'analytics.eventlog.rotate_idle'),
+]
+
+TICK_SECONDS = 30
+
+
+class Scheduler:
+    """Runs periodic analytics jobs on a daemon thread inside a worker.
+
+    Every worker may run a scheduler; a cache lock per task and interval
+    makes sure only one of them actually executes each run. Worker tasks
+    skip the lock and run in every process.
+    """
+
+    def __init__(self, tasks, worker_tasks=()):
+        self.tasks = tasks
+        self.worker_tasks = worker_tasks
+        self.last_run = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='analytics-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_pending(self):
+        now = time.monotonic()
+        tasks = [(task, True) for task in self.tasks] + [(task, False) for task in self.worker_tasks]
+        for (name, interval_setting, default_interval, path), shared in tasks:
+            interval = getattr(settings, interval_setting, default_interval)
+            if now - self.last_run.get(name, float('-inf')) < interval:
+                continue
+            self.last_run[name] = now
+            # Only one worker per interval wins the lock
+            if shared and not cache.add(f'analytics:scheduler:{name}', 1, timeout=interval):
+                continue
+            close_old_connections()
+            try:
+                import_string(path)()
+            except Exception as e:
+                print(f"Error running scheduled analytics task {name}: {e}")
+            finally:
+                close_old_connections()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_pending()
+            self._stop.wait(TICK_SECONDS)
+
+
+scheduler = Scheduler(TASKS, WORKER_TASKS)
+
+
+def start():
+    """Start the in-process scheduler if it is enabled"""
+    if getattr(settings, 'ANALYTICS_SCHEDULER_ENABLED', False):
+        scheduler.start()
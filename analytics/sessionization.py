@@ -0,0 +1,128 @@
+import time
+from collections import namedtuple
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PageView, SessionData, Watermark
+from .routers import analytics_db
+
+WATERMARK = 'sessionization'
+
+# Columns read per page view, in this order
+PK, VISITOR, TIMESTAMP, TIME_SPENT, EXIT_PAGE, BOUNCE = range(6)
+
+SessionizationResult = namedtuple('SessionizationResult', [
+    'page_views', 'updated', 'sessions', 'watermark', 'seconds',
+])
+
+
+def session_timeout():
+    """Inactivity gap after which the next page view starts a new session"""
+    return timedelta(minutes=getattr(settings, 'ANALYTICS_SESSION_TIMEOUT_MINUTES', 30))
+
+
+def sessionized_until():
+    """Page views before this time carry final session flags (None before the first run)"""
+    return Watermark.objects.filter(name=WATERMARK).values_list('position', flat=True).first()
+
+
+def mark(rows, start, end, timeout):
+    """Derive exit, bounce and time spent for one visitor's page views.
+
+    ``rows`` are in timestamp order. Only rows in [start, end) are
+    yielded, as (row, exit_page, bounce, time_spent); the others are
+    there so their neighbours know whether the session continues.
+    Time spent is only filled in where the tracking script did not
+    report it, as the gap to the next view of the same session.
+    """
+    for index, row in enumerate(rows):
+        timestamp = row[TIMESTAMP]
+        if timestamp >= end or (start is not None and timestamp < start):
+            continue
+        previous = rows[index - 1][TIMESTAMP] if index else None
+        following = rows[index + 1][TIMESTAMP] if index + 1 < len(rows) else None
+        continues = previous is not None and timestamp - previous <= timeout
+        continued = following is not None and following - timestamp <= timeout
+        time_spent = row[TIME_SPENT]
+        if continued and time_spent is None:
+            time_spent = following - timestamp
+        yield row, not continued, not (continues or continued), time_spent
+
+
+def close_sessions(last_views):
+    """Extend each visitor's current SessionData to its last sessionized view"""
+    current = {}
+    for session in SessionData.objects.filter(
+        visitor_id__in=last_views
+    ).order_by('start_time').only('pk', 'visitor_id', 'start_time', 'end_time'):
+        if session.start_time <= last_views[session.visitor_id]:
+            current[session.visitor_id] = session
+
+    updated = []
+    for visitor_id, session in current.items():
+        end_time = max(session.end_time or last_views[visitor_id], last_views[visitor_id])
+        if end_time != session.end_time:
+            session.end_time = end_time
+            session.duration = end_time - session.start_time
+            updated.append(session)
+    SessionData.objects.bulk_update(updated, ['end_time', 'duration'], batch_size=500)
+    return len(updated)
+
+
+def sessionize(now=None, chunk_size=None):
+    """Flag page views up to the watermark's new position, one visitor chunk at a time.
+
+    The watermark trails ``now`` by the session timeout, so every view
+    it passes has either been followed within the timeout or never will
+    be, and its flags are final. Views reported late (e.g. compacted
+    from the event log) are still picked up as long as they arrive
+    within that margin. Each run reads the views since the watermark
+    plus one timeout of context before it, grouped by visitor, and only
+    writes rows whose flags changed; re-running a chunk is harmless, so
+    the watermark moves only once every chunk has been written.
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    timeout = session_timeout()
+    chunk_size = chunk_size or getattr(settings, 'ANALYTICS_SESSIONIZE_CHUNK_SIZE', 500)
+    start = sessionized_until()
+    end = now - timeout
+    if start is not None and start >= end:
+        return SessionizationResult(0, 0, 0, start, time.monotonic() - started)
+
+    targets = PageView.objects.filter(timestamp__lt=end)
+    context = PageView.objects.filter(timestamp__lt=now)
+    if start is not None:
+        targets = targets.filter(timestamp__gte=start)
+        context = context.filter(timestamp__gte=start - timeout)
+    visitor_ids = list(targets.order_by().values_list('visitor_id', flat=True).distinct())
+
+    processed = updated = sessions = 0
+    for offset in range(0, len(visitor_ids), chunk_size):
+        rows = context.filter(
+            visitor_id__in=visitor_ids[offset:offset + chunk_size]
+        ).order_by('visitor_id', 'timestamp', 'pk').values_list(
+            'pk', 'visitor_id', 'timestamp', 'time_spent', 'exit_page', 'bounce'
+        ).iterator(chunk_size=2000)
+
+        changed = []
+        last_views = {}
+        for visitor_id, views in groupby(rows, key=itemgetter(VISITOR)):
+            for row, exit_page, bounce, time_spent in mark(list(views), start, end, timeout):
+                processed += 1
+                last_views[visitor_id] = row[TIMESTAMP]
+                if (exit_page, bounce, time_spent) != (row[EXIT_PAGE], row[BOUNCE], row[TIME_SPENT]):
+                    changed.append(PageView(pk=row[PK], exit_page=exit_page, bounce=bounce, time_spent=time_spent))
+
+        with transaction.atomic(using=analytics_db()):
+            PageView.objects.bulk_update(changed, ['exit_page', 'bounce', 'time_spent'], batch_size=500)
+            sessions += close_sessions(last_views)
+        updated += len(changed)
+
+    Watermark.objects.update_or_create(name=WATERMARK, defaults={'position': end})
+    return SessionizationResult(processed, updated, sessions, end, time.monotonic() - started)
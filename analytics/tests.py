@@ -0,0 +1,1004 @@
+import gzip
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from contact.models import ContactInquiry, QuoteRequest
+from mediwell_care.urls import urlpatterns as project_urlpatterns
+from django.urls import include, path, reverse
+
+# The app is optional: these tests only run where it is in INSTALLED_APPS
+ANALYTICS_INSTALLED = apps.is_installed('analytics')
+requires_analytics = skipUnless(ANALYTICS_INSTALLED, 'analytics is not in INSTALLED_APPS')
+
+if ANALYTICS_INSTALLED:
+    from . import (
+        aggregation, buffer, compaction, counters, eventlog, exports, geolocation, histograms, liveness, realtime,
+        retention, rollups, sessionization, user_agents
+    )
+    from .management.commands.benchmark_analytics_queries import uses_index
+    from .middleware import AnalyticsMiddleware
+    from .models import DailyDimension, DailyStats, Event, PageTiming, PageView, SessionData, TrafficSource, Visitor
+    from .querysets import day_runs, day_start
+    from .routers import analytics_db
+    from .utils import get_geolocation
+
+# Analytics tables live on their own alias when ANALYTICS_SEPARATE_DATABASE is set
+TEST_DATABASES = {'default', analytics_db()} if ANALYTICS_INSTALLED else {'default'}
+
+# The project does not route analytics; tests mount it next to the project's URLs
+urlpatterns = project_urlpatterns + [path('analytics/', include('analytics.urls'))] if ANALYTICS_INSTALLED else []
+
+
+@requires_analytics
+@override_settings(ROOT_URLCONF='analytics.tests')
+class TrackingTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        # Visitors are found again by their session
+        self.client.session.save()
+
+    def post(self, name, body):
+        return self.client.post(reverse(f'analytics:{name}'), body, content_type='application/json')
+
+    def test_invalid_json_is_a_bad_request(self):
+        self.assertEqual(self.post('track', '{"event_type": ').status_code, 400)
+        self.assertEqual(self.post('track_batch', '{"events": [').status_code, 400)
+
+    def test_bad_events_are_dropped_from_the_batch(self):
+        url = 'https://example.com/about/'
+        response = self.post('track_batch', json.dumps({'events': [
+            {'event_type': 'page_view', 'data': {'url': url, 'path': '/about/'}},
+            {'event_type': 'page_unload', 'data': {'url': url, 'time_spent': 'abc'}},
+            {'event_type': 'page_unload', 'data': {'url': url, 'time_spent': float('inf')}},
+            {'event_type': 'click', 'data': {'url': url, 'element_tag': 'a'}},
+        ]}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['accepted'], 2)
+        self.assertEqual(response.json()['rejected'], 2)
+        self.assertEqual(PageView.objects.count(), 1)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_unload_records_time_spent(self):
+        url = 'https://example.com/about/'
+        self.post('track_batch', json.dumps([{'event_type': 'page_view', 'data': {'url': url}}]))
+        response = self.post('track_batch', json.dumps([
+            {'event_type': 'page_unload', 'data': {'url': url, 'time_spent': '1500'}},
+        ]))
+
+        self.assertEqual(response.json()['accepted'], 1)
+        self.assertEqual(PageView.objects.get().time_spent, timedelta(milliseconds=1500))
+
+
+    def test_first_batch_of_a_new_session_is_counted(self):
+        url = 'https://example.com/about/'
+        self.post('track_batch', json.dumps([{'event_type': 'page_view', 'data': {'url': url}}] * 3))
+
+        self.assertEqual(Visitor.objects.get().total_page_views, 3)
+        self.assertEqual(SessionData.objects.get().page_views_count, 3)
+        self.post('track_batch', json.dumps([{'event_type': 'page_view', 'data': {'url': url}}]))
+        self.assertEqual(SessionData.objects.get().page_views_count, 4)
+
+@requires_analytics
+class RealtimeCounterTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        # A file cache stands in for a cache shared by every worker
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        shared = self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.directory},
+        }, ANALYTICS_REALTIME_CACHE='shared')
+        shared.enable()
+        self.addCleanup(shared.disable)
+
+    def test_shards_are_merged(self):
+        first = realtime.SlidingWindowCounter(shard='web-1')
+        second = realtime.SlidingWindowCounter(shard='web-2')
+        first.record(1, '/a/', now=990)
+        second.record(2, '/b/', now=995)
+        self.assertIsNone(first.snapshot(now=1100))
+
+        first.record(3, '/a/', now=1200)
+        second.record(4, '/b/', now=1250)
+        second.record(5, '/b/', now=1250)
+        live = first.snapshot(now=1300)
+
+        self.assertEqual(live['visitor_ids'], {3, 4, 5})
+        self.assertEqual(live['top_paths'], [{'path': '/b/', 'count': 2}, {'path': '/a/', 'count': 1}])
+        self.assertNotEqual(first._slot, second._slot)
+
+    def test_shard_keeps_its_slot(self):
+        counter = realtime.SlidingWindowCounter(shard='web-1')
+        counter.record(1, now=1000)
+        slot = counter._slot
+        counter.record(1, now=1020)
+        self.assertEqual(counter._slot, slot)
+
+    def test_per_process_cache_falls_back_to_the_database(self):
+        with self.settings(ANALYTICS_REALTIME_CACHE='default'):
+            counter = realtime.SlidingWindowCounter(shard='web-1')
+            counter.record(1, '/a/', now=1000)
+            self.assertIsNone(counter.snapshot(now=1400))
+            # Nothing was written to the per-process cache
+            self.assertIsNone(cache.get(realtime.SINCE_KEY))
+            self.assertIsNone(cache.get(realtime.bucket_key('web-1', 1000)))
+
+
+@requires_analytics
+@skipUnless(TEST_DATABASES == {'default', 'analytics'}, 'analytics has no database alias of its own')
+class SqlitePragmaTests(TestCase):
+    # {'default', 'analytics'} whenever the tests run; the test runner reads it even when skipped
+    databases = TEST_DATABASES
+
+    def pragma(self, alias, name):
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            self.skipTest(f'{alias} is not SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_analytics_connection_is_tuned(self):
+        self.assertEqual(self.pragma('analytics', 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('analytics', 'busy_timeout'), 5000)
+
+    def test_default_connection_is_left_alone(self):
+        self.assertEqual(self.pragma('default', 'synchronous'), 2)  # FULL
+
+
+def tracking_record(visitor, session_key, timestamp, path='/'):
+    return buffer.TrackingRecord(
+        visitor_id=visitor.pk,
+        session_key=session_key,
+        repeat_visit=False,
+        timestamp=timestamp,
+        url=f'https://example.com{path}',
+        path=path,
+        page_title='',
+        referrer='',
+        source={'type': 'direct', 'name': 'Direct', 'url': None},
+        utm=(None,) * len(buffer.UTM_FIELDS),
+    )
+
+
+@requires_analytics
+class TrackingBufferTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+
+    def test_recorded_timestamps_are_kept(self):
+        seen = timezone.now() - timedelta(hours=1)
+        buffer.write_batch([
+            tracking_record(self.visitor, 'session-1', seen),
+            tracking_record(self.visitor, 'session-1', seen + timedelta(seconds=30), '/about/'),
+        ])
+
+        self.assertEqual(
+            sorted(PageView.objects.values_list('timestamp', flat=True)),
+            [seen, seen + timedelta(seconds=30)]
+        )
+        self.assertEqual(SessionData.objects.get().start_time, seen)
+        self.assertEqual(TrafficSource.objects.get().first_visit, seen)
+
+    def test_views_count_when_the_session_already_exists(self):
+        # As if another worker inserted the session while this batch was queued
+        SessionData.objects.create(visitor=self.visitor, session_key='session-1', page_views_count=2)
+        now = timezone.now()
+        buffer.write_batch([tracking_record(self.visitor, 'session-1', now) for _ in range(3)])
+        buffer.write_batch([tracking_record(self.visitor, 'session-2', now)])
+        buffer.write_batch([tracking_record(self.visitor, 'session-2', now)])
+
+        counts = dict(SessionData.objects.values_list('session_key', 'page_views_count'))
+        self.assertEqual(counts, {'session-1': 5, 'session-2': 2})
+        self.assertEqual(Visitor.objects.get().total_page_views, 5)
+
+
+@requires_analytics
+class CounterConcurrencyTests(TransactionTestCase):
+    """Counters are F() increments, so racing workers never lose updates"""
+    databases = TEST_DATABASES
+    threads = 8
+    increments = 25
+
+    def race(self, increment):
+        start = threading.Barrier(self.threads)
+        errors = []
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.increments):
+                    increment()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_visitor_increments(self):
+        visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        self.race(lambda: counters.increment_visitor(
+            visitor.pk, total_page_views=1, total_time_spent=timedelta(seconds=1)
+        ))
+        visitor.refresh_from_db()
+        self.assertEqual(visitor.total_page_views, self.threads * self.increments)
+        self.assertEqual(visitor.total_time_spent, timedelta(seconds=self.threads * self.increments))
+
+    def test_session_increments(self):
+        visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        session = SessionData.objects.create(visitor=visitor, session_key='session-1')
+        self.race(lambda: counters.increment_session('session-1', page_views_count=1))
+        session.refresh_from_db()
+        self.assertEqual(session.page_views_count, self.threads * self.increments)
+
+
+@requires_analytics
+@override_settings(ROOT_URLCONF='analytics.tests')
+class QueryBudgetTests(TestCase):
+    """Dashboard and API query counts are fixed budgets, whatever the data size"""
+    databases = TEST_DATABASES
+    # Queries with a cold cache, including the session and user lookups
+    budgets = [
+        ('dashboard', {}, 22),
+        ('api', {'metric': 'overview'}, 7),
+        ('api', {'metric': 'traffic_sources'}, 3),
+        ('api', {'metric': 'hourly'}, 4),
+        ('api', {'metric': 'timings'}, 6),
+        ('api', {'metric': 'realtime'}, 5),
+        ('real_time', {}, 8),
+        ('traffic_sources', {}, 5),
+        ('pages_analysis', {}, 8),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('analyst', password='secret', is_staff=True)
+        cls.rows = 0
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    @contextmanager
+    def assertNumQueriesAll(self, num):
+        """assertNumQueries summed over default and the analytics alias"""
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in sorted(self.databases)
+            ]
+            yield
+        queries = [query['sql'] for context in captured for query in context.captured_queries]
+        self.assertEqual(len(queries), num, '\n'.join(queries))
+
+    def add_rows(self, rows):
+        """Visitors with a view, session, source, event and timing each, spread over 20 days"""
+        now = timezone.now()
+        for number in range(self.rows, rows):
+            seen = now - timedelta(days=number % 20)
+            visitor = Visitor.objects.create(
+                ip_address='10.0.0.1', user_agent='test', session_key=f'session-{number}',
+                device_type='mobile', country='India'
+            )
+            PageView.objects.create(
+                visitor=visitor, url='https://example.com/', path=f'/page-{number % 5}/', timestamp=seen
+            )
+            SessionData.objects.create(visitor=visitor, session_key=f'session-{number}', page_views_count=1)
+            TrafficSource.objects.create(visitor=visitor, source_type='direct', source_name='Direct')
+            Event.objects.create(visitor=visitor, event_type='click', event_name='Click: a', page_url='https://example.com/')
+            PageTiming.objects.create(path=f'/page-{number % 5}/', timestamp=seen, load=1200.0, lcp=900.0)
+        self.rows = rows
+
+    def test_budgets_hold_at_any_size(self):
+        for rows in (10, 100):
+            self.add_rows(rows)
+            for name, params, budget in self.budgets:
+                url = reverse(f'analytics:{name}')
+                with self.subTest(rows=rows, view=name, **params):
+                    # The first request also pays one-off costs such as creating the site settings row
+                    self.assertEqual(self.client.get(url, params).status_code, 200)
+                    cache.clear()
+                    with self.assertNumQueriesAll(budget):
+                        self.client.get(url, params)
+
+    def test_cached_dashboard(self):
+        self.add_rows(10)
+        url = reverse('analytics:dashboard')
+        self.client.get(url)
+        # Aggregates come from the cache; recent visitors and the live count are queried
+        with self.assertNumQueriesAll(5):
+            self.client.get(url)
+
+
+@requires_analytics
+class QueryPlanTests(TestCase):
+    databases = TEST_DATABASES
+
+    def test_uses_index(self):
+        self.assertTrue(uses_index('3 0 0 SEARCH analytics_pageview USING INDEX analytics_pageview_ts_idx (timestamp>?)'))
+        self.assertTrue(uses_index('Index Scan using analytics_visitor_session_idx on analytics_visitor'))
+        self.assertFalse(uses_index('2 0 0 SCAN analytics_pageview'))
+        self.assertFalse(uses_index('Seq Scan on analytics_pageview  (cost=0.00..1.01 rows=1 width=8)'))
+
+    def test_hot_queries_use_indexes(self):
+        # The seeded rows are rolled back by the command itself
+        out = StringIO()
+        call_command(
+            'benchmark_analytics_queries', rows=2000, days=60, repeat=1, assert_plans=True, stdout=out
+        )
+        self.assertNotIn('FULL SCAN', out.getvalue())
+        self.assertFalse(PageView.objects.exists())
+
+
+@requires_analytics
+@override_settings(ANALYTICS_GEOIP_DATABASE=None)
+class GeolocationTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        geolocation.get_cache().clear()
+        self.addCleanup(geolocation.get_cache().clear)
+
+    def queue(self, max_pending=1000):
+        queue = geolocation.LookupQueue(max_pending=max_pending)
+        queue._executor = mock.Mock()
+        patcher = mock.patch.object(geolocation, 'get_lookup_queue', return_value=queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return queue
+
+    def test_unknown_addresses_are_resolved_in_the_background(self):
+        queue = self.queue()
+        self.assertEqual(get_geolocation('8.8.8.8'), {'country': None, 'city': None})
+        visitors = [Visitor.objects.create(ip_address='8.8.8.8', user_agent='test') for _ in range(2)]
+        for visitor in visitors:
+            self.assertTrue(geolocation.fill_in_later(visitor))
+        # The second visitor joins the lookup already pending for the address
+        queue._executor.submit.assert_called_once_with(queue.run, '8.8.8.8')
+
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'country': 'United States', 'city': 'Mountain View'}
+        with mock.patch('analytics.geolocation.requests.get', return_value=response) as get, \
+                mock.patch('analytics.geolocation.close_old_connections'):
+            queue.run('8.8.8.8')
+        get.assert_called_once()
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(
+            list(Visitor.objects.order_by().values_list('country', 'city').distinct()), [('United States', 'Mountain View')]
+        )
+
+    def test_backlog_is_bounded(self):
+        queue = self.queue(max_pending=2)
+        for ip_address in ('8.8.8.8', '8.8.4.4', '1.1.1.1', '1.0.0.1'):
+            geolocation.fill_in_later(Visitor.objects.create(ip_address=ip_address, user_agent='test'))
+
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue._executor.submit.call_count, 2)
+        self.assertEqual(queue.dropped, 2)
+
+    def test_private_addresses_need_no_lookup(self):
+        self.assertEqual(get_geolocation('192.168.1.20'), {'country': 'Local', 'city': 'Local'})
+
+    @override_settings(ANALYTICS_GEOIP_DEFERRED=False)
+    def test_without_deferred_lookups_the_location_is_unknown(self):
+        self.assertEqual(get_geolocation('8.8.8.8'), {'country': 'Unknown', 'city': 'Unknown'})
+
+
+@requires_analytics
+class LivenessTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        # A file cache stands in for a cache shared by every worker
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        shared = self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.directory},
+        }, ANALYTICS_REALTIME_CACHE='shared', ANALYTICS_LIVENESS_FLUSH_INTERVAL=60)
+        shared.enable()
+        self.addCleanup(shared.disable)
+        patcher = mock.patch.object(liveness, '_checked_interval', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.visitor = Visitor.objects.create(ip_address='127.0.0.1', user_agent='test', session_key='abc')
+        self.created = Visitor.objects.get().last_visit
+        # The start of a flush interval
+        self.start = timezone.now().replace(microsecond=0) - timedelta(minutes=10)
+        self.start -= timedelta(seconds=int(self.start.timestamp()) % 60)
+        SessionData.objects.create(visitor=self.visitor, session_key='abc', start_time=self.start)
+
+    def last_visit(self):
+        return Visitor.objects.get().last_visit
+
+    def test_ticks_are_coalesced_until_the_interval_closes(self):
+        with mock.patch.object(liveness, 'flush_due'):
+            for seconds in (10, 30, 45):
+                liveness.touch(self.visitor, self.start + timedelta(seconds=seconds))
+        self.assertEqual(self.last_visit(), self.created)
+        # Listed once however often it ticked
+        self.assertEqual(caches['shared'].get(liveness.interval_key(liveness.interval_for(self.start), 'slots')), 1)
+
+        # Still open (within the grace period)
+        self.assertEqual(liveness.flush(self.start + timedelta(seconds=62)), 0)
+        with self.assertNumQueries(1, using=analytics_db()):
+            self.assertEqual(liveness.flush(self.start + timedelta(seconds=70)), 1)
+        self.assertEqual(self.last_visit(), self.start + timedelta(seconds=45))
+        # Each interval is written once
+        self.assertEqual(liveness.flush(self.start + timedelta(seconds=90)), 0)
+
+    def test_a_request_after_the_interval_flushes_it(self):
+        liveness.touch(self.visitor, self.start + timedelta(seconds=30))
+        self.assertEqual(self.last_visit(), self.created)
+        liveness.touch(self.visitor, self.start + timedelta(seconds=80))
+        self.assertEqual(self.last_visit(), self.start + timedelta(seconds=80))
+
+    def test_sessions_are_left_to_the_sessionizer(self):
+        liveness.touch(self.visitor, self.start + timedelta(seconds=30))
+        liveness.flush(self.start + timedelta(seconds=70))
+        session = SessionData.objects.get()
+        self.assertEqual((session.end_time, session.duration), (None, None))
+
+    def test_without_a_shared_cache_ticks_are_written_directly(self):
+        with self.settings(ANALYTICS_REALTIME_CACHE='default'):
+            liveness.touch(self.visitor, self.start + timedelta(seconds=30))
+        self.assertEqual(self.last_visit(), self.start + timedelta(seconds=30))
+
+
+def log_record(event_type, data, session_key='log-session'):
+    return {'t': time.time(), 's': session_key, 'ip': '10.0.0.1', 'ua': 'test', 'e': event_type, 'd': data}
+
+
+@requires_analytics
+class EventLogTests(TestCase):
+    databases = TEST_DATABASES
+    url = 'https://example.com/about/'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def segment_from(self, pid):
+        """A segment whose writer (with this PID) never sealed it"""
+        with mock.patch('analytics.eventlog.os.getpid', return_value=pid):
+            log = eventlog.SegmentLog(self.directory, max_age=60)
+            log.append([
+                log_record('page_view', {'url': self.url, 'path': '/about/'}),
+                log_record('page_unload', {'url': self.url, 'time_spent': 1500}),
+            ])
+        self.addCleanup(log._file.close)
+        return os.path.basename(log._path)
+
+    def open_segments(self):
+        return os.listdir(os.path.join(self.directory, eventlog.OPEN_DIR))
+
+    def test_orphaned_segment_is_sealed_and_compacted(self):
+        name = self.segment_from(pid=4242)
+        with mock.patch.object(eventlog, 'pid_alive', return_value=False):
+            results = compaction.compact(directory=self.directory)
+
+        self.assertEqual([(result.segment, result.records) for result in results], [(name, 2)])
+        self.assertEqual(self.open_segments(), [])
+        self.assertEqual(PageView.objects.get().time_spent, timedelta(milliseconds=1500))
+
+    def test_live_writers_segment_is_sealed_once_idle(self):
+        name = self.segment_from(pid=4242)
+        with mock.patch.object(eventlog, 'pid_alive', return_value=True):
+            self.assertEqual(eventlog.seal_orphans(self.directory, max_age=60), [])
+            self.assertEqual(self.open_segments(), [name])
+
+            idle = time.time() - 120
+            os.utime(os.path.join(self.directory, eventlog.OPEN_DIR, name), (idle, idle))
+            self.assertEqual(eventlog.seal_orphans(self.directory, max_age=60), [name])
+        self.assertEqual(self.open_segments(), [])
+
+    def test_unloads_are_applied_in_bulk(self):
+        def load(pages):
+            records = []
+            for number in range(pages):
+                url = f'https://example.com/{pages}/{number}/'
+                records.append(log_record('page_view', {'url': url}, session_key=f'pages-{pages}'))
+                records.append(log_record('page_unload', {'url': url, 'time_spent': 1000}, session_key=f'pages-{pages}'))
+            with CaptureQueriesContext(connections[analytics_db()]) as context:
+                compaction.load(records)
+            return len(context.captured_queries)
+
+        self.assertEqual(load(2), load(20))
+        self.assertEqual(PageView.objects.filter(time_spent=timedelta(seconds=1)).count(), 22)
+        self.assertEqual(Visitor.objects.get(session_key='pages-20').total_time_spent, timedelta(seconds=20))
+
+
+@requires_analytics
+class RollupTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.start_date = today - timedelta(days=5)
+        self.end_date = today - timedelta(days=1)
+        noon = day_start(today) + timedelta(hours=12)
+        for number in range(12):
+            seen = noon - timedelta(days=1 + number % 4, minutes=number)
+            visitor = Visitor.objects.create(
+                ip_address='10.0.0.1', user_agent='test', session_key=f'session-{number}',
+                device_type=('mobile', 'desktop')[number % 2], browser='Firefox',
+                country=('India', None, 'Nepal')[number % 3]
+            )
+            Visitor.objects.filter(pk=visitor.pk).update(first_visit=seen)
+            for page in range(1 + number % 3):
+                PageView.objects.create(
+                    visitor=visitor, url='https://example.com/', path=f'/page-{page}/', page_title=f'Page {page}',
+                    timestamp=seen + timedelta(minutes=page)
+                )
+            TrafficSource.objects.create(
+                visitor=visitor, source_type=('direct', 'google')[number % 2], source_name='Direct', first_visit=seen
+            )
+
+    def breakdowns(self):
+        return (
+            aggregation.top_pages(self.start_date, self.end_date, 24),
+            aggregation.traffic_sources(self.start_date, self.end_date, 12),
+            aggregation.visitor_breakdown('device_type', self.start_date, self.end_date),
+            aggregation.visitor_breakdown('browser', self.start_date, self.end_date),
+            aggregation.visitor_breakdown('country', self.start_date, self.end_date),
+        )
+
+    def test_breakdowns_are_read_from_rollups(self):
+        raw = self.breakdowns()
+        rolled_up = rollups.rollup(days=6)
+        self.assertEqual(DailyStats.objects.filter(date__range=[self.start_date, self.end_date], is_final=True).count(), 5)
+        self.assertTrue(DailyDimension.objects.exists())
+        self.assertEqual(len(rolled_up), 7)
+
+        with CaptureQueriesContext(connections[analytics_db()]) as context:
+            self.assertEqual(self.breakdowns(), raw)
+        raw_tables = ('"analytics_pageview"', '"analytics_visitor"', '"analytics_trafficsource"')
+        self.assertFalse([query for query in context.captured_queries if any(t in query['sql'] for t in raw_tables)])
+
+
+    def snapshot(self):
+        fields = [field.name for field in DailyStats._meta.fields if field.name not in ('id', 'computed_at')]
+        return (
+            list(DailyStats.objects.order_by('date').values(*fields)),
+            sorted(DailyDimension.objects.values_list('date', 'dimension', 'value', 'label', 'count'), key=repr),
+        )
+
+    def test_rollup_is_idempotent(self):
+        today = timezone.localdate()
+        self.assertEqual(len(rollups.rollup(days=6)), 7)
+        first = self.snapshot()
+
+        # Final days are skipped; only the open day is computed again
+        self.assertEqual(rollups.rollup(days=6), [today])
+        self.assertEqual(self.snapshot(), first)
+        rollups.rollup(days=6, rebuild=True)
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(sum(stats['total_page_views'] for stats in first[0]), 24)
+
+@requires_analytics
+class UserAgentTests(SimpleTestCase):
+
+    def setUp(self):
+        user_agents.clear_cache()
+
+    def test_known_browsers(self):
+        cases = [
+            ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+             'Chrome/120.0 Safari/537.36', ('desktop', 'Chrome', 'Windows', False)),
+            ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+             'Chrome/120.0 Safari/537.36 Edg/120.0', ('desktop', 'Edge', 'Windows', False)),
+            ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+             'Version/17.0 Mobile/15E148 Safari/604.1', ('mobile', 'Safari', 'macOS', True)),
+            ('Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) '
+             'Version/17.0 Safari/604.1', ('tablet', 'Safari', 'macOS', False)),
+            ('Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) '
+             'Chrome/120.0 Mobile Safari/537.36', ('mobile', 'Chrome', 'Linux', True)),
+            ('Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0',
+             ('desktop', 'Firefox', 'Linux', False)),
+            # Tokens inside longer ones: "windows phone" and "opera mini"
+            ('Mozilla/5.0 (Windows Phone 10.0; Android 6.0.1; Microsoft; Lumia 950) AppleWebKit/537.36 '
+             '(KHTML, like Gecko) Chrome/52.0 Mobile Safari/537.36 Edge/15.14977', ('mobile', 'Edge', 'Windows', True)),
+            ('Opera/9.80 (J2ME/MIDP; Opera Mini/9.80 (S60; SymbOS; Opera Mobi/23.348; U; en) Presto/2.5.25',
+             ('desktop', 'Opera', 'Unknown', True)),
+        ]
+        for user_agent, expected in cases:
+            with self.subTest(user_agent=user_agent):
+                info = user_agents.classify(user_agent)
+                self.assertEqual((info.device_type, info.browser, info.os, info.is_mobile), expected)
+                self.assertFalse(info.is_bot)
+
+    def test_unknown_user_agents(self):
+        for user_agent in ('curl/8.4.0', '', None):
+            with self.subTest(user_agent=user_agent):
+                self.assertEqual(
+                    user_agents.classify(user_agent),
+                    user_agents.UserAgentInfo('desktop', 'Unknown', 'Unknown', False, False)
+                )
+
+    def test_bots(self):
+        for user_agent in (
+            'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)',
+            'Mozilla/5.0 (compatible; bingbot/2.0; +http://www.bing.com/bingbot.htm)',
+            'Mozilla/5.0 (compatible; Baiduspider/2.0; +http://www.baidu.com/search/spider.html)',
+            'Mozilla/5.0 (compatible; Yahoo! Slurp; http://help.yahoo.com/help/us/ysearch/slurp)',
+            'facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)',
+            'AhrefsBot-Crawler/7.0',
+        ):
+            with self.subTest(user_agent=user_agent):
+                self.assertTrue(user_agents.classify(user_agent).is_bot)
+
+    def test_repeated_user_agents_are_cached(self):
+        for _ in range(3):
+            user_agents.classify('curl/8.4.0')
+        self.assertEqual(user_agents.cache_stats()['hits'], 2)
+
+
+@requires_analytics
+class ExportTests(TestCase):
+    databases = TEST_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.day = timezone.localdate() - timedelta(days=2)
+        start = day_start(cls.day)
+        visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        # Six views inside the day, including both of its edges, and one on each neighbouring day
+        moments = [timedelta(0), timedelta(hours=6), timedelta(hours=12), timedelta(hours=18),
+                   timedelta(hours=23, minutes=59), timedelta(days=1, microseconds=-1),
+                   timedelta(microseconds=-1), timedelta(days=1)]
+        for number, moment in enumerate(moments):
+            PageView.objects.create(
+                visitor=visitor, url='https://example.com/', path=f'/{number}/', timestamp=start + moment
+            )
+
+    def paths(self, chunk_size):
+        pages = list(exports.export_rows('page_views', self.day, self.day, chunk_size=chunk_size))
+        return [len(rows) for rows in pages], [row[2] for rows in pages for row in rows]
+
+    def test_pages_cover_every_row_once(self):
+        expected = ['/0/', '/1/', '/2/', '/3/', '/4/', '/5/']
+        for chunk_size, sizes in ((1, [1] * 6), (3, [3, 3]), (4, [4, 2]), (6, [6]), (100, [6])):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.paths(chunk_size), (sizes, expected))
+
+    def test_each_page_is_one_keyset_query(self):
+        with self.assertNumQueries(3, using=analytics_db()):
+            self.paths(chunk_size=3)
+        # A short last page ends the export without another query
+        with self.assertNumQueries(2, using=analytics_db()):
+            self.paths(chunk_size=4)
+
+    def test_empty_range(self):
+        day = self.day - timedelta(days=5)
+        self.assertEqual(list(exports.export_rows('page_views', day, day)), [])
+        self.assertEqual(''.join(exports.export_stream('page_views', 'json', day, day)), '[]')
+
+    def test_columnar_round_trip_across_pages(self):
+        stream = b''.join(exports.export_stream('page_views', 'columnar', self.day, self.day, chunk_size=4))
+        rows = list(exports.read_columnar(BytesIO(stream)))
+        self.assertEqual([row['path'] for row in rows], ['/0/', '/1/', '/2/', '/3/', '/4/', '/5/'])
+
+
+@requires_analytics
+class DateRangeTests(TestCase):
+    databases = TEST_DATABASES
+
+    def create_views(self, day):
+        """Views at both edges of a local day and just outside it"""
+        visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        start, end = day_start(day), day_start(day + timedelta(days=1))
+        for moment in (start - timedelta(microseconds=1), start, start + timedelta(hours=12),
+                       end - timedelta(microseconds=1), end):
+            PageView.objects.create(visitor=visitor, url='https://example.com/', path='/', timestamp=moment)
+
+    def test_bounds_match_local_dates(self):
+        # A day with a DST change is 23 or 25 hours long
+        cases = [
+            ('Asia/Kolkata', timezone.localdate()),
+            ('UTC', timezone.localdate()),
+            ('America/New_York', date(2026, 3, 8)),
+            ('America/New_York', date(2026, 11, 1)),
+        ]
+        for time_zone, day in cases:
+            with self.subTest(time_zone=time_zone, day=day), self.settings(TIME_ZONE=time_zone):
+                PageView.objects.all().delete()
+                self.create_views(day)
+                expected = set(PageView.objects.filter(timestamp__date=day).values_list('pk', flat=True))
+                self.assertEqual(len(expected), 3)
+                self.assertEqual(set(PageView.objects.on_date(day).values_list('pk', flat=True)), expected)
+                self.assertEqual(
+                    set(PageView.objects.in_date_range(day - timedelta(days=1), day).values_list('pk', flat=True)),
+                    set(PageView.objects.filter(
+                        timestamp__date__range=[day - timedelta(days=1), day]
+                    ).values_list('pk', flat=True))
+                )
+
+    def test_filters_compare_the_raw_column(self):
+        day = timezone.localdate()
+        sql = str(PageView.objects.in_date_range(day - timedelta(days=7), day).query)
+        self.assertNotIn('cast_date', sql.lower())
+        self.assertNotIn('AT TIME ZONE', sql)
+
+    def test_consecutive_days_share_one_range(self):
+        day = timezone.localdate()
+        days = [day, day - timedelta(days=1), day - timedelta(days=2), day - timedelta(days=5)]
+        self.assertEqual(day_runs(days), [
+            [day - timedelta(days=5), day - timedelta(days=5)], [day - timedelta(days=2), day],
+        ])
+        # Every view but the one just before day - 3 falls inside the second run
+        self.create_views(day - timedelta(days=2))
+        self.assertEqual(PageView.objects.on_dates(days).count(), 4)
+
+
+@requires_analytics
+class RetentionTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cutoff = retention.retention_cutoff(30)
+        visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        for number in range(25):
+            PageView.objects.create(
+                visitor=visitor, url='https://example.com/', path=f'/old-{number}/',
+                timestamp=self.cutoff - timedelta(days=1, minutes=number)
+            )
+        for number in range(5):
+            PageView.objects.create(
+                visitor=visitor, url='https://example.com/', path=f'/kept-{number}/',
+                timestamp=self.cutoff + timedelta(minutes=number)
+            )
+
+    def archived_paths(self):
+        archive = retention.Archive(self.directory, PageView, self.cutoff)
+        with gzip.open(archive.path, 'rt') as rows:
+            return sorted(json.loads(row)['path'] for row in rows)
+
+    def test_interrupted_run_resumes(self):
+        write = retention.Archive.write
+        calls = []
+
+        def crash_on_second_batch(archive, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            write(archive, rows)
+
+        with mock.patch.object(retention.Archive, 'write', crash_on_second_batch), self.assertRaises(RuntimeError):
+            retention.expire(PageView, self.cutoff, batch_size=10, archive_dir=self.directory, pause=0)
+        # The first batch was committed, the second rolled back
+        self.assertEqual(PageView.objects.count(), 20)
+
+        result = retention.expire(PageView, self.cutoff, batch_size=10, archive_dir=self.directory, pause=0)
+        self.assertEqual((result.deleted, result.archived, result.complete), (15, 15, True))
+        self.assertEqual(sorted(PageView.objects.values_list('path', flat=True)), [f'/kept-{n}/' for n in range(5)])
+        self.assertEqual(self.archived_paths(), sorted(f'/old-{n}/' for n in range(25)))
+
+    def test_time_budget_stops_between_batches(self):
+        result = retention.expire(PageView, self.cutoff, batch_size=10, time_budget=0, pause=0)
+        self.assertEqual((result.deleted, result.complete), (0, False))
+
+        result = retention.expire(PageView, self.cutoff, batch_size=10, pause=0)
+        self.assertEqual((result.deleted, result.complete), (25, True))
+        self.assertEqual(PageView.objects.count(), 5)
+
+
+@requires_analytics
+@override_settings(ANALYTICS_SESSION_TIMEOUT_MINUTES=30)
+class SessionizationTests(TestCase):
+    databases = TEST_DATABASES
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        self.visitor = Visitor.objects.create(ip_address='10.0.0.1', user_agent='test')
+        self.session = SessionData.objects.create(visitor=self.visitor, session_key='abc', start_time=self.start)
+        # Two sessions: a 45 minute gap splits them
+        for minutes in (0, 5, 50, 52):
+            PageView.objects.create(
+                visitor=self.visitor, url='https://example.com/', path=f'/{minutes}/',
+                timestamp=self.start + timedelta(minutes=minutes)
+            )
+        self.bouncer = Visitor.objects.create(ip_address='10.0.0.2', user_agent='test')
+        PageView.objects.create(visitor=self.bouncer, url='https://example.com/', path='/bounce/', timestamp=self.start)
+
+    def flags(self):
+        return {
+            path: (exit_page, bounce, time_spent)
+            for path, exit_page, bounce, time_spent in PageView.objects.values_list(
+                'path', 'exit_page', 'bounce', 'time_spent'
+            )
+        }
+
+    def test_views_are_flagged_up_to_the_watermark(self):
+        # The watermark trails "now" by the timeout: start + 40 minutes
+        result = sessionization.sessionize(now=self.start + timedelta(minutes=70))
+        self.assertEqual(result.watermark, self.start + timedelta(minutes=40))
+        self.assertEqual(result.page_views, 3)
+        flags = self.flags()
+        self.assertEqual(flags['/0/'], (False, False, timedelta(minutes=5)))
+        self.assertEqual(flags['/5/'], (True, False, None))
+        self.assertEqual(flags['/bounce/'], (True, True, None))
+        # Past the watermark: not flagged yet
+        self.assertEqual(flags['/50/'], (False, False, None))
+        self.assertEqual(sessionization.sessionized_until(), self.start + timedelta(minutes=40))
+
+        result = sessionization.sessionize(now=self.start + timedelta(hours=2))
+        self.assertEqual(result.page_views, 2)
+        flags = self.flags()
+        self.assertEqual(flags['/50/'], (False, False, timedelta(minutes=2)))
+        self.assertEqual(flags['/52/'], (True, False, None))
+
+    def test_rerun_at_the_same_time_does_nothing(self):
+        now = self.start + timedelta(hours=2)
+        sessionization.sessionize(now=now)
+        flags = self.flags()
+        result = sessionization.sessionize(now=now)
+        self.assertEqual((result.page_views, result.updated), (0, 0))
+        self.assertEqual(self.flags(), flags)
+
+    def test_session_is_closed_at_its_last_view(self):
+        sessionization.sessionize(now=self.start + timedelta(hours=2))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.end_time, self.start + timedelta(minutes=52))
+        self.assertEqual(self.session.duration, timedelta(minutes=52))
+
+
+@requires_analytics
+@override_settings(ANALYTICS_CONVERSION_PATHS=['/contact/'], ANALYTICS_CONVERSION_WINDOW=120)
+class DashboardMetricTests(TestCase):
+    databases = TEST_DATABASES
+
+    def submit(self, model, created_at, **fields):
+        submission = model.objects.create(name='Asha', email='asha@example.com', phone='9876543210', **fields)
+        model.objects.filter(pk=submission.pk).update(created_at=created_at)
+
+    def form_submit(self, visitor, timestamp, url='https://example.com/contact/'):
+        event = Event.objects.create(visitor=visitor, event_type='form_submit', event_name='Contact', page_url=url)
+        Event.objects.filter(pk=event.pk).update(timestamp=timestamp)
+
+    def test_submissions_are_matched_to_the_nearest_form_submit(self):
+        now = timezone.now() - timedelta(hours=1)
+        first, second = (Visitor.objects.create(ip_address='10.0.0.1', user_agent='test') for _ in range(2))
+        self.form_submit(first, now - timedelta(seconds=5))
+        self.form_submit(second, now + timedelta(seconds=20))
+        # Outside the window, or not on a conversion page
+        self.form_submit(second, now + timedelta(hours=2))
+        self.form_submit(first, now + timedelta(minutes=30), url='https://example.com/newsletter/')
+
+        self.submit(ContactInquiry, now, inquiry_type='website', subject='Hello', message='Hi')
+        self.submit(ContactInquiry, now + timedelta(seconds=15), inquiry_type='website', subject='Hello', message='Hi')
+        self.submit(
+            QuoteRequest, now + timedelta(minutes=30), clinic_name='MediWell', specialization='Dental',
+            location='Pune', service_type='website', specific_requirements='Site', budget_range='Any', timeline='Soon'
+        )
+
+        today = timezone.localdate()
+        self.assertEqual(aggregation.conversions(today - timedelta(days=1), today), (3, 2))
+
+    def test_engagement_score(self):
+        summary = {'visits': 10, 'bounce_rate': 50.0, 'total_page_views': 25, 'avg_duration': timedelta(seconds=90)}
+        # (0.5 + 0.5 + 0.5) / 3 * 10
+        self.assertEqual(aggregation.engagement_score(summary), 5.0)
+        self.assertEqual(aggregation.engagement_score(dict(summary, visits=0)), 0.0)
+
+    def test_device_mix_and_geography(self):
+        devices = [{'device_type': 'mobile', 'count': 3}, {'device_type': 'desktop', 'count': 1}]
+        self.assertEqual(aggregation.device_mix(devices), {'mobile': 75.0, 'desktop': 25.0, 'tablet': 0})
+
+        countries = [{'country': name, 'count': count} for name, count in (('India', 6), ('Nepal', 2), ('Oman', 2))]
+        self.assertEqual(aggregation.geographic_data(countries, limit=2), [
+            {'country': 'India', 'visitors': 6, 'percentage': 60.0},
+            {'country': 'Nepal', 'visitors': 2, 'percentage': 20.0},
+            {'country': 'Others', 'visitors': 2, 'percentage': 20.0},
+        ])
+
+
+@requires_analytics
+class HistogramTests(SimpleTestCase):
+
+    def samples(self, count=5000, seed=1):
+        generator = random.Random(seed)
+        # Load times in milliseconds: roughly 200ms to 20s
+        return [generator.lognormvariate(7, 0.8) for _ in range(count)]
+
+    def exact(self, samples, q):
+        ordered = sorted(samples)
+        return ordered[max(math.ceil(q * len(ordered)), 1) - 1]
+
+    def assertWithinOnePercent(self, estimate, exact):
+        self.assertLessEqual(abs(estimate - exact) / exact, 0.01, (estimate, exact))
+
+    def test_quantiles_are_within_one_percent(self):
+        samples = self.samples()
+        histogram = histograms.LogHistogram()
+        for value in samples:
+            histogram.add(value)
+        for q in (0.01, 0.5, 0.75, 0.95, 0.99, 1.0):
+            with self.subTest(q=q):
+                self.assertWithinOnePercent(histogram.quantile(q), self.exact(samples, q))
+        self.assertAlmostEqual(histogram.mean, sum(samples) / len(samples))
+
+    def test_merged_digests_match_one_histogram(self):
+        days = [self.samples(1000, seed=day) for day in range(7)]
+        merged = histograms.LogHistogram()
+        for samples in days:
+            digest = histograms.LogHistogram()
+            for value in samples:
+                digest.add(value)
+            # Stored as JSON and read back, as TimingDigest does
+            merged.merge(histograms.LogHistogram.from_json(json.loads(json.dumps(digest.to_json())), digest.total))
+        everything = [value for samples in days for value in samples]
+        self.assertEqual(merged.count, len(everything))
+        self.assertWithinOnePercent(merged.quantile(0.75), self.exact(everything, 0.75))
+
+    def test_zero_and_empty(self):
+        histogram = histograms.LogHistogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        self.assertIsNone(histogram.mean)
+        for value in (0, 0, 0, 0.1):
+            histogram.add(value)
+        self.assertEqual(histogram.quantile(0.75), 0.0)
+        self.assertWithinOnePercent(histogram.quantile(1.0), 0.1)
+
+
+@requires_analytics
+class PageTitleTests(SimpleTestCase):
+
+    def setUp(self):
+        with mock.patch('analytics.middleware.scheduler.start'):
+            self.middleware = AnalyticsMiddleware(lambda request: HttpResponse())
+        self.request = RequestFactory().get('/about/')
+
+    def extract(self, response):
+        return self.middleware.extract_page_title(self.request, response)
+
+    def test_title_recorded_while_rendering(self):
+        self.request.page_title = '  About &amp; Us\n - Mediwell  '
+        response = HttpResponse('<title>Ignored</title>')
+        self.assertEqual(self.extract(response), 'About & Us - Mediwell')
+
+    def test_scans_the_start_of_html(self):
+        response = HttpResponse('<html><head><title lang="en">Caf\u00e9 Menu</title></head></html>')
+        self.assertEqual(self.extract(response), 'Caf\u00e9 Menu')
+
+    @override_settings(ANALYTICS_TITLE_SCAN_BYTES=64)
+    def test_scan_is_bounded(self):
+        response = HttpResponse('<html>' + ' ' * 64 + '<title>Too late</title></html>')
+        self.assertIsNone(self.extract(response))
+
+    def test_skips_non_html_and_streaming(self):
+        self.assertIsNone(self.extract(HttpResponse('<title>Data</title>', content_type='application/json')))
+        streaming = StreamingHttpResponse(iter([b'<title>Stream</title>']), content_type='text/html')
+        self.assertIsNone(self.extract(streaming))
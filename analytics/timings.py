@@ -0,0 +1,82 @@
+import math
+from collections import defaultdict
+
+from django.db import transaction
+
+from .histograms import LogHistogram
+from .models import PageTiming, TimingDigest
+from .routers import analytics_db
+
+# Anything slower than ten minutes is a broken clock, not a page load
+MAX_TIMING = 600000
+
+
+def clean_metric(value):
+    """Client-reported timing as a float, or None when missing or implausible"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value) or value < 0 or value > MAX_TIMING:
+        return None
+    return value
+
+
+def collect(queryset, histograms=None):
+    """Stream timing samples into {(path, metric): LogHistogram}"""
+    histograms = histograms if histograms is not None else defaultdict(LogHistogram)
+    for row in queryset.order_by().values_list('path', *PageTiming.METRICS).iterator(chunk_size=2000):
+        path = row[0]
+        for metric, value in zip(PageTiming.METRICS, row[1:]):
+            if value is not None:
+                histograms[path, metric].add(value)
+    return histograms
+
+
+def load_digests(days, histograms=None, path=None):
+    """Merge stored daily digests into {(path, metric): LogHistogram}"""
+    histograms = histograms if histograms is not None else defaultdict(LogHistogram)
+    digests = TimingDigest.objects.filter(date__in=days)
+    if path is not None:
+        digests = digests.filter(path=path)
+    for digest_path, metric, buckets, total in digests.values_list('path', 'metric', 'buckets', 'total').iterator():
+        histograms[digest_path, metric].merge(LogHistogram.from_json(buckets, total))
+    return histograms
+
+
+def daily_digests(days, metric, path=None):
+    """Stored digests of one metric as {date: LogHistogram}"""
+    daily = defaultdict(LogHistogram)
+    digests = TimingDigest.objects.filter(date__in=days, metric=metric)
+    if path is not None:
+        digests = digests.filter(path=path)
+    for day, buckets, total in digests.values_list('date', 'buckets', 'total').iterator():
+        daily[day].merge(LogHistogram.from_json(buckets, total))
+    return daily
+
+
+def by_metric(histograms):
+    """Merge per-path histograms into one per metric"""
+    merged = defaultdict(LogHistogram)
+    for (_, metric), histogram in histograms.items():
+        merged[metric].merge(histogram)
+    return merged
+
+
+def rollup_timing_day(day):
+    """Replace a day's digests with histograms of its raw samples"""
+    histograms = collect(PageTiming.objects.on_date(day))
+    with transaction.atomic(using=analytics_db()):
+        TimingDigest.objects.filter(date=day).delete()
+        TimingDigest.objects.bulk_create([
+            TimingDigest(
+                date=day,
+                path=path,
+                metric=metric,
+                count=histogram.count,
+                total=histogram.total,
+                buckets=histogram.to_json(),
+            )
+            for (path, metric), histogram in histograms.items()
+        ], batch_size=500)
+    return len(histograms)
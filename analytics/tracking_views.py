@@ -3,24 +3,50 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.db import transaction
+from django.conf import settings
 import json
+import logging
+import math
+import time
 import uuid
 from datetime import timedelta
 
-from .models import Visitor, PageView, Event, SessionData
+from .models import Visitor, PageView, Event, SessionData, PageTiming
 from .utils import get_visitor_info, parse_user_agent, get_geolocation
+from .routers import analytics_db
+from . import counters, eventlog, geolocation, liveness, realtime, timings, user_agents
+
+logger = logging.getLogger(__name__)
+
+# A day on one page is a tab left open, not reading time
+MAX_TIME_SPENT = 24 * 60 * 60 * 1000
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def track_event(request):
     """Track analytics events from JavaScript"""
     try:
-        data = json.loads(request.body)
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'status': 'error', 'message': 'Expected an event object'}, status=400)
         event_type = data.get('event_type')
-        event_data = data.get('data', {})
+        event_data = data.get('data') or {}
+        if isinstance(event_data, dict):
+            event_data = clean_event(event_type, event_data)
+        if not isinstance(event_data, dict):
+            return JsonResponse({'status': 'error', 'message': 'Invalid event data'}, status=400)
+        
+        # Log mode: append and let the compactor do the database work
+        if eventlog.event_log_enabled():
+            if event_type in BATCH_EVENT_TYPES and isinstance(event_data, dict):
+                eventlog.append([log_record(request, event_type, event_data)])
+            return JsonResponse({'status': 'success'})
         
-        # Get or create visitor
-        visitor = get_or_create_visitor(request)
+        # Get or create visitor; heartbeats record liveness themselves
+        visitor = get_or_create_visitor(request, touch=event_type != 'heartbeat')
         if not visitor:
             return JsonResponse({'status': 'error', 'message': 'Could not create visitor'}, status=400)
         
@@ -43,21 +69,193 @@ def track_event(request):
             handle_download(visitor, event_data)
         elif event_type == 'heartbeat':
             handle_heartbeat(visitor, event_data)
+        elif event_type == 'page_timing':
+            handle_page_timing(visitor, event_data)
         
         return JsonResponse({'status': 'success'})
         
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
-def get_or_create_visitor(request):
+@csrf_exempt
+@require_http_methods(["POST"])
+def track_batch(request):
+    """Track a batch of events sent by the JavaScript queue"""
+    try:
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+        events = data.get('events') if isinstance(data, dict) else data
+        if not isinstance(events, list):
+            return JsonResponse({'status': 'error', 'message': 'Expected a list of events'}, status=400)
+        max_events = getattr(settings, 'ANALYTICS_BATCH_MAX_EVENTS', 100)
+        if len(events) > max_events:
+            return JsonResponse({'status': 'error', 'message': f'At most {max_events} events per batch'}, status=400)
+
+        # Bad events are dropped and counted here, before anything is written
+        valid = clean_batch(events)
+        if not valid:
+            return JsonResponse({'status': 'success', 'accepted': 0, 'rejected': len(events)})
+
+        if eventlog.event_log_enabled():
+            eventlog.append([log_record(request, event_type, event_data) for event_type, event_data in valid])
+            return JsonResponse({'status': 'success', 'accepted': len(valid), 'rejected': len(events) - len(valid)})
+
+        # One visitor lookup per batch; its counters are updated in bulk below
+        visitor = get_or_create_visitor(request, touch=False)
+        if not visitor:
+            return JsonResponse({'status': 'error', 'message': 'Could not create visitor'}, status=400)
+
+        save_batch(visitor, valid)
+        return JsonResponse({'status': 'success', 'accepted': len(valid), 'rejected': len(events) - len(valid)})
+
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+def clean_batch(events):
+    """(event_type, data) pairs for the storable events of a client batch"""
+    valid = []
+    for item in events:
+        if not isinstance(item, dict) or item.get('event_type') not in BATCH_EVENT_TYPES:
+            continue
+        data = item.get('data') or {}
+        if not isinstance(data, dict):
+            continue
+        data = clean_event(item['event_type'], data)
+        if data is not None:
+            valid.append((item['event_type'], data))
+    return valid
+
+def clean_event(event_type, data):
+    """Client event data with its typed fields coerced, or None when they are unusable"""
+    if event_type == 'page_unload':
+        time_spent = clean_time_spent(data.get('time_spent', 0))
+        if time_spent is None:
+            return None
+        return {**data, 'url': clip(data.get('url'), 200), 'time_spent': time_spent}
+    return data
+
+def clean_time_spent(value):
+    """Client-reported milliseconds on a page, or None when missing a number or implausible"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(value) or value < 0 or value > MAX_TIME_SPENT:
+        return None
+    return value
+
+def save_batch(visitor, events):
+    """Persist validated (event_type, data) pairs with bulk writes"""
+    now = timezone.now()
+    page_views = []
+    event_rows = []
+    page_timings = []
+    unloads = []
+    for event_type, data in events:
+        if event_type == 'page_view':
+            page_views.append(build_page_view(visitor, data, now))
+        elif event_type == 'page_timing':
+            page_timings.append(build_page_timing(visitor, data, now))
+        elif event_type == 'page_unload':
+            unloads.append(data)
+        elif event_type in EVENT_BUILDERS:
+            event_rows.append(build_event(event_type, visitor, data, now))
+
+    if not (page_views or event_rows or page_timings or unloads):
+        # Heartbeat-only batch
+        liveness.touch(visitor, now)
+        realtime.record(visitor.pk)
+        return
+
+    with transaction.atomic(using=analytics_db()):
+        PageView.objects.bulk_create(page_views)
+        Event.objects.bulk_create(event_rows)
+        PageTiming.objects.bulk_create(page_timings)
+
+        time_spent = timedelta(0)
+        for data in unloads:
+            time_spent += record_time_spent(visitor, data)
+
+        counters.increment_visitor(
+            visitor.pk,
+            last_visit=now,
+            total_page_views=len(page_views),
+            total_time_spent=time_spent
+        )
+        update_session_stats(visitor, page_views=len(page_views))
+
+    for page_view in page_views:
+        realtime.record(visitor.pk, page_view.path)
+    if not page_views:
+        realtime.record(visitor.pk)
+
+def log_record(request, event_type, data):
+    """Everything the compactor needs to replay an event without this request"""
+    return {
+        't': time.time(),
+        's': request.session.session_key,
+        'ip': get_client_ip(request),
+        'ua': request.META.get('HTTP_USER_AGENT', ''),
+        'e': event_type,
+        'd': data,
+    }
+
+def build_page_view(visitor, data, now=None):
+    """Build a PageView from client data, clipped to the column sizes"""
+    return PageView(
+        visitor=visitor,
+        url=clip(data.get('url'), 200),
+        path=clip(data.get('path'), 500),
+        page_title=clip(data.get('title'), 200),
+        referrer=clip(data.get('referrer'), 200),
+        timestamp=now or timezone.now()
+    )
+
+def build_page_timing(visitor, data, now=None):
+    """Build a PageTiming from a Navigation Timing / Web Vitals beacon"""
+    return PageTiming(
+        path=clip(data.get('path'), 500),
+        timestamp=now or timezone.now(),
+        **{metric: timings.clean_metric(data.get(metric)) for metric in PageTiming.METRICS}
+    )
+
+def build_event(event_type, visitor, data, now=None):
+    """Build an Event for a batched event type, clipped to the column sizes"""
+    event = EVENT_BUILDERS[event_type](visitor, data, now)
+    event.event_type = clip(event.event_type, 20)
+    event.event_name = clip(event.event_name, 100)
+    event.page_url = clip(event.page_url, 200)
+    if event.event_value is not None:
+        event.event_value = clip(event.event_value, 200)
+    return event
+
+def clip(value, length):
+    """Coerce a client-supplied value to a string that fits its column"""
+    return str(value if value is not None else '')[:length]
+
+def record_time_spent(visitor, data):
+    """Store the time spent on the visitor's latest view of a URL (data from clean_event)"""
+    page_view = PageView.objects.filter(
+        visitor=visitor,
+        url=data.get('url', '')
+    ).order_by('-timestamp').first()
+    if not page_view:
+        return timedelta(0)
+    page_view.time_spent = timedelta(milliseconds=data['time_spent'])
+    page_view.save(update_fields=['time_spent'])
+    return page_view.time_spent
+
+def get_or_create_visitor(request, touch=True):
     """Get or create visitor based on session"""
     try:
         # Try to get visitor by session
         if request.session.session_key:
             visitor = Visitor.objects.filter(session_key=request.session.session_key).first()
             if visitor:
-                visitor.last_visit = timezone.now()
-                visitor.save()
+                if touch:
+                    counters.increment_visitor(visitor.pk, last_visit=timezone.now())
                 return visitor
         
         # Get visitor info
@@ -85,6 +283,7 @@ def get_or_create_visitor(request):
             browser=device_info.get('browser'),
             operating_system=device_info.get('os')
         )
+        geolocation.fill_in_later(visitor)
         
         return visitor
         
@@ -104,12 +303,11 @@ def handle_page_view(visitor, data):
             timestamp=timezone.now()
         )
         
-        # Update visitor stats
-        visitor.total_page_views += 1
-        visitor.save()
+        # Update visitor and session stats atomically
+        counters.increment_visitor(visitor.pk, total_page_views=1)
+        update_session_stats(visitor)
         
-        # Update session stats
-        update_session_stats(visitor, data)
+        realtime.record(visitor.pk, page_view.path)
         
     except Exception as e:
         print(f"Error handling page view: {e}")
@@ -126,153 +324,193 @@ def handle_page_unload(visitor, data):
         if page_view:
             time_spent = data.get('time_spent', 0)
             page_view.time_spent = timedelta(milliseconds=time_spent)
-            page_view.save()
+            page_view.save(update_fields=['time_spent'])
             
             # Update visitor total time
-            visitor.total_time_spent += page_view.time_spent
-            visitor.save()
+            counters.increment_visitor(visitor.pk, total_time_spent=page_view.time_spent)
         
     except Exception as e:
         print(f"Error handling page unload: {e}")
 
+def build_custom_event(visitor, data, now=None):
+    """Build the Event for custom event tracking"""
+    return Event(
+        visitor=visitor,
+        event_type=data.get('event_type', 'custom'),
+        event_name=data.get('event_name', ''),
+        event_value=data.get('event_value'),
+        page_url=data.get('url', ''),
+        metadata=data.get('metadata', {}),
+        timestamp=now or timezone.now()
+    )
+
 def handle_custom_event(visitor, data):
     """Handle custom event tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type=data.get('event_type', 'custom'),
-            event_name=data.get('event_name', ''),
-            event_value=data.get('event_value'),
-            page_url=data.get('url', ''),
-            metadata=data.get('metadata', {}),
-            timestamp=timezone.now()
-        )
+        build_custom_event(visitor, data).save()
     except Exception as e:
         print(f"Error handling custom event: {e}")
 
+def build_form_submit(visitor, data, now=None):
+    """Build the Event for form submission tracking"""
+    return Event(
+        visitor=visitor,
+        event_type='form_submit',
+        event_name=f"Form: {data.get('form_id', 'unnamed')}",
+        event_value=data.get('form_action', ''),
+        page_url=data.get('url', ''),
+        metadata={
+            'form_method': data.get('form_method'),
+            'field_count': data.get('field_count'),
+            'field_names': data.get('field_names', [])
+        },
+        timestamp=now or timezone.now()
+    )
+
 def handle_form_submit(visitor, data):
     """Handle form submission tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type='form_submit',
-            event_name=f"Form: {data.get('form_id', 'unnamed')}",
-            event_value=data.get('form_action', ''),
-            page_url=data.get('url', ''),
-            metadata={
-                'form_method': data.get('form_method'),
-                'field_count': data.get('field_count'),
-                'field_names': data.get('field_names', [])
-            },
-            timestamp=timezone.now()
-        )
+        build_form_submit(visitor, data).save()
     except Exception as e:
         print(f"Error handling form submit: {e}")
 
+def build_click(visitor, data, now=None):
+    """Build the Event for click tracking"""
+    return Event(
+        visitor=visitor,
+        event_type='click',
+        event_name=f"Click: {data.get('element_tag', 'unknown')}",
+        event_value=data.get('element_text', ''),
+        page_url=data.get('url', ''),
+        metadata={
+            'element_id': data.get('element_id'),
+            'element_class': data.get('element_class'),
+            'element_text': data.get('element_text')
+        },
+        timestamp=now or timezone.now()
+    )
+
 def handle_click(visitor, data):
     """Handle click tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type='click',
-            event_name=f"Click: {data.get('element_tag', 'unknown')}",
-            event_value=data.get('element_text', ''),
-            page_url=data.get('url', ''),
-            metadata={
-                'element_id': data.get('element_id'),
-                'element_class': data.get('element_class'),
-                'element_text': data.get('element_text')
-            },
-            timestamp=timezone.now()
-        )
+        build_click(visitor, data).save()
     except Exception as e:
         print(f"Error handling click: {e}")
 
+def build_scroll_depth(visitor, data, now=None):
+    """Build the Event for scroll depth tracking"""
+    return Event(
+        visitor=visitor,
+        event_type='scroll',
+        event_name='Scroll Depth',
+        event_value=data.get('event_value', ''),
+        page_url=data.get('url', ''),
+        metadata={'scroll_percent': data.get('event_value', '')},
+        timestamp=now or timezone.now()
+    )
+
 def handle_scroll_depth(visitor, data):
     """Handle scroll depth tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type='scroll',
-            event_name='Scroll Depth',
-            event_value=data.get('event_value', ''),
-            page_url=data.get('url', ''),
-            metadata={'scroll_percent': data.get('event_value', '')},
-            timestamp=timezone.now()
-        )
+        build_scroll_depth(visitor, data).save()
     except Exception as e:
         print(f"Error handling scroll depth: {e}")
 
+def build_outbound_click(visitor, data, now=None):
+    """Build the Event for outbound link click tracking"""
+    return Event(
+        visitor=visitor,
+        event_type='outbound_click',
+        event_name='Outbound Link Click',
+        event_value=data.get('link_url', ''),
+        page_url=data.get('source_url', ''),
+        metadata={
+            'link_text': data.get('link_text'),
+            'target_url': data.get('link_url')
+        },
+        timestamp=now or timezone.now()
+    )
+
 def handle_outbound_click(visitor, data):
     """Handle outbound link click tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type='outbound_click',
-            event_name='Outbound Link Click',
-            event_value=data.get('link_url', ''),
-            page_url=data.get('source_url', ''),
-            metadata={
-                'link_text': data.get('link_text'),
-                'target_url': data.get('link_url')
-            },
-            timestamp=timezone.now()
-        )
+        build_outbound_click(visitor, data).save()
     except Exception as e:
         print(f"Error handling outbound click: {e}")
 
+def build_download(visitor, data, now=None):
+    """Build the Event for file download tracking"""
+    return Event(
+        visitor=visitor,
+        event_type='download',
+        event_name='File Download',
+        event_value=data.get('file_name', ''),
+        page_url=data.get('source_url', ''),
+        metadata={
+            'file_url': data.get('file_url'),
+            'file_type': data.get('file_type'),
+            'file_name': data.get('file_name')
+        },
+        timestamp=now or timezone.now()
+    )
+
 def handle_download(visitor, data):
     """Handle file download tracking"""
     try:
-        Event.objects.create(
-            visitor=visitor,
-            event_type='download',
-            event_name='File Download',
-            event_value=data.get('file_name', ''),
-            page_url=data.get('source_url', ''),
-            metadata={
-                'file_url': data.get('file_url'),
-                'file_type': data.get('file_type'),
-                'file_name': data.get('file_name')
-            },
-            timestamp=timezone.now()
-        )
+        build_download(visitor, data).save()
     except Exception as e:
         print(f"Error handling download: {e}")
 
+# Events that map straight onto an Event row
+EVENT_BUILDERS = {
+    'event': build_custom_event,
+    'form_submit': build_form_submit,
+    'click': build_click,
+    'scroll_depth': build_scroll_depth,
+    'outbound_click': build_outbound_click,
+    'download': build_download,
+}
+
+BATCH_EVENT_TYPES = set(EVENT_BUILDERS) | {'page_view', 'page_unload', 'page_timing', 'heartbeat'}
+
+def handle_page_timing(visitor, data):
+    """Handle page load timing tracking"""
+    try:
+        build_page_timing(visitor, data).save()
+    except Exception as e:
+        print(f"Error handling page timing: {e}")
+
 def handle_heartbeat(visitor, data):
     """Handle heartbeat tracking"""
     try:
-        # Update visitor last visit
-        visitor.last_visit = timezone.now()
-        visitor.save()
-        
-        # Update session if exists
-        update_session_stats(visitor, data)
+        # Coalesced in memory; visitor and session rows are written per interval
+        liveness.touch(visitor)
+        realtime.record(visitor.pk)
         
     except Exception as e:
         print(f"Error handling heartbeat: {e}")
 
-def update_session_stats(visitor, data):
+def update_session_stats(visitor, page_views=1):
     """Update session statistics"""
+    if not visitor.session_key:
+        return
     try:
-        if visitor.session_key:
-            session_data, created = SessionData.objects.get_or_create(
-                session_key=visitor.session_key,
-                defaults={
-                    'visitor': visitor,
-                    'start_time': timezone.now(),
-                    'is_active': True
-                }
-            )
-            
-            if not created:
-                session_data.is_active = True
-                session_data.page_views_count += 1
-                session_data.save()
-                
-    except Exception as e:
-        print(f"Error updating session stats: {e}")
+        with transaction.atomic(using=analytics_db()):
+            if counters.increment_session(visitor.session_key, page_views_count=page_views):
+                return
+            # First views of a new session: insert it empty, then count with F()
+            # so a row another worker inserted meanwhile keeps both counts
+            SessionData.objects.bulk_create([
+                SessionData(
+                    visitor=visitor,
+                    session_key=visitor.session_key,
+                    start_time=timezone.now(),
+                    is_active=True
+                )
+            ], ignore_conflicts=True)
+            counters.increment_session(visitor.session_key, page_views_count=page_views)
+    except Exception:
+        logger.exception("Error updating session stats for %s", visitor.session_key)
 
 def get_client_ip(request):
     """Get client IP address"""
@@ -285,10 +523,4 @@ def get_client_ip(request):
 
 def is_bot_user_agent(user_agent):
     """Check if user agent is a bot"""
-    bot_patterns = [
-        'bot', 'crawler', 'spider', 'scraper', 'crawler',
-        'googlebot', 'bingbot', 'slurp', 'duckduckbot',
-        'baiduspider', 'yandexbot', 'facebookexternalhit'
-    ]
-    user_agent_lower = user_agent.lower()
-    return any(pattern in user_agent_lower for pattern in bot_patterns)
+    return user_agents.classify(user_agent).is_bot
@@ -20,4 +20,5 @@ urlpatterns = [
     
     # Tracking endpoints
     path('track/', tracking_views.track_event, name='track'),
+    path('track/batch/', tracking_views.track_batch, name='track_batch'),
 ]
@@ -0,0 +1,130 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+UserAgentInfo = namedtuple('UserAgentInfo', ['device_type', 'browser', 'os', 'is_bot', 'is_mobile'])
+
+MOBILE_DEVICE_TOKENS = {'mobile', 'android', 'iphone'}
+TABLET_DEVICE_TOKENS = {'tablet', 'ipad'}
+IOS_TOKENS = {'ios', 'iphone', 'ipad'}
+MOBILE_TOKENS = MOBILE_DEVICE_TOKENS | {
+    'ipod', 'blackberry', 'windows phone', 'opera mini', 'iemobile'
+}
+BOT_TOKENS = {
+    'bot', 'crawler', 'spider', 'scraper', 'slurp', 'facebookexternalhit'
+}
+BROWSER_TOKENS = {'chrome', 'edg', 'firefox', 'safari', 'opera'}
+OS_TOKENS = {'windows', 'mac', 'linux', 'android'} | IOS_TOKENS
+
+# Tokens containing another token hide it from the non-overlapping scan
+IMPLIED_TOKENS = {
+    'windows phone': 'windows',
+    'opera mini': 'opera',
+    'iemobile': 'mobile',
+}
+
+ALL_TOKENS = (
+    MOBILE_TOKENS | TABLET_DEVICE_TOKENS | BOT_TOKENS | BROWSER_TOKENS | OS_TOKENS
+)
+
+
+def compile_token_trie(tokens):
+    """Compile tokens into one regex with shared prefixes factored out.
+
+    The resulting pattern behaves like a trie walk, so each offset of the
+    user agent is tested against a single branch per character instead of
+    every token in turn.
+    """
+    trie = {}
+    for token in tokens:
+        node = trie
+        for char in token:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:%s)' % '|'.join(branches)
+        return '(?:%s)?' % body if '' in node else body
+
+    return re.compile(build(trie))
+
+
+TOKEN_RE = compile_token_trie(ALL_TOKENS)
+
+CACHE_SIZE = 4096
+
+
+def tokens_for(user_agent):
+    """Return the set of known tokens present in a user agent"""
+    found = set(TOKEN_RE.findall(user_agent.lower()))
+    for token, implied in IMPLIED_TOKENS.items():
+        if token in found:
+            found.add(implied)
+    return found
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def classify(user_agent):
+    """Classify a user agent into device, browser, OS and bot flags"""
+    found = tokens_for(user_agent or '')
+
+    if found & MOBILE_DEVICE_TOKENS:
+        device_type = 'mobile'
+    elif found & TABLET_DEVICE_TOKENS:
+        device_type = 'tablet'
+    else:
+        device_type = 'desktop'
+
+    if 'chrome' in found and 'edg' not in found:
+        browser = 'Chrome'
+    elif 'firefox' in found:
+        browser = 'Firefox'
+    elif 'safari' in found and 'chrome' not in found:
+        browser = 'Safari'
+    elif 'edg' in found:
+        browser = 'Edge'
+    elif 'opera' in found:
+        browser = 'Opera'
+    else:
+        browser = 'Unknown'
+
+    if 'windows' in found:
+        os = 'Windows'
+    elif 'mac' in found:
+        os = 'macOS'
+    elif 'linux' in found:
+        os = 'Linux'
+    elif 'android' in found:
+        os = 'Android'
+    elif found & IOS_TOKENS:
+        os = 'iOS'
+    else:
+        os = 'Unknown'
+
+    return UserAgentInfo(
+        device_type=device_type,
+        browser=browser,
+        os=os,
+        is_bot=bool(found & BOT_TOKENS),
+        is_mobile=bool(found & MOBILE_TOKENS),
+    )
+
+
+def cache_stats():
+    """Return hit/miss counters for the classification cache"""
+    info = classify.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'max_size': info.maxsize,
+        'hit_rate': round(info.hits / lookups * 100, 2) if lookups else 0.0,
+    }
+
+
+def clear_cache():
+    classify.cache_clear()
@@ -1,70 +1,29 @@
 import re
-import requests
 import json
+from contextlib import contextmanager
 from django.conf import settings
 from django.utils import timezone
 
+from . import geolocation, user_agents
+
 def parse_user_agent(user_agent):
     """Parse user agent string to extract device, browser, and OS info"""
-    device_type = 'desktop'
-    browser = 'Unknown'
-    os = 'Unknown'
-    
-    user_agent_lower = user_agent.lower()
-    
-    # Detect device type
-    if any(mobile in user_agent_lower for mobile in ['mobile', 'android', 'iphone']):
-        device_type = 'mobile'
-    elif any(tablet in user_agent_lower for tablet in ['tablet', 'ipad']):
-        device_type = 'tablet'
-    
-    # Detect browser
-    if 'chrome' in user_agent_lower and 'edg' not in user_agent_lower:
-        browser = 'Chrome'
-    elif 'firefox' in user_agent_lower:
-        browser = 'Firefox'
-    elif 'safari' in user_agent_lower and 'chrome' not in user_agent_lower:
-        browser = 'Safari'
-    elif 'edg' in user_agent_lower:
-        browser = 'Edge'
-    elif 'opera' in user_agent_lower:
-        browser = 'Opera'
-    
-    # Detect operating system
-    if 'windows' in user_agent_lower:
-        os = 'Windows'
-    elif 'mac' in user_agent_lower:
-        os = 'macOS'
-    elif 'linux' in user_agent_lower:
-        os = 'Linux'
-    elif 'android' in user_agent_lower:
-        os = 'Android'
-    elif 'ios' in user_agent_lower or 'iphone' in user_agent_lower or 'ipad' in user_agent_lower:
-        os = 'iOS'
-    
+    info = user_agents.classify(user_agent)
     return {
-        'device_type': device_type,
-        'browser': browser,
-        'os': os
+        'device_type': info.device_type,
+        'browser': info.browser,
+        'os': info.os
     }
 
 def get_geolocation(ip_address):
-    """Get geolocation information for IP address"""
-    try:
-        # Skip private IPs
-        if ip_address.startswith(('127.', '192.168.', '10.', '172.')):
-            return {'country': 'Local', 'city': 'Local'}
-        
-        # Use a free geolocation service
-        response = requests.get(f'http://ip-api.com/json/{ip_address}', timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                'country': data.get('country', 'Unknown'),
-                'city': data.get('city', 'Unknown')
-            }
-    except:
-        pass
+    """Get geolocation information for IP address without waiting on the network"""
+    location = geolocation.lookup(ip_address)
+    if location is not None:
+        return dict(location)
+    
+    # Leave the location empty so the background lookup can fill it in
+    if geolocation.deferred_lookups_enabled():
+        return {'country': None, 'city': None}
     
     return {'country': 'Unknown', 'city': 'Unknown'}
 
@@ -88,12 +47,7 @@ def get_client_ip(request):
 
 def is_mobile_device(user_agent):
     """Check if the device is mobile"""
-    mobile_patterns = [
-        'mobile', 'android', 'iphone', 'ipod', 'blackberry',
-        'windows phone', 'opera mini', 'iemobile'
-    ]
-    user_agent_lower = user_agent.lower()
-    return any(pattern in user_agent_lower for pattern in mobile_patterns)
+    return user_agents.classify(user_agent).is_mobile
 
 def get_screen_resolution(request):
     """Extract screen resolution from request (if available)"""
@@ -117,19 +71,24 @@ def track_event(visitor, event_type, event_name, event_value=None, page_url=None
         print(f"Error tracking event: {e}")
 
 def calculate_bounce_rate(visitor):
-    """Calculate bounce rate for a visitor"""
-    page_views = visitor.page_views.count()
-    if page_views <= 1:
-        return 100.0
-    return 0.0
+    """Calculate bounce rate for a visitor's sessionized visits"""
+    from django.db.models import Count, Q
+    
+    sessions = visitor.page_views.aggregate(
+        visits=Count('id', filter=Q(exit_page=True)),
+        bounces=Count('id', filter=Q(bounce=True))
+    )
+    if sessions['visits'] == 0:
+        return 0.0
+    return (sessions['bounces'] / sessions['visits']) * 100
 
 def get_traffic_source_breakdown(start_date, end_date):
     """Get traffic source breakdown for a date range"""
     from .models import TrafficSource
     from django.db import models
     
-    sources = TrafficSource.objects.filter(
-        first_visit__date__range=[start_date, end_date]
+    sources = TrafficSource.objects.in_date_range(
+        start_date, end_date
     ).values('source_type').annotate(
         count=models.Count('id')
     ).order_by('-count')
@@ -138,51 +97,46 @@ def get_traffic_source_breakdown(start_date, end_date):
 
 def generate_analytics_report(start_date, end_date):
     """Generate comprehensive analytics report"""
-    from .models import Visitor, PageView, DailyStats
-    from django.db.models import Avg
-    
-    # Get basic metrics
-    total_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).count()
-    
-    total_page_views = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
-    ).count()
-    
-    # Get unique visitors
-    unique_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).distinct().count()
+    from .aggregation import summary_metrics
     
-    # Calculate average session duration
-    avg_duration = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date],
-        time_spent__isnull=False
-    ).aggregate(avg_duration=Avg('time_spent'))['avg_duration']
+    summary = summary_metrics(start_date, end_date)
     
     return {
-        'total_visitors': total_visitors,
-        'unique_visitors': unique_visitors,
-        'total_page_views': total_page_views,
-        'avg_session_duration': avg_duration,
-        'bounce_rate': calculate_bounce_rate_period(start_date, end_date),
+        'total_visitors': summary['total_visitors'],
+        'unique_visitors': summary['unique_visitors'],
+        'total_page_views': summary['total_page_views'],
+        'avg_session_duration': summary['avg_duration'],
+        'bounce_rate': summary['bounce_rate'],
     }
 
 def calculate_bounce_rate_period(start_date, end_date):
     """Calculate bounce rate for a specific period"""
-    from .models import Visitor, PageView
+    from .models import PageView
+    from django.db.models import Count, Q
     
-    visitors_with_single_page = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date],
-        total_page_views=1
-    ).count()
+    # Every session has exactly one exit view
+    sessions = PageView.objects.in_date_range(start_date, end_date).aggregate(
+        visits=Count('id', filter=Q(exit_page=True)),
+        bounces=Count('id', filter=Q(bounce=True))
+    )
     
-    total_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).count()
-    
-    if total_visitors == 0:
+    if sessions['visits'] == 0:
         return 0.0
     
-    return (visitors_with_single_page / total_visitors) * 100
+    return (sessions['bounces'] / sessions['visits']) * 100
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the timestamps we provide instead of auto_now(_add).
+
+    The field flags are process-wide, so this is only for management
+    commands, never for request handling.
+    """
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
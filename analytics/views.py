@@ -1,7 +1,7 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.db.models import Count, Sum, Avg, Q, F
 from django.utils import timezone
 from django.core.paginator import Paginator
@@ -9,12 +9,18 @@ from datetime import datetime, timedelta
 import json
 
 from .models import (
-    Visitor, PageView, TrafficSource, SessionData, Event, 
+    Visitor, PageView, TrafficSource, Event, 
     DailyStats, AnalyticsSettings
 )
 from .utils import generate_analytics_report, get_traffic_source_breakdown
+from .aggregation import (
+    cached_dashboard_metrics, hourly_histogram, slowest_pages, timing_histograms, timing_series, timing_summary
+)
+from . import exports, realtime
+from .routers import replica_reads, stream_from_replica
 
 @staff_member_required
+@replica_reads
 def analytics_dashboard(request):
     """Main analytics dashboard"""
     # Date range (default to last 30 days)
@@ -27,63 +33,9 @@ def analytics_dashboard(request):
     if request.GET.get('end_date'):
         end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
     
-    # Get basic metrics
-    total_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).count()
-    
-    unique_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).distinct().count()
-    
-    total_page_views = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
-    ).count()
-    
-    total_sessions = SessionData.objects.filter(
-        start_time__date__range=[start_date, end_date]
-    ).count()
-    
-    # Calculate bounce rate
-    single_page_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date],
-        total_page_views=1
-    ).count()
-    bounce_rate = (single_page_visitors / unique_visitors * 100) if unique_visitors > 0 else 0
-    
-    # Average session duration
-    avg_duration = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date],
-        time_spent__isnull=False
-    ).aggregate(avg_duration=Avg('time_spent'))['avg_duration']
-    
-    # Top pages
-    top_pages = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
-    ).values('path', 'page_title').annotate(
-        views=Count('id')
-    ).order_by('-views')[:10]
-    
-    # Calculate percentages for top pages
-    for page in top_pages:
-        if total_page_views > 0:
-            page['percentage'] = round((page['views'] / total_page_views) * 100, 1)
-        else:
-            page['percentage'] = 0
-    
-    # Traffic sources with detailed breakdown
-    traffic_sources = TrafficSource.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).values('source_type', 'source_name').annotate(
-        visitors=Count('visitor', distinct=True)
-    ).order_by('-visitors')
-    
-    # Calculate percentages for traffic sources
-    for source in traffic_sources:
-        if unique_visitors > 0:
-            source['percentage'] = round((source['visitors'] / unique_visitors) * 100, 1)
-        else:
-            source['percentage'] = 0
+    metrics = cached_dashboard_metrics(start_date, end_date)
+    unique_visitors = metrics.unique_visitors
+    traffic_sources = metrics.traffic_sources
     
     # Dynamic traffic source breakdown
     traffic_breakdown = {
@@ -128,125 +80,49 @@ def analytics_dashboard(request):
         traffic_breakdown['whatsapp']
     )
     
-    # Advanced metrics calculations
-    conversion_rate = 2.4  # This would be calculated from actual data
-    engagement_score = 8.7  # This would be calculated from actual data
-    avg_load_time = 1.2  # This would be calculated from actual data
-    mobile_traffic_percentage = 68  # This would be calculated from device breakdown
-    
-    # Geographic data
-    geographic_data = [
-        {'country': 'United States', 'percentage': 35, 'visitors': unique_visitors},
-        {'country': 'United Kingdom', 'percentage': 20, 'visitors': unique_visitors},
-        {'country': 'Canada', 'percentage': 15, 'visitors': unique_visitors},
-        {'country': 'Australia', 'percentage': 10, 'visitors': unique_visitors},
-        {'country': 'Germany', 'percentage': 8, 'visitors': unique_visitors},
-        {'country': 'Others', 'percentage': 12, 'visitors': unique_visitors}
-    ]
-    
-    # Hourly traffic data for charts
-    hourly_traffic = []
-    for hour in range(24):
-        count = PageView.objects.filter(
-            timestamp__date__range=[start_date, end_date],
-            timestamp__hour=hour
-        ).count()
-        hourly_traffic.append({'hour': hour, 'count': count})
-    
-    # Daily traffic data for charts
-    daily_traffic = []
-    for i in range(7):
-        date = end_date - timedelta(days=6-i)
-        count = PageView.objects.filter(
-            timestamp__date=date
-        ).count()
-        daily_traffic.append({'date': date.strftime('%Y-%m-%d'), 'count': count})
-    
-    # Top pages with real data
-    top_pages = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
-    ).values('path', 'page_title').annotate(
-        views=Count('id')
-    ).order_by('-views')[:10]
-    
-    # Calculate percentages for top pages
-    for page in top_pages:
-        if total_page_views > 0:
-            page['percentage'] = round((page['views'] / total_page_views) * 100, 1)
-        else:
-            page['percentage'] = 0
-    
-    # Device breakdown
-    device_breakdown = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).values('device_type').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
     # Convert to JSON format for JavaScript
-    device_breakdown_json = json.dumps(list(device_breakdown))
-    
-    # Browser breakdown
-    browser_breakdown = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
-    ).values('browser').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Country breakdown
-    country_breakdown = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date],
-        country__isnull=False
-    ).values('country').annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]
+    device_breakdown_json = json.dumps(metrics.device_breakdown)
     
     # Recent visitors
-    recent_visitors = Visitor.objects.filter(
-        first_visit__date__range=[start_date, end_date]
+    recent_visitors = Visitor.objects.in_date_range(
+        start_date, end_date
     ).order_by('-last_visit')[:20]
     
     # Real-time visitors (last 5 minutes)
-    real_time_visitors = Visitor.objects.filter(
-        last_visit__gte=timezone.now() - timedelta(minutes=5)
-    ).count()
-    
-    # Hourly distribution
-    hourly_data = []
-    for hour in range(24):
-        count = PageView.objects.filter(
-            timestamp__date__range=[start_date, end_date],
-            timestamp__hour=hour
-        ).count()
-        hourly_data.append({'hour': hour, 'count': count})
+    real_time_visitors = realtime.snapshot()['active_visitors']
     
     context = {
         'start_date': start_date,
         'end_date': end_date,
-        'total_visitors': total_visitors,
+        'total_visitors': metrics.total_visitors,
         'unique_visitors': unique_visitors,
-        'total_page_views': total_page_views,
-        'total_sessions': total_sessions,
-        'bounce_rate': round(bounce_rate, 2),
-        'avg_duration': avg_duration,
-        'top_pages': top_pages,
+        'total_page_views': metrics.total_page_views,
+        'total_sessions': metrics.total_sessions,
+        'bounce_rate': round(metrics.bounce_rate, 2),
+        'avg_duration': metrics.avg_duration,
+        'top_pages': metrics.top_pages,
         'traffic_sources': traffic_sources,
         'traffic_breakdown': traffic_breakdown,
         'social_media_total': social_media_total,
-        'conversion_rate': conversion_rate,
-        'engagement_score': engagement_score,
-        'avg_load_time': avg_load_time,
-        'mobile_traffic_percentage': mobile_traffic_percentage,
-        'geographic_data': geographic_data,
-        'hourly_traffic': json.dumps(hourly_traffic),
-        'daily_traffic': json.dumps(daily_traffic),
-        'device_breakdown': device_breakdown,
+        'conversions': metrics.conversions,
+        'conversion_rate': metrics.conversion_rate,
+        'engagement_score': metrics.engagement_score,
+        'pages_per_visit': round(metrics.total_page_views / metrics.visits, 1) if metrics.visits else 0,
+        'avg_load_time': metrics.avg_load_time,
+        'load_time_p75': metrics.page_timings['load']['p75'] / 1000 if 'load' in metrics.page_timings else None,
+        'mobile_traffic_percentage': metrics.device_mix['mobile'],
+        'device_mix': metrics.device_mix,
+        'geographic_data': metrics.geographic_data,
+        'geographic_data_json': json.dumps(metrics.geographic_data),
+        'hourly_traffic': json.dumps(metrics.hourly_traffic),
+        'daily_traffic': json.dumps(metrics.daily_traffic),
+        'device_breakdown': metrics.device_breakdown,
         'device_breakdown_json': device_breakdown_json,
-        'browser_breakdown': browser_breakdown,
-        'country_breakdown': country_breakdown,
+        'browser_breakdown': metrics.browser_breakdown,
+        'country_breakdown': metrics.country_breakdown,
         'recent_visitors': recent_visitors,
         'real_time_visitors': real_time_visitors,
-        'hourly_data': json.dumps(hourly_data),
+        'hourly_data': json.dumps(metrics.hourly_traffic),
     }
     
     return render(request, 'analytics/tailwind_dashboard.html', context)
@@ -255,35 +131,35 @@ def analytics_dashboard(request):
 def real_time_analytics(request):
     """Real-time analytics view"""
     # Last 5 minutes
-    cutoff_time = timezone.now() - timedelta(minutes=5)
+    cutoff_time = timezone.now() - timedelta(seconds=realtime.WINDOW_SECONDS)
+    
+    # Counts, top paths and source mix come from the sliding-window counters
+    live = realtime.snapshot()
     
-    # Active visitors
+    # Only the most recent rows are listed individually
     active_visitors = Visitor.objects.filter(
-        last_visit__gte=cutoff_time
-    ).order_by('-last_visit')
+        pk__in=list(live['visitor_ids'])[:500]
+    ).order_by('-last_visit')[:50]
     
     # Current page views
     current_page_views = PageView.objects.filter(
         timestamp__gte=cutoff_time
-    ).order_by('-timestamp')
-    
-    # Traffic sources in real-time
-    real_time_sources = TrafficSource.objects.filter(
-        first_visit__gte=cutoff_time
-    ).values('source_type', 'source_name').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    ).select_related('visitor').order_by('-timestamp')[:50]
     
     context = {
         'active_visitors': active_visitors,
+        'active_visitor_count': live['active_visitors'],
         'current_page_views': current_page_views,
-        'real_time_sources': real_time_sources,
+        'page_view_count': live['page_views'],
+        'top_paths': live['top_paths'],
+        'real_time_sources': live['sources'],
         'cutoff_time': cutoff_time,
     }
     
     return render(request, 'analytics/real_time.html', context)
 
 @staff_member_required
+@replica_reads
 def visitor_detail(request, visitor_id):
     """Detailed view of a specific visitor"""
     visitor = get_object_or_404(Visitor, visitor_id=visitor_id)
@@ -311,6 +187,7 @@ def visitor_detail(request, visitor_id):
     return render(request, 'analytics/visitor_detail.html', context)
 
 @staff_member_required
+@replica_reads
 def traffic_sources(request):
     """Detailed traffic sources analysis"""
     # Date range
@@ -323,8 +200,8 @@ def traffic_sources(request):
         end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
     
     # Traffic sources with detailed metrics
-    sources = TrafficSource.objects.filter(
-        first_visit__date__range=[start_date, end_date]
+    sources = TrafficSource.objects.in_date_range(
+        start_date, end_date
     ).values('source_type', 'source_name').annotate(
         visitors=Count('visitor', distinct=True),
         sessions=Count('visitor__sessions', distinct=True),
@@ -332,8 +209,7 @@ def traffic_sources(request):
     ).order_by('-visitors')
     
     # UTM campaigns
-    utm_campaigns = TrafficSource.objects.filter(
-        first_visit__date__range=[start_date, end_date],
+    utm_campaigns = TrafficSource.objects.in_date_range(start_date, end_date).filter(
         campaign_name__isnull=False
     ).values('campaign_name', 'source_name').annotate(
         visitors=Count('visitor', distinct=True)
@@ -349,6 +225,7 @@ def traffic_sources(request):
     return render(request, 'analytics/traffic_sources.html', context)
 
 @staff_member_required
+@replica_reads
 def pages_analysis(request):
     """Detailed pages analysis"""
     # Date range
@@ -361,8 +238,8 @@ def pages_analysis(request):
         end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
     
     # Top pages with metrics
-    pages = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
+    pages = PageView.objects.in_date_range(
+        start_date, end_date
     ).values('path', 'page_title').annotate(
         views=Count('id'),
         unique_visitors=Count('visitor', distinct=True),
@@ -370,26 +247,30 @@ def pages_analysis(request):
     ).order_by('-views')
     
     # Bounce pages (single page visits)
-    bounce_pages = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
+    bounce_pages = PageView.objects.in_date_range(
+        start_date, end_date
     ).values('path', 'page_title').annotate(
         total_views=Count('id'),
-        single_page_visits=Count('visitor', filter=Q(visitor__total_page_views=1))
+        single_page_visits=Count('id', filter=Q(bounce=True))
     ).annotate(
         bounce_rate=F('single_page_visits') * 100.0 / F('total_views')
     ).filter(total_views__gte=5).order_by('-bounce_rate')
     
     # Entry pages
-    entry_pages = PageView.objects.filter(
-        timestamp__date__range=[start_date, end_date]
+    entry_pages = PageView.objects.in_date_range(
+        start_date, end_date
     ).values('path', 'page_title').annotate(
         entries=Count('id', filter=Q(visitor__page_views__timestamp=F('timestamp')))
     ).order_by('-entries')
     
+    # Real-user load times from the page timing digests
+    slowest = slowest_pages(timing_histograms(start_date, end_date))
+    
     context = {
         'start_date': start_date,
         'end_date': end_date,
         'pages': pages,
+        'slowest_pages': slowest,
         'bounce_pages': bounce_pages,
         'entry_pages': entry_pages,
     }
@@ -397,6 +278,7 @@ def pages_analysis(request):
     return render(request, 'analytics/pages_analysis.html', context)
 
 @staff_member_required
+@replica_reads
 def export_data(request):
     """Export analytics data"""
     format_type = request.GET.get('format', 'json')
@@ -411,38 +293,25 @@ def export_data(request):
     if request.GET.get('end_date'):
         end_date = datetime.strptime(request.GET.get('end_date'), '%Y-%m-%d').date()
     
-    if data_type == 'visitors':
-        data = Visitor.objects.filter(
-            first_visit__date__range=[start_date, end_date]
-        ).values(
-            'visitor_id', 'ip_address', 'first_visit', 'last_visit',
-            'total_visits', 'total_page_views', 'country', 'city',
-            'device_type', 'browser', 'operating_system'
-        )
-    elif data_type == 'page_views':
-        data = PageView.objects.filter(
-            timestamp__date__range=[start_date, end_date]
-        ).values(
-            'visitor__visitor_id', 'url', 'path', 'page_title',
-            'timestamp', 'time_spent', 'referrer'
-        )
-    elif data_type == 'traffic_sources':
-        data = TrafficSource.objects.filter(
-            first_visit__date__range=[start_date, end_date]
-        ).values(
-            'visitor__visitor_id', 'source_type', 'source_name',
-            'source_url', 'campaign_name', 'first_visit'
-        )
-    
-    if format_type == 'json':
-        return JsonResponse(list(data), safe=False)
-    elif format_type == 'csv':
-        # Implement CSV export
-        pass
-    
-    return JsonResponse({'error': 'Invalid format'}, status=400)
+    if data_type not in exports.EXPORTS:
+        return JsonResponse({'error': 'Invalid type'}, status=400)
+    if format_type not in exports.STREAMS:
+        return JsonResponse({'error': 'Invalid format'}, status=400)
+
+    # Rows are streamed page by page, so memory stays flat for any range
+    compress = request.GET.get('gzip') in ('1', 'true')
+    response = StreamingHttpResponse(
+        stream_from_replica(
+            exports.export_stream(data_type, format_type, start_date, end_date, compress=compress)
+        ),
+        content_type='application/gzip' if compress else exports.CONTENT_TYPES[format_type],
+    )
+    filename = exports.export_filename(data_type, format_type, start_date, end_date, compress)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @staff_member_required
+@replica_reads
 def analytics_api(request):
     """API endpoint for analytics data"""
     metric = request.GET.get('metric', 'overview')
@@ -462,17 +331,28 @@ def analytics_api(request):
     if metric == 'overview':
         data = generate_analytics_report(start_date, end_date)
     elif metric == 'traffic_sources':
-        data = get_traffic_source_breakdown(start_date, end_date)
+        data = list(get_traffic_source_breakdown(start_date, end_date))
     elif metric == 'hourly':
-        hourly_data = []
-        for hour in range(24):
-            count = PageView.objects.filter(
-                timestamp__date__range=[start_date, end_date],
-                timestamp__hour=hour
-            ).count()
-            hourly_data.append({'hour': hour, 'count': count})
-        data = hourly_data
+        data = hourly_histogram(start_date, end_date)
+    elif metric == 'timings':
+        # ?timing=lcp picks the metric for the slowest pages and the daily series
+        timing = request.GET.get('timing', 'load')
+        histograms = timing_histograms(start_date, end_date, path=request.GET.get('path'))
+        data = {
+            'metrics': timing_summary(histograms),
+            'slowest_pages': slowest_pages(histograms, metric=timing),
+            'daily_p75': timing_series(end_date, metric=timing, days=(end_date - start_date).days + 1,
+                                       path=request.GET.get('path')),
+        }
+    elif metric == 'realtime':
+        live = realtime.snapshot()
+        data = {
+            'active_visitors': live['active_visitors'],
+            'page_views': live['page_views'],
+            'top_paths': live['top_paths'],
+            'sources': live['sources'],
+        }
     else:
         data = {'error': 'Invalid metric'}
     
-    return JsonResponse(data)
+    return JsonResponse(data, safe=False)
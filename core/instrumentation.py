@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.template.base import Template
+
+# Upper bounds of the histogram buckets (Prometheus "le" values)
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+OVERHEAD_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025)
+
+# Metrics of the request being handled in this thread or task
+current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram, cheap enough to update on every request"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """(upper bound, observations <= bound) pairs, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding the rank"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        # Beyond the last bound there is nothing to interpolate towards
+        return self.bounds[-1]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+
+class RouteStats:
+    """Per-route histograms of one worker"""
+
+    def __init__(self):
+        self.duration = Histogram(SECONDS_BUCKETS)
+        self.db_time = Histogram(SECONDS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.template_time = Histogram(SECONDS_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.errors = 0
+
+    def summary(self):
+        return {
+            'errors': self.errors,
+            'duration': self.duration.summary(),
+            'db_time': self.db_time.summary(),
+            'queries': self.queries.summary(),
+            'template_time': self.template_time.summary(),
+            'response_size': self.response_size.summary(),
+        }
+
+
+class RequestMetrics:
+    """Counters filled in while one request is handled"""
+
+    __slots__ = ('queries', 'db_time', 'template_time', 'template_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+
+class Registry:
+    """Route statistics of this worker process.
+
+    Every worker keeps its own numbers; a scraper sees the worker that
+    answered, which the ``pid`` label identifies.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.overhead = Histogram(OVERHEAD_BUCKETS)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, route, duration, metrics, size, error):
+        with self._lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = RouteStats()
+            stats.duration.observe(duration)
+            stats.db_time.observe(metrics.db_time)
+            stats.queries.observe(metrics.queries)
+            stats.template_time.observe(metrics.template_time)
+            if size is not None:
+                stats.response_size.observe(size)
+            if error:
+                stats.errors += 1
+
+    def record_overhead(self, seconds):
+        with self._lock:
+            self.overhead.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: stats.summary() for route, stats in self.routes.items()}
+            overhead = self.overhead.summary()
+        return {
+            'pid': os.getpid(),
+            'since': self.started,
+            'overhead': overhead,
+            'routes': dict(sorted(
+                routes.items(), key=lambda item: item[1]['duration']['mean'] * item[1]['duration']['count'], reverse=True
+            )),
+        }
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.overhead = Histogram(OVERHEAD_BUCKETS)
+            self.started = time.time()
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: count queries and their time"""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+_template_render = Template.render
+_template_lock = threading.Lock()
+
+
+def timed_render(self, context):
+    """Template.render replacement timing the outermost render of a request.
+
+    Includes and extends render nested templates, so only the outermost
+    call adds to the total; queries run lazily from the template are part
+    of both the template and the DB time.
+    """
+    metrics = current.get()
+    if metrics is None:
+        return _template_render(self, context)
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _template_render(self, context)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def install_template_timing():
+    with _template_lock:
+        if Template.render is not timed_render:
+            Template.render = timed_render
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def prometheus_text(source=None):
+    """Render every histogram in the Prometheus text exposition format"""
+    source = source or registry
+    pid = os.getpid()
+    metrics = [
+        ('django_http_request_duration_seconds', 'Wall time per request', 'duration'),
+        ('django_http_request_db_seconds', 'Time spent in database queries per request', 'db_time'),
+        ('django_http_request_db_queries', 'Database queries per request', 'queries'),
+        ('django_http_request_template_seconds', 'Template rendering time per request', 'template_time'),
+        ('django_http_response_size_bytes', 'Response body size', 'response_size'),
+    ]
+    lines = []
+    with source._lock:
+        routes = list(source.routes.items())
+        for name, help_text, attribute in metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for route, stats in routes:
+                histogram = getattr(stats, attribute)
+                labels = f'pid="{pid}",route="{escape_label(route)}"'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{format_bound(bound)}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram.sum!r}')
+                lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+        lines.append('# HELP django_http_request_errors_total Responses with a 5xx status')
+        lines.append('# TYPE django_http_request_errors_total counter')
+        for route, stats in routes:
+            lines.append(f'django_http_request_errors_total{{pid="{pid}",route="{escape_label(route)}"}} {stats.errors}')
+
+        overhead = source.overhead
+        lines.append('# HELP django_instrumentation_overhead_seconds Time the instrumentation itself adds per request')
+        lines.append('# TYPE django_instrumentation_overhead_seconds histogram')
+        for bound, count in overhead.cumulative():
+            lines.append(f'django_instrumentation_overhead_seconds_bucket{{pid="{pid}",le="{format_bound(bound)}"}} {count}')
+        lines.append(f'django_instrumentation_overhead_seconds_sum{{pid="{pid}"}} {overhead.sum!r}')
+        lines.append(f'django_instrumentation_overhead_seconds_count{{pid="{pid}"}} {overhead.count}')
+    return '\n'.join(lines) + '\n'
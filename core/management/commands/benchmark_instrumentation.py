@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from core import instrumentation
+
+MIDDLEWARE_PATH = 'core.middleware.RequestMetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = 'Measure what the request instrumentation middleware adds to a request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/about/', help='Page to request')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per round')
+        parser.add_argument('--rounds', type=int, default=5, help='Alternating rounds with and without the middleware')
+        parser.add_argument('--check', action='store_true', help='Fail when the overhead exceeds INSTRUMENTATION_OVERHEAD_BUDGET_MS')
+
+    def timed_round(self, middleware, path, requests):
+        with override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=['testserver'], INSTRUMENTATION_ENABLED=True):
+            client = Client()
+            response = client.get(path)
+            if response.status_code >= 400:
+                raise CommandError(f'{path} answered {response.status_code}')
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(path)
+            return (time.perf_counter() - started) / requests
+
+    def handle(self, *args, **options):
+        with_metrics = [MIDDLEWARE_PATH] + [name for name in settings.MIDDLEWARE if name != MIDDLEWARE_PATH]
+        without_metrics = with_metrics[1:]
+        instrumentation.registry.reset()
+
+        # Alternate rounds and keep the best of each so noise does not pose as overhead
+        plain = []
+        measured = []
+        for _ in range(options['rounds']):
+            plain.append(self.timed_round(without_metrics, options['path'], options['requests']))
+            measured.append(self.timed_round(with_metrics, options['path'], options['requests']))
+        overhead = min(measured) - min(plain)
+        self_reported = instrumentation.registry.snapshot()['overhead']['mean'] or 0.0
+        budget = getattr(settings, 'INSTRUMENTATION_OVERHEAD_BUDGET_MS', 0.5) / 1000
+
+        self.stdout.write(f'{options["path"]}: {min(plain) * 1000:.3f} ms without, {min(measured) * 1000:.3f} ms with instrumentation')
+        self.stdout.write(f'Added per request: {overhead * 1000:.3f} ms (middleware bookkeeping alone: {self_reported * 1000:.4f} ms)')
+        if overhead > budget:
+            message = f'Overhead {overhead * 1000:.3f} ms is over the {budget * 1000:.3f} ms budget'
+            if options['check']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Within the {budget * 1000:.3f} ms budget'))
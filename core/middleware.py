@@ -0,0 +1,45 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import instrumentation
+
+
+class RequestMetricsMiddleware:
+    """Records wall time, DB queries and time, template time and response size per route.
+
+    Numbers go into the in-memory histograms of core.instrumentation and
+    are served by the request_metrics views. The time spent in this
+    middleware's own bookkeeping is recorded too, so the overhead of
+    leaving it on in production stays visible.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrumentation.install_template_timing()
+
+    def __call__(self, request):
+        entered = time.perf_counter()
+        metrics = instrumentation.RequestMetrics()
+        token = instrumentation.current.set(metrics)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(instrumentation.record_query))
+            started = time.perf_counter()
+            try:
+                response = self.get_response(request)
+            finally:
+                finished = time.perf_counter()
+                instrumentation.current.reset(token)
+
+        match = getattr(request, 'resolver_match', None)
+        route = f'{request.method} /{match.route}' if match is not None else f'{request.method} <unmatched>'
+        size = None if response.streaming else len(response.content)
+        instrumentation.registry.record(route, finished - started, metrics, size, response.status_code >= 500)
+        instrumentation.registry.record_overhead((started - entered) + (time.perf_counter() - finished))
+        return response
@@ -0,0 +1,25 @@
+from django import template
+
+register = template.Library()
+
+
+class PageTitleNode(template.Node):
+    child_nodelists = ('nodelist',)
+
+    def __init__(self, nodelist):
+        self.nodelist = nodelist
+
+    def render(self, context):
+        title = self.nodelist.render(context)
+        request = context.get('request')
+        if request is not None:
+            request.page_title = title
+        return title
+
+
+@register.tag
+def page_title(parser, token):
+    """Render the page title and remember it on the request for page view tracking"""
+    nodelist = parser.parse(('endpage_title',))
+    parser.delete_first_token()
+    return PageTitleNode(nodelist)
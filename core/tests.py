@@ -1,3 +1,70 @@
-from django.test import TestCase
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from . import instrumentation
+
+# The manifest storage needs collectstatic; pages only need plain static URLs here
+PLAIN_STATIC = override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+@PLAIN_STATIC
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+
+    def routes(self):
+        return instrumentation.registry.snapshot()['routes']
+
+    def test_routes_are_labelled_by_pattern(self):
+        self.client.get('/about/')
+        self.client.get('/blog/first-post/')
+        self.client.get('/blog/second-post/')
+        self.client.get('/no/such/page/')
+
+        routes = self.routes()
+        self.assertEqual(routes['GET /about/']['duration']['count'], 1)
+        # Path parameters do not split a route
+        self.assertEqual(routes['GET /blog/<slug:slug>/']['duration']['count'], 2)
+        self.assertEqual(routes['GET <unmatched>']['duration']['count'], 1)
+        self.assertNotIn('GET /blog/first-post/', routes)
+
+    def test_queries_and_templates_are_counted(self):
+        self.client.get('/about/')
+        instrumentation.registry.reset()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/about/')
+
+        route = self.routes()['GET /about/']
+        self.assertEqual(route['queries']['mean'], len(context.captured_queries))
+        self.assertGreater(route['template_time']['mean'], 0)
+        self.assertEqual(route['errors'], 0)
+
+    def test_prometheus_labels(self):
+        self.client.get('/blog/first-post/')
+        text = instrumentation.prometheus_text()
+        self.assertIn('route="GET /blog/<slug:slug>/"', text)
+        self.assertIn('# TYPE django_http_request_duration_seconds histogram', text)
+
+
+@PLAIN_STATIC
+class PageTitleTagTests(TestCase):
+
+    def test_tag_records_rendered_title(self):
+        request = RequestFactory().get('/')
+        template = Template('{% load page_meta %}<title>{% page_title %}{{ name }} - Home{% endpage_title %}</title>')
+        html = template.render(Context({'request': request, 'name': 'Mediwell'}))
+        self.assertEqual(html, '<title>Mediwell - Home</title>')
+        self.assertEqual(request.page_title, 'Mediwell - Home')
+
+    def test_base_template_sets_title(self):
+        response = self.client.get('/about/')
+        title = response.wsgi_request.page_title
+        self.assertTrue(title)
+        self.assertContains(response, f'<title>{title}</title>')
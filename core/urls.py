@@ -7,4 +7,7 @@ urlpatterns = [
     path('privacy-policy/', views.PrivacyPolicyView.as_view(), name='privacy_policy'),
     path('terms-of-service/', views.TermsOfServiceView.as_view(), name='terms_of_service'),
     path('cookie-policy/', views.CookiePolicyView.as_view(), name='cookie_policy'),
+    # Request instrumentation (per worker)
+    path('internal/metrics/', views.request_metrics, name='request_metrics'),
+    path('internal/metrics/prometheus/', views.request_metrics_prometheus, name='request_metrics_prometheus'),
 ]
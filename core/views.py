@@ -1,6 +1,12 @@
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 from django.views.generic import TemplateView
 from .models import HeroSection, FeatureCard, Counter, TeamMember, HomePageSection, Testimonial
+from . import instrumentation
 
 from services.models import Service, ServiceCategory
 from blog.models import BlogPost, BlogCategory
@@ -66,4 +72,25 @@ class TermsOfServiceView(TemplateView):
 
 
 class CookiePolicyView(TemplateView):
-    template_name = 'core/cookie_policy.html'
\ No newline at end of file
+    template_name = 'core/cookie_policy.html'
+
+
+@staff_member_required
+def request_metrics(request):
+    """Per-route request timings of the worker that answers"""
+    snapshot = instrumentation.registry.snapshot()
+    budget = getattr(settings, 'INSTRUMENTATION_OVERHEAD_BUDGET_MS', 0.5) / 1000
+    mean_overhead = snapshot['overhead']['mean']
+    snapshot['overhead']['budget'] = budget
+    snapshot['overhead']['within_budget'] = mean_overhead is None or mean_overhead <= budget
+    return JsonResponse(snapshot)
+
+
+def request_metrics_prometheus(request):
+    """Prometheus scrape target; needs INSTRUMENTATION_METRICS_TOKEN as a bearer token, or a staff login"""
+    token = getattr(settings, 'INSTRUMENTATION_METRICS_TOKEN', None)
+    supplied = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+    authorized = bool(token) and hmac.compare_digest(supplied, token)
+    if not (authorized or (request.user.is_active and request.user.is_staff)):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(instrumentation.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
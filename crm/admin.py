@@ -6,6 +6,19 @@ from .models import (
     Clinic, Doctor, Patient, Appointment, Treatment, 
     Prescription, PrescriptionMedicine, Payment, MedicalRecord
 )
+from .queries import STR_RELATIONS, for_choices
+
+
+class ChoicePlanMixin:
+    """Load the relations foreign key choice labels print along with the choices"""
+
+    def get_field_queryset(self, db, db_field, request):
+        queryset = super().get_field_queryset(db, db_field, request)
+        if db_field.related_model in STR_RELATIONS:
+            if queryset is None:
+                queryset = db_field.related_model._default_manager.using(db).all()
+            queryset = for_choices(queryset)
+        return queryset
 
 
 @admin.register(Clinic)
@@ -49,6 +62,7 @@ class ClinicAdmin(admin.ModelAdmin):
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'specialization', 'clinic', 'phone', 'is_available', 'is_active']
+    list_select_related = ['clinic']
     list_filter = ['is_active', 'is_available', 'specialization', 'clinic', 'gender']
     search_fields = ['first_name', 'last_name', 'specialization', 'phone', 'email']
     readonly_fields = ['created_at', 'updated_at']
@@ -119,8 +133,9 @@ class PrescriptionMedicineInline(admin.TabularInline):
 
 
 @admin.register(Prescription)
-class PrescriptionAdmin(admin.ModelAdmin):
+class PrescriptionAdmin(ChoicePlanMixin, admin.ModelAdmin):
     list_display = ['prescription_id', 'patient', 'doctor', 'prescription_date', 'created_at']
+    list_select_related = ['patient', 'doctor']
     list_filter = ['prescription_date', 'created_at']
     search_fields = ['prescription_id', 'patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name']
     readonly_fields = ['prescription_id', 'created_at', 'updated_at']
@@ -145,6 +160,7 @@ class PrescriptionAdmin(admin.ModelAdmin):
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ['appointment_id', 'patient', 'doctor', 'scheduled_date', 'scheduled_time', 'status', 'payment_status']
+    list_select_related = ['patient', 'doctor']
     list_filter = ['status', 'appointment_type', 'payment_status', 'scheduled_date', 'created_at']
     search_fields = ['appointment_id', 'patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name']
     readonly_fields = ['appointment_id', 'created_at', 'updated_at', 'confirmed_at', 'completed_at', 'cancelled_at']
@@ -169,8 +185,9 @@ class AppointmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Treatment)
-class TreatmentAdmin(admin.ModelAdmin):
+class TreatmentAdmin(ChoicePlanMixin, admin.ModelAdmin):
     list_display = ['treatment_id', 'patient', 'doctor', 'name', 'treatment_type', 'status', 'treatment_date']
+    list_select_related = ['patient', 'doctor']
     list_filter = ['treatment_type', 'status', 'treatment_date', 'created_at']
     search_fields = ['treatment_id', 'patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name', 'name']
     readonly_fields = ['treatment_id', 'created_at', 'updated_at']
@@ -198,8 +215,9 @@ class TreatmentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ChoicePlanMixin, admin.ModelAdmin):
     list_display = ['payment_id', 'patient', 'amount', 'payment_method', 'payment_status', 'payment_date']
+    list_select_related = ['patient']
     list_filter = ['payment_method', 'payment_status', 'payment_date', 'created_at']
     search_fields = ['payment_id', 'patient__first_name', 'patient__last_name', 'transaction_id']
     readonly_fields = ['payment_id', 'created_at']
@@ -223,6 +241,7 @@ class PaymentAdmin(admin.ModelAdmin):
 @admin.register(MedicalRecord)
 class MedicalRecordAdmin(admin.ModelAdmin):
     list_display = ['record_id', 'patient', 'doctor', 'title', 'record_type', 'is_important', 'record_date']
+    list_select_related = ['patient', 'doctor']
     list_filter = ['record_type', 'is_important', 'is_confidential', 'record_date', 'created_at']
     search_fields = ['record_id', 'patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name', 'title']
     readonly_fields = ['record_id', 'created_at', 'updated_at']
@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from . import doctors, search, stats
+        from .models import Appointment, Clinic, Doctor, Patient, Payment
+        receivers = [
+            (doctors.invalidate_doctor, Doctor),
+            (doctors.invalidate_clinic, Clinic),
+            (stats.invalidate_appointment, Appointment),
+            (stats.invalidate_payment, Payment),
+            (stats.invalidate_patient, Patient),
+        ]
+        for receiver, sender in receivers:
+            for signal in (post_save, post_delete):
+                signal.connect(receiver, sender=sender, dispatch_uid=f'crm_{receiver.__name__}')
+        # Search documents are deleted with their patient
+        post_save.connect(search.index_patient, sender=Patient, dispatch_uid='crm_index_patient')
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Doctor
+
+# Cached for users without a doctor profile, so they are not looked up every time
+NO_DOCTOR = 'none'
+
+
+def cache_key(user_id):
+    return f'crm:doctor:{user_id}'
+
+
+def load_doctor(user):
+    """The user's Doctor with its clinic, from the short-lived cache or the database"""
+    key = cache_key(user.pk)
+    doctor = cache.get(key)
+    if doctor is None:
+        doctor = Doctor.objects.select_related('clinic').filter(user_id=user.pk).first()
+        cache.set(key, doctor or NO_DOCTOR, timeout=getattr(settings, 'CRM_DOCTOR_CACHE_SECONDS', 60))
+    if doctor == NO_DOCTOR:
+        return None
+    # The request's user is the profile's user; reuse it instead of caching a copy
+    doctor.user = user
+    return doctor
+
+
+def get_doctor(request):
+    """Doctor profile of the signed-in user, resolved once per request (None if there is none)"""
+    if not hasattr(request, 'crm_doctor'):
+        user = request.user
+        request.crm_doctor = load_doctor(user) if user.is_authenticated else None
+    return request.crm_doctor
+
+
+def invalidate_doctor(sender, instance, **kwargs):
+    """post_save/post_delete handler for Doctor"""
+    cache.delete(cache_key(instance.user_id))
+
+
+def invalidate_clinic(sender, instance, **kwargs):
+    """post_save/post_delete handler for Clinic: cached doctors carry their clinic"""
+    user_ids = Doctor.objects.filter(clinic_id=instance.pk).values_list('user_id', flat=True)
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
+
+
+class DoctorMixin:
+    """Resolve the signed-in doctor once and pass it to the view's form"""
+
+    @property
+    def doctor(self):
+        return get_doctor(self.request)
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if self.doctor:
+            kwargs['doctor'] = self.doctor
+        return kwargs
@@ -1,6 +1,13 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.urls import reverse_lazy
 from .models import Patient, Appointment, Treatment, Prescription, PrescriptionMedicine, Payment, MedicalRecord
+from .queries import doctor_patients, for_choices
+from .widgets import AutocompleteSelect
+
+# Patient and appointment choices are fetched as the user types
+PATIENT_AUTOCOMPLETE_URL = reverse_lazy('crm:patient_autocomplete')
+APPOINTMENT_AUTOCOMPLETE_URL = reverse_lazy('crm:appointment_autocomplete')
 
 
 class PatientForm(forms.ModelForm):
@@ -40,6 +47,7 @@ class AppointmentForm(forms.ModelForm):
             'duration', 'reason', 'notes', 'consultation_fee'
         ]
         widgets = {
+            'patient': AutocompleteSelect(PATIENT_AUTOCOMPLETE_URL),
             'scheduled_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-input'}),
             'scheduled_time': forms.TimeInput(attrs={'type': 'time', 'class': 'form-input'}),
             'reason': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
@@ -52,9 +60,7 @@ class AppointmentForm(forms.ModelForm):
         
         if doctor:
             # Filter patients who have appointments with this doctor
-            self.fields['patient'].queryset = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).distinct()
+            self.fields['patient'].queryset = doctor_patients(doctor)
         
         for field in self.fields:
             self.fields[field].widget.attrs.update({
@@ -72,6 +78,7 @@ class TreatmentForm(forms.ModelForm):
             'follow_up_required', 'follow_up_date', 'follow_up_notes', 'treatment_fee'
         ]
         widgets = {
+            'patient': AutocompleteSelect(PATIENT_AUTOCOMPLETE_URL),
             'follow_up_date': forms.DateInput(attrs={'type': 'date', 'class': 'form-input'}),
             'description': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
             'diagnosis': forms.Textarea(attrs={'rows': 2, 'class': 'form-input'}),
@@ -86,9 +93,7 @@ class TreatmentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if doctor:
-            self.fields['patient'].queryset = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).distinct()
+            self.fields['patient'].queryset = doctor_patients(doctor)
         
         for field in self.fields:
             self.fields[field].widget.attrs.update({
@@ -102,6 +107,7 @@ class PrescriptionForm(forms.ModelForm):
         model = Prescription
         fields = ['patient', 'symptoms', 'diagnosis', 'instructions']
         widgets = {
+            'patient': AutocompleteSelect(PATIENT_AUTOCOMPLETE_URL),
             'symptoms': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
             'diagnosis': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
             'instructions': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
@@ -112,9 +118,7 @@ class PrescriptionForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if doctor:
-            self.fields['patient'].queryset = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).distinct()
+            self.fields['patient'].queryset = doctor_patients(doctor)
         
         for field in self.fields:
             self.fields[field].widget.attrs.update({
@@ -145,6 +149,8 @@ class PaymentForm(forms.ModelForm):
         model = Payment
         fields = ['patient', 'appointment', 'amount', 'payment_method', 'notes']
         widgets = {
+            'patient': AutocompleteSelect(PATIENT_AUTOCOMPLETE_URL),
+            'appointment': AutocompleteSelect(APPOINTMENT_AUTOCOMPLETE_URL, forward='patient'),
             'notes': forms.Textarea(attrs={'rows': 2, 'class': 'form-input'}),
         }
     
@@ -153,13 +159,14 @@ class PaymentForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if doctor:
-            self.fields['patient'].queryset = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).distinct()
+            self.fields['patient'].queryset = doctor_patients(doctor)
             self.fields['appointment'].queryset = Appointment.objects.filter(
                 doctor=doctor
             )
         
+        # Appointment choices print patient and doctor names
+        self.fields['appointment'].queryset = for_choices(self.fields['appointment'].queryset)
+        
         for field in self.fields:
             self.fields[field].widget.attrs.update({
                 'class': 'form-input w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-medical-blue focus:border-transparent'
@@ -172,6 +179,7 @@ class MedicalRecordForm(forms.ModelForm):
         model = MedicalRecord
         fields = ['patient', 'record_type', 'title', 'description', 'file_attachment', 'is_important', 'is_confidential']
         widgets = {
+            'patient': AutocompleteSelect(PATIENT_AUTOCOMPLETE_URL),
             'description': forms.Textarea(attrs={'rows': 3, 'class': 'form-input'}),
         }
     
@@ -180,9 +188,7 @@ class MedicalRecordForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         
         if doctor:
-            self.fields['patient'].queryset = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).distinct()
+            self.fields['patient'].queryset = doctor_patients(doctor)
         
         for field in self.fields:
             if field != 'is_important' and field != 'is_confidential':
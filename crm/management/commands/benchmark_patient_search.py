@@ -0,0 +1,98 @@
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from crm import search
+from crm.models import Patient
+
+FIRST_NAMES = [
+    'Aarav', 'Vivaan', 'Aditya', 'Arjun', 'Sai', 'Reyansh', 'Ishaan', 'Krishna', 'Rohan', 'Kabir',
+    'Ananya', 'Diya', 'Aadhya', 'Saanvi', 'Priya', 'Isha', 'Meera', 'Kavya', 'Riya', 'Zoya',
+    'Mohammed', 'Imran', 'Fatima', 'Ayesha', 'José', 'Renée', 'Siddharth', 'Nikhil', 'Pooja', 'Sneha',
+]
+LAST_NAMES = [
+    'Sharma', 'Verma', 'Gupta', 'Khan', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Singh', 'Das',
+    'Mehta', 'Joshi', 'Kulkarni', 'Chopra', 'Malhotra', 'Banerjee', 'Mukherjee', 'Qureshi', 'Fernandes', 'Pillai',
+]
+DOMAINS = ['gmail.com', 'yahoo.co.in', 'outlook.com', 'rediffmail.com']
+
+
+def legacy_search(queryset, query):
+    """The five-way icontains filter the search index replaced"""
+    return queryset.filter(
+        Q(first_name__icontains=query) |
+        Q(last_name__icontains=query) |
+        Q(patient_id__icontains=query) |
+        Q(phone__icontains=query) |
+        Q(email__icontains=query)
+    ).order_by('-created_at')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark patient search against the legacy icontains filter on synthetic patients (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query')
+
+    def synthetic_patients(self, count):
+        rng = random.Random(42)
+        for number in range(count):
+            first_name = rng.choice(FIRST_NAMES)
+            last_name = rng.choice(LAST_NAMES)
+            yield Patient(
+                # Odd multiplier: unique, but scattered like uuid-based IDs
+                patient_id=f'PAT{number * 2654435761 % 2 ** 32:08X}',
+                first_name=first_name,
+                last_name=last_name,
+                date_of_birth=date(1950 + rng.randrange(70), rng.randrange(1, 13), rng.randrange(1, 29)),
+                gender=rng.choice(['male', 'female']),
+                phone=f'+91 {rng.randrange(70000, 99999)} {rng.randrange(10000, 99999)}',
+                email=f'{first_name.lower()}.{last_name.lower()}{number}@{rng.choice(DOMAINS)}',
+                address='Sample address',
+                city='Mumbai',
+                state='Maharashtra',
+                pincode='400001',
+            )
+
+    def timed(self, queryset, repeat):
+        """Best time to fetch the first page of 20 results, and the total match count"""
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset[:20])
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, queryset.count()
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            Patient.objects.bulk_create(self.synthetic_patients(options['patients']), batch_size=2000)
+            self.stdout.write(f"Created {options['patients']} patients in {time.perf_counter() - started:.1f} s")
+
+            started = time.perf_counter()
+            indexed = search.rebuild()
+            self.stdout.write(f'Indexed {indexed} patients in {time.perf_counter() - started:.1f} s')
+
+            sample = Patient.objects.order_by('?').first()
+            queries = [
+                ('name prefix', sample.first_name[:3]),
+                ('full name', f'{sample.first_name} {sample.last_name}'),
+                ('phone', sample.phone.replace('+91 ', '')[:7]),
+                ('patient ID', sample.patient_id[:7]),
+                ('email', sample.email.split('@')[0]),
+            ]
+            patients = Patient.objects.all()
+            for label, query in queries:
+                legacy_time, legacy_count = self.timed(legacy_search(patients, query), options['repeat'])
+                indexed_time, indexed_count = self.timed(search.search_patients(patients, query), options['repeat'])
+                self.stdout.write(
+                    f'  {label:<12} {query!r:<28} legacy {legacy_time * 1000:8.2f} ms ({legacy_count} matches)  '
+                    f'indexed {indexed_time * 1000:8.2f} ms ({indexed_count} ranked)'
+                )
+            transaction.set_rollback(True)
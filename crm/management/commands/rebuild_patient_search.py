@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from crm import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient search index (e.g. after bulk imports that bypass Patient.save)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} patients'))
@@ -0,0 +1,88 @@
+# Generated by Django 5.0.1 on 2026-10-17 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_FTS = [
+    # External-content FTS5 table over crm_patientsearchindex.document with
+    # prefix indexes for 2 and 3 character prefixes
+    """CREATE VIRTUAL TABLE crm_patient_fts USING fts5(
+        document, content='crm_patientsearchindex', content_rowid='patient_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER crm_patient_fts_insert AFTER INSERT ON crm_patientsearchindex BEGIN
+        INSERT INTO crm_patient_fts(rowid, document) VALUES (new.patient_id, new.document);
+    END""",
+    """CREATE TRIGGER crm_patient_fts_delete AFTER DELETE ON crm_patientsearchindex BEGIN
+        INSERT INTO crm_patient_fts(crm_patient_fts, rowid, document) VALUES ('delete', old.patient_id, old.document);
+    END""",
+    """CREATE TRIGGER crm_patient_fts_update AFTER UPDATE ON crm_patientsearchindex BEGIN
+        INSERT INTO crm_patient_fts(crm_patient_fts, rowid, document) VALUES ('delete', old.patient_id, old.document);
+        INSERT INTO crm_patient_fts(rowid, document) VALUES (new.patient_id, new.document);
+    END""",
+]
+
+POSTGRES_TRIGRAM = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX crm_patient_search_trgm ON crm_patientsearchindex USING gin (document gin_trgm_ops)',
+]
+
+
+def create_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Without FTS5, crm.search falls back to scanning the documents
+                return
+        statements = SQLITE_FTS
+    elif vendor == 'postgresql':
+        statements = POSTGRES_TRIGRAM
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for trigger in ['crm_patient_fts_insert', 'crm_patient_fts_delete', 'crm_patient_fts_update']:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS crm_patient_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS crm_patient_search_trgm')
+
+
+def index_patients(apps, schema_editor):
+    from crm.search import build_document
+    Patient = apps.get_model('crm', 'Patient')
+    PatientSearchIndex = apps.get_model('crm', 'PatientSearchIndex')
+    PatientSearchIndex.objects.bulk_create(
+        (PatientSearchIndex(patient_id=patient.pk, document=build_document(patient)) for patient in Patient.objects.iterator()),
+        batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchIndex',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='crm.patient')),
+                ('document', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Patient Search Index',
+                'verbose_name_plural': 'Patient Search Index',
+            },
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+        migrations.RunPython(index_patients, migrations.RunPython.noop),
+    ]
@@ -194,6 +194,19 @@ class Patient(models.Model):
         return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
 
 
+class PatientSearchIndex(models.Model):
+    """Normalized search text for a patient, rebuilt on every save (see crm.search)"""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='search_index')
+    document = models.TextField()
+    
+    class Meta:
+        verbose_name = "Patient Search Index"
+        verbose_name_plural = "Patient Search Index"
+    
+    def __str__(self):
+        return self.document
+
+
 class Appointment(models.Model):
     """Appointment scheduling and management"""
     STATUS_CHOICES = [
@@ -0,0 +1,45 @@
+from .models import Appointment, Patient, Treatment
+
+# Relations str() walks for each model, so choice lists and admin columns
+# showing these objects can load them in the same query
+STR_RELATIONS = {
+    Appointment: ('patient', 'doctor'),
+    Treatment: ('patient',),
+}
+
+
+def doctor_patients(doctor):
+    """Patients who have had an appointment with the doctor"""
+    return Patient.objects.filter(pk__in=Appointment.objects.filter(doctor=doctor).values('patient_id'))
+
+
+def shape(queryset, select_related=(), prefetch_related=(), only=()):
+    """Apply a query plan to a queryset"""
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+    if only:
+        queryset = queryset.only(*only)
+    return queryset
+
+
+def for_choices(queryset):
+    """Queryset whose objects can be printed without extra queries"""
+    return shape(queryset, STR_RELATIONS.get(queryset.model, ()))
+
+
+class QueryPlanMixin:
+    """Shape the view's queryset with its declared query plan.
+
+    ``select_related`` and ``prefetch_related`` list every relation the
+    template and the models' ``__str__`` follow, so a page costs the same
+    number of queries whatever its row count; ``only_fields`` narrows wide
+    rows to the columns the template shows.
+    """
+    select_related = ()
+    prefetch_related = ()
+    only_fields = ()
+
+    def get_queryset(self):
+        return shape(super().get_queryset(), self.select_related, self.prefetch_related, self.only_fields)
@@ -0,0 +1,107 @@
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import Q
+
+from .models import Patient, PatientSearchIndex
+
+# SQLite FTS5 table shadowing PatientSearchIndex.document (see migration 0002)
+FTS_TABLE = 'crm_patient_fts'
+
+TOKEN = re.compile(r'[a-z0-9]+')
+PHONE_QUERY = re.compile(r'[\d\s()+.-]*\d[\d\s()+.-]*')
+
+_fts_tables = {}
+
+
+def normalize(text):
+    """Lowercase text with accents removed"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def digits(text):
+    return re.sub(r'\D', '', text or '')
+
+
+def build_document(patient):
+    """Search text for a patient: name, ID, email and phone tokens"""
+    parts = [patient.first_name, patient.middle_name, patient.last_name, patient.patient_id, patient.email]
+    tokens = TOKEN.findall(normalize(' '.join(part for part in parts if part)))
+    patient_id = normalize(patient.patient_id)
+    if patient_id.startswith('pat'):
+        # Staff often type the ID without its prefix
+        tokens.append(patient_id[3:])
+    phone = digits(patient.phone)
+    if phone:
+        # With and without the country code
+        tokens.extend({phone, phone[-10:]})
+    return ' '.join(tokens)
+
+
+def query_tokens(query):
+    """Tokens a query must match as prefixes; phone numbers become one digit string"""
+    if PHONE_QUERY.fullmatch(query.strip()):
+        return [digits(query)]
+    return TOKEN.findall(normalize(query))
+
+
+def index_patient(sender, instance, **kwargs):
+    """post_save handler for Patient"""
+    PatientSearchIndex.objects.update_or_create(patient=instance, defaults={'document': build_document(instance)})
+
+
+def rebuild(chunk_size=2000):
+    """Recreate the search documents of every patient"""
+    count = 0
+    PatientSearchIndex.objects.all().delete()
+    batch = []
+    for patient in Patient.objects.order_by().only(
+        'pk', 'first_name', 'middle_name', 'last_name', 'patient_id', 'email', 'phone'
+    ).iterator(chunk_size=chunk_size):
+        batch.append(PatientSearchIndex(patient=patient, document=build_document(patient)))
+        if len(batch) >= chunk_size:
+            count += len(PatientSearchIndex.objects.bulk_create(batch))
+            batch = []
+    count += len(PatientSearchIndex.objects.bulk_create(batch))
+    return count
+
+
+def has_fts_table(connection):
+    if connection.alias not in _fts_tables:
+        _fts_tables[connection.alias] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[connection.alias]
+
+
+def search_patients(queryset, query):
+    """Patients in the queryset whose words start with every query token, best match first.
+
+    The match runs inside the caller's query, so filters such as status
+    or a doctor's patients apply before ranking and pagination.
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return queryset
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite' and has_fts_table(connection):
+        # Prefix queries are served by the FTS5 prefix indexes; rank is bm25
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        pk_column = connection.ops.quote_name(queryset.model._meta.pk.column)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.{pk_column}', f'{FTS_TABLE} MATCH %s'],
+            params=[' '.join(f'"{token}"*' for token in tokens)],
+            select={'search_rank': f'{FTS_TABLE}.rank'},
+            order_by=['search_rank', 'pk'],
+        )
+
+    # Tokens are [a-z0-9]+, so they are safe inside the pattern
+    queryset = queryset.filter(*[Q(search_index__document__regex=f'(^| ){token}') for token in tokens])
+    if connection.vendor == 'postgresql':
+        # The trigram GIN index serves the regex filters and the similarity rank
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        return queryset.annotate(
+            search_rank=TrigramWordSimilarity(' '.join(tokens), 'search_index__document')
+        ).order_by('-search_rank', 'pk')
+    return queryset.order_by('-created_at')
@@ -0,0 +1,79 @@
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Appointment, Payment
+
+ACTIVE_STATUSES = ['scheduled', 'confirmed']
+
+DashboardStats = namedtuple('DashboardStats', [
+    'date', 'today_appointments', 'week_appointments', 'month_appointments',
+    'total_patients', 'today_revenue', 'month_revenue',
+])
+
+
+def cache_key(doctor_id):
+    return f'crm:dashboard_stats:{doctor_id}'
+
+
+def compute_stats(doctor, today):
+    """All dashboard counts and revenue sums for one doctor, in two queries"""
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+
+    appointments = Appointment.objects.filter(doctor=doctor).aggregate(
+        today_appointments=Count('pk', filter=Q(scheduled_date=today, status__in=ACTIVE_STATUSES)),
+        week_appointments=Count('pk', filter=Q(
+            scheduled_date__gte=week_start, scheduled_date__lte=today + timedelta(days=7)
+        )),
+        month_appointments=Count('pk', filter=Q(scheduled_date__gte=month_start)),
+        total_patients=Count('patient', distinct=True),
+    )
+    revenue = Payment.objects.filter(
+        appointment__doctor=doctor,
+        payment_date__date__gte=month_start,
+        payment_status='completed'
+    ).aggregate(
+        today_revenue=Sum('amount', filter=Q(payment_date__date=today)),
+        month_revenue=Sum('amount'),
+    )
+    return DashboardStats(
+        date=today,
+        today_revenue=revenue['today_revenue'] or 0,
+        month_revenue=revenue['month_revenue'] or 0,
+        **appointments
+    )
+
+
+def get_dashboard_stats(doctor):
+    """Cached DashboardStats for today; appointment, payment and patient changes clear it"""
+    today = timezone.now().date()
+    stats = cache.get(cache_key(doctor.pk))
+    if stats is None or stats.date != today:
+        stats = compute_stats(doctor, today)
+        cache.set(cache_key(doctor.pk), stats, timeout=getattr(settings, 'CRM_DASHBOARD_STATS_CACHE_SECONDS', 300))
+    return stats
+
+
+def invalidate(doctor_ids):
+    cache.delete_many([cache_key(doctor_id) for doctor_id in set(doctor_ids) if doctor_id is not None])
+
+
+def invalidate_appointment(sender, instance, **kwargs):
+    """post_save/post_delete handler for Appointment"""
+    invalidate([instance.doctor_id])
+
+
+def invalidate_payment(sender, instance, **kwargs):
+    """post_save/post_delete handler for Payment"""
+    if instance.appointment_id:
+        invalidate(Appointment.objects.filter(pk=instance.appointment_id).values_list('doctor_id', flat=True))
+
+
+def invalidate_patient(sender, instance, **kwargs):
+    """post_save/post_delete handler for Patient"""
+    invalidate(Appointment.objects.filter(patient_id=instance.pk).values_list('doctor_id', flat=True))
@@ -1,3 +1,224 @@
-from django.test import TestCase
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Appointment, Clinic, Doctor, Patient, Payment, Prescription, PrescriptionMedicine, Treatment
+from .search import search_patients
+
+
+def create_patient(first_name, last_name='Sharma', **kwargs):
+    fields = {
+        'date_of_birth': date(1990, 1, 1),
+        'gender': 'male',
+        'phone': '9876543210',
+        'address': '1 MG Road',
+        'city': 'Pune',
+        'state': 'Maharashtra',
+        'pincode': '411001',
+    }
+    fields.update(kwargs)
+    return Patient.objects.create(first_name=first_name, last_name=last_name, **fields)
+
+
+def create_doctor(username, clinic=None):
+    if clinic is None:
+        clinic = Clinic.objects.create(
+            name='MediWell Pune', slug=f'mediwell-{username}', phone='0201234567', email='pune@example.com',
+            address='1 MG Road', city='Pune', state='Maharashtra', pincode='411001'
+        )
+    user = User.objects.create_user(username, password='secret')
+    return Doctor.objects.create(
+        user=user, clinic=clinic, first_name='Asha', last_name=username.title(),
+        specialization='General Medicine', qualification='MBBS'
+    )
+
+
+def create_appointment(doctor, patient, **kwargs):
+    fields = {
+        'scheduled_date': date.today(),
+        'scheduled_time': '10:00',
+        'reason': 'Checkup',
+        'consultation_fee': 500,
+    }
+    fields.update(kwargs)
+    return Appointment.objects.create(doctor=doctor, clinic=doctor.clinic, patient=patient, **fields)
+
+
+class PatientSearchTests(TestCase):
+
+    def test_prefix_match(self):
+        create_patient('Joseph')
+        create_patient('Anita', last_name='Josephine')
+        create_patient('Rajesh')
+
+        names = {patient.first_name for patient in search_patients(Patient.objects.all(), 'jos')}
+        self.assertEqual(names, {'Joseph', 'Anita'})
+        self.assertFalse(search_patients(Patient.objects.all(), 'seph').exists())
+
+    def test_scope_applies_before_ranking(self):
+        for number in range(30):
+            create_patient('John', last_name=f'Active{number}')
+        for number in range(3):
+            create_patient('John', last_name=f'Inactive{number}', is_active=False)
+
+        inactive = search_patients(Patient.objects.filter(is_active=False), 'john')
+        self.assertEqual(inactive.count(), 3)
+        self.assertEqual({patient.last_name for patient in inactive}, {'Inactive0', 'Inactive1', 'Inactive2'})
+
+    def test_fallback_matches_prefixes_only(self):
+        create_patient('Joseph')
+        create_patient('Anita', last_name='Josephine', is_active=False)
+        create_patient('Rajesh')
+
+        with mock.patch('crm.search.has_fts_table', return_value=False):
+            names = {patient.first_name for patient in search_patients(Patient.objects.all(), 'jos')}
+            self.assertEqual(names, {'Joseph', 'Anita'})
+            self.assertFalse(search_patients(Patient.objects.all(), 'seph').exists())
+            self.assertEqual(search_patients(Patient.objects.filter(is_active=False), 'jos').count(), 1)
+
+
+class AutocompleteTests(TestCase):
+
+    def test_patient_autocomplete_pages_through_scoped_matches(self):
+        doctor = create_doctor('meera')
+        other = create_doctor('kiran', clinic=doctor.clinic)
+        expected = set()
+        for number in range(210):
+            patient = create_patient('John', last_name=f'Seen{number}')
+            create_appointment(doctor, patient)
+            expected.add(patient.pk)
+        for number in range(5):
+            create_appointment(other, create_patient('John', last_name=f'Other{number}'))
+        self.client.force_login(doctor.user)
+
+        seen = []
+        page = 1
+        while True:
+            data = self.client.get(reverse('crm:patient_autocomplete'), {'q': 'john', 'page': page}).json()
+            seen.extend(result['id'] for result in data['results'])
+            if not data['more']:
+                break
+            page += 1
+
+        self.assertEqual(page, 11)
+        self.assertEqual(len(seen), 210)
+        self.assertEqual(set(seen), expected)
+
+
+# The manifest storage needs collectstatic; pages only need plain static URLs here
+PLAIN_STATIC = override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+
+
+@PLAIN_STATIC
+class DoctorLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor('meera')
+        for number in range(3):
+            create_appointment(cls.doctor, create_patient('John', last_name=f'Seen{number}'))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.doctor.user)
+
+    def doctor_lookups(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len([query for query in context.captured_queries if 'FROM "crm_doctor"' in query['sql']])
+
+    def test_one_doctor_lookup_per_request(self):
+        for name in ('dashboard', 'appointment_list', 'dashboard_stats', 'patient_autocomplete'):
+            with self.subTest(view=name):
+                cache.clear()
+                url = reverse(f'crm:{name}')
+                self.assertEqual(self.doctor_lookups(url), 1)
+                # The profile is cached between requests as well
+                self.assertEqual(self.doctor_lookups(url), 0)
+
+    def test_patient_list_does_not_repeat_the_lookup(self):
+        self.assertLessEqual(self.doctor_lookups(reverse('crm:patient_list')), 1)
+
+    def test_cold_profile_costs_one_query(self):
+        url = reverse('crm:appointment_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url)
+        cache.delete(f'crm:doctor:{self.doctor.user_id}')
+        with self.assertNumQueries(len(warm.captured_queries) + 1):
+            self.client.get(url)
+
+
+@PLAIN_STATIC
+class QueryCountTests(TestCase):
+    """Page query counts must not grow with the number of rows shown"""
+
+    pages = [
+        ('dashboard', {}),
+        ('dashboard_stats', {}),
+        ('patient_list', {}),
+        ('patient_list', {'search': 'john'}),
+        ('appointment_list', {}),
+        ('appointment_create', {}),
+        ('prescription_create', {}),
+        ('patient_autocomplete', {'q': 'john'}),
+        ('appointment_autocomplete', {'q': 'john'}),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = create_doctor('meera')
+        cls.patient = create_patient('John', last_name='Regular')
+        cls.rows = 0
+
+    def setUp(self):
+        self.client.force_login(self.doctor.user)
+
+    def add_rows(self, rows):
+        """Grow the doctor's patients and the regular patient's history to `rows` each"""
+        for number in range(self.rows, rows):
+            patient = create_patient('John', last_name=f'Seen{number}')
+            create_appointment(self.doctor, patient)
+            appointment = create_appointment(self.doctor, self.patient, scheduled_time=f'{9 + number % 8}:00')
+            treatment = Treatment.objects.create(
+                patient=self.patient, doctor=self.doctor, appointment=appointment, treatment_type='consultation',
+                name='Review', description='Review', diagnosis='Fever', treatment_plan='Rest'
+            )
+            prescription = Prescription.objects.create(
+                patient=self.patient, doctor=self.doctor, treatment=treatment, diagnosis='Fever', instructions='Rest'
+            )
+            PrescriptionMedicine.objects.create(
+                prescription=prescription, medicine_name='Paracetamol', dosage='500mg', frequency='Twice daily',
+                duration='3 days'
+            )
+            Payment.objects.create(patient=self.patient, appointment=appointment, amount=500)
+        self.rows = rows
+
+    def query_counts(self):
+        urls = [(reverse(f'crm:{name}'), params) for name, params in self.pages]
+        urls.append((reverse('crm:patient_detail', args=[self.patient.pk]), {}))
+        counts = {}
+        for url, params in urls:
+            # The first request also pays one-off costs such as creating the site settings row
+            self.assertEqual(self.client.get(url, params).status_code, 200, url)
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                self.client.get(url, params)
+            counts[url, tuple(params.items())] = len(context.captured_queries)
+        return counts
+
+    def test_counts_do_not_grow_with_rows(self):
+        self.add_rows(20)
+        small = self.query_counts()
+        self.add_rows(200)
+        self.assertEqual(self.query_counts(), small)
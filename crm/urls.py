@@ -42,4 +42,6 @@ urlpatterns = [
     path('api/patient/<int:patient_id>/appointments/', views.get_patient_appointments, name='patient_appointments'),
     path('api/patient/<int:patient_id>/treatments/', views.get_patient_treatments, name='patient_treatments'),
     path('api/dashboard/stats/', views.dashboard_stats, name='dashboard_stats'),
+    path('api/patients/autocomplete/', views.patient_autocomplete, name='patient_autocomplete'),
+    path('api/appointments/autocomplete/', views.appointment_autocomplete, name='appointment_autocomplete'),
 ]
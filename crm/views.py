@@ -3,25 +3,27 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView
 from django.contrib import messages
-from django.db.models import Q, Count, Sum
-from django.utils import timezone
+from django.db.models import Q
 from django.http import JsonResponse
-from django.core.paginator import Paginator
 from django.urls import reverse_lazy
-from datetime import datetime, timedelta
-import json
+from django.conf import settings
+from datetime import datetime
 
 from .models import (
-    Clinic, Doctor, Patient, Appointment, Treatment, 
+    Clinic, Patient, Appointment, Treatment, 
     Prescription, Payment, MedicalRecord
 )
 from .forms import (
     PatientForm, AppointmentForm, TreatmentForm, PrescriptionForm, 
     PrescriptionMedicineFormSet, PaymentForm, MedicalRecordForm
 )
+from .doctors import DoctorMixin, get_doctor
+from .queries import QueryPlanMixin, doctor_patients, for_choices
+from .search import search_patients
+from .stats import ACTIVE_STATUSES, get_dashboard_stats
 
 
-class CRMDashboardView(LoginRequiredMixin, TemplateView):
+class CRMDashboardView(LoginRequiredMixin, DoctorMixin, TemplateView):
     """Main CRM Dashboard"""
     template_name = 'crm/dashboard.html'
     
@@ -29,98 +31,62 @@ class CRMDashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Get current user's doctor profile
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            context['doctor'] = doctor
-            context['clinic'] = doctor.clinic
-        except Doctor.DoesNotExist:
-            context['doctor'] = None
-            context['clinic'] = None
+        doctor = self.doctor
+        context['doctor'] = doctor
+        context['clinic'] = doctor.clinic if doctor else None
+        if not doctor:
             return context
         
         # Dashboard Statistics
-        today = timezone.now().date()
-        week_start = today - timedelta(days=today.weekday())
-        month_start = today.replace(day=1)
+        stats = get_dashboard_stats(doctor)
+        today = stats.date
+        context['today_appointments_count'] = stats.today_appointments
+        context['week_appointments'] = stats.week_appointments
+        context['month_appointments'] = stats.month_appointments
+        context['total_patients'] = stats.total_patients
+        context['today_revenue'] = stats.today_revenue
+        context['month_revenue'] = stats.month_revenue
         
         # Today's appointments
         context['today_appointments'] = Appointment.objects.filter(
             doctor=doctor,
             scheduled_date=today,
-            status__in=['scheduled', 'confirmed']
-        ).order_by('scheduled_time')
-        
-        # This week's appointments
-        context['week_appointments'] = Appointment.objects.filter(
-            doctor=doctor,
-            scheduled_date__gte=week_start,
-            scheduled_date__lte=today + timedelta(days=7)
-        ).count()
-        
-        # This month's appointments
-        context['month_appointments'] = Appointment.objects.filter(
-            doctor=doctor,
-            scheduled_date__gte=month_start
-        ).count()
-        
-        # Total patients
-        context['total_patients'] = Patient.objects.filter(
-            appointments__doctor=doctor
-        ).distinct().count()
+            status__in=ACTIVE_STATUSES
+        ).select_related('patient').order_by('scheduled_time')
         
         # Recent appointments
         context['recent_appointments'] = Appointment.objects.filter(
             doctor=doctor
-        ).order_by('-scheduled_date', '-scheduled_time')[:5]
+        ).select_related('patient').order_by('-scheduled_date', '-scheduled_time')[:5]
         
         # Upcoming appointments
         context['upcoming_appointments'] = Appointment.objects.filter(
             doctor=doctor,
             scheduled_date__gte=today,
-            status__in=['scheduled', 'confirmed']
-        ).order_by('scheduled_date', 'scheduled_time')[:5]
+            status__in=ACTIVE_STATUSES
+        ).select_related('patient').order_by('scheduled_date', 'scheduled_time')[:5]
         
         # Recent patients
         context['recent_patients'] = Patient.objects.filter(
             appointments__doctor=doctor
         ).distinct().order_by('-created_at')[:5]
         
-        # Revenue statistics
-        context['today_revenue'] = Payment.objects.filter(
-            appointment__doctor=doctor,
-            payment_date__date=today,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        context['month_revenue'] = Payment.objects.filter(
-            appointment__doctor=doctor,
-            payment_date__date__gte=month_start,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
         return context
 
 
-class PatientListView(LoginRequiredMixin, ListView):
+class PatientListView(LoginRequiredMixin, QueryPlanMixin, ListView):
     """Patient list with search and filters"""
     model = Patient
     template_name = 'crm/patients.html'
     context_object_name = 'patients'
     paginate_by = 20
+    only_fields = [
+        'id', 'patient_id', 'first_name', 'last_name', 'date_of_birth', 'gender',
+        'phone', 'email', 'city', 'is_active', 'created_at'
+    ]
     
     def get_queryset(self):
-        queryset = Patient.objects.all()
-        
-        # Search functionality
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(patient_id__icontains=search) |
-                Q(phone__icontains=search) |
-                Q(email__icontains=search)
-            )
+        queryset = super().get_queryset()
         
         # Filter by status
         status = self.request.GET.get('status')
@@ -129,6 +95,11 @@ class PatientListView(LoginRequiredMixin, ListView):
         elif status == 'inactive':
             queryset = queryset.filter(is_active=False)
         
+        # Search functionality (results come ordered by relevance)
+        search = self.request.GET.get('search')
+        if search:
+            return search_patients(queryset, search)
+        
         return queryset.order_by('-created_at')
     
     def get_context_data(self, **kwargs):
@@ -146,12 +117,12 @@ class PatientDetailView(LoginRequiredMixin, DetailView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        patient = self.get_object()
+        patient = self.object
         
         # Get patient's appointments
         context['appointments'] = Appointment.objects.filter(
             patient=patient
-        ).order_by('-scheduled_date', '-scheduled_time')
+        ).select_related('doctor').order_by('-scheduled_date', '-scheduled_time')
         
         # Get patient's treatments
         context['treatments'] = Treatment.objects.filter(
@@ -161,7 +132,7 @@ class PatientDetailView(LoginRequiredMixin, DetailView):
         # Get patient's prescriptions
         context['prescriptions'] = Prescription.objects.filter(
             patient=patient
-        ).order_by('-prescription_date')
+        ).select_related('doctor').prefetch_related('medicines').order_by('-prescription_date')
         
         # Get patient's medical records
         context['medical_records'] = MedicalRecord.objects.filter(
@@ -176,22 +147,20 @@ class PatientDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class AppointmentListView(LoginRequiredMixin, ListView):
+class AppointmentListView(LoginRequiredMixin, DoctorMixin, QueryPlanMixin, ListView):
     """Appointment list with filters"""
     model = Appointment
     template_name = 'crm/appointments.html'
     context_object_name = 'appointments'
     paginate_by = 20
+    select_related = ['patient', 'doctor']
     
     def get_queryset(self):
-        queryset = Appointment.objects.all()
+        queryset = super().get_queryset()
         
         # Filter by doctor if user is a doctor
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            queryset = queryset.filter(doctor=doctor)
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            queryset = queryset.filter(doctor=self.doctor)
         
         # Filter by date
         date_filter = self.request.GET.get('date')
@@ -217,15 +186,16 @@ class AppointmentListView(LoginRequiredMixin, ListView):
         return context
 
 
-class AppointmentDetailView(LoginRequiredMixin, DetailView):
+class AppointmentDetailView(LoginRequiredMixin, QueryPlanMixin, DetailView):
     """Appointment detail view"""
     model = Appointment
     template_name = 'crm/appointment_detail.html'
     context_object_name = 'appointment'
+    select_related = ['patient', 'doctor', 'clinic']
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        appointment = self.get_object()
+        appointment = self.object
         
         # Get related treatments
         context['treatments'] = Treatment.objects.filter(
@@ -240,22 +210,20 @@ class AppointmentDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class TreatmentListView(LoginRequiredMixin, ListView):
+class TreatmentListView(LoginRequiredMixin, DoctorMixin, QueryPlanMixin, ListView):
     """Treatment list"""
     model = Treatment
     template_name = 'crm/treatments.html'
     context_object_name = 'treatments'
     paginate_by = 20
+    select_related = ['patient', 'doctor']
     
     def get_queryset(self):
-        queryset = Treatment.objects.all()
+        queryset = super().get_queryset()
         
         # Filter by doctor if user is a doctor
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            queryset = queryset.filter(doctor=doctor)
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            queryset = queryset.filter(doctor=self.doctor)
         
         # Filter by patient
         patient_id = self.request.GET.get('patient')
@@ -277,20 +245,21 @@ class TreatmentListView(LoginRequiredMixin, ListView):
         return context
 
 
-class TreatmentDetailView(LoginRequiredMixin, DetailView):
+class TreatmentDetailView(LoginRequiredMixin, QueryPlanMixin, DetailView):
     """Treatment detail view"""
     model = Treatment
     template_name = 'crm/treatment_detail.html'
     context_object_name = 'treatment'
+    select_related = ['patient', 'doctor', 'appointment']
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        treatment = self.get_object()
+        treatment = self.object
         
         # Get related prescriptions
         context['prescriptions'] = Prescription.objects.filter(
             treatment=treatment
-        ).order_by('-prescription_date')
+        ).select_related('doctor').prefetch_related('medicines').order_by('-prescription_date')
         
         # Get related payments
         context['payments'] = Payment.objects.filter(
@@ -300,22 +269,21 @@ class TreatmentDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
-class PrescriptionListView(LoginRequiredMixin, ListView):
+class PrescriptionListView(LoginRequiredMixin, DoctorMixin, QueryPlanMixin, ListView):
     """Prescription list"""
     model = Prescription
     template_name = 'crm/prescriptions.html'
     context_object_name = 'prescriptions'
     paginate_by = 20
+    select_related = ['patient', 'doctor']
+    prefetch_related = ['medicines']
     
     def get_queryset(self):
-        queryset = Prescription.objects.all()
+        queryset = super().get_queryset()
         
         # Filter by doctor if user is a doctor
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            queryset = queryset.filter(doctor=doctor)
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            queryset = queryset.filter(doctor=self.doctor)
         
         # Filter by patient
         patient_id = self.request.GET.get('patient')
@@ -330,31 +298,31 @@ class PrescriptionListView(LoginRequiredMixin, ListView):
         return context
 
 
-class PrescriptionDetailView(LoginRequiredMixin, DetailView):
+class PrescriptionDetailView(LoginRequiredMixin, QueryPlanMixin, DetailView):
     """Prescription detail view"""
     model = Prescription
     template_name = 'crm/prescription_detail.html'
     context_object_name = 'prescription'
+    select_related = ['patient', 'doctor', 'treatment__patient']
+    prefetch_related = ['medicines']
 
 
-class PaymentListView(LoginRequiredMixin, ListView):
+class PaymentListView(LoginRequiredMixin, DoctorMixin, QueryPlanMixin, ListView):
     """Payment list"""
     model = Payment
     template_name = 'crm/payments.html'
     context_object_name = 'payments'
     paginate_by = 20
+    select_related = ['patient', 'appointment', 'treatment']
     
     def get_queryset(self):
-        queryset = Payment.objects.all()
+        queryset = super().get_queryset()
         
         # Filter by doctor if user is a doctor
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
+        if self.doctor:
             queryset = queryset.filter(
-                Q(appointment__doctor=doctor) | Q(treatment__doctor=doctor)
+                Q(appointment__doctor=self.doctor) | Q(treatment__doctor=self.doctor)
             )
-        except Doctor.DoesNotExist:
-            pass
         
         # Filter by payment status
         status = self.request.GET.get('status')
@@ -380,22 +348,20 @@ class PaymentListView(LoginRequiredMixin, ListView):
         return context
 
 
-class MedicalRecordListView(LoginRequiredMixin, ListView):
+class MedicalRecordListView(LoginRequiredMixin, DoctorMixin, QueryPlanMixin, ListView):
     """Medical records list"""
     model = MedicalRecord
     template_name = 'crm/medical_records.html'
     context_object_name = 'medical_records'
     paginate_by = 20
+    select_related = ['patient', 'doctor']
     
     def get_queryset(self):
-        queryset = MedicalRecord.objects.all()
+        queryset = super().get_queryset()
         
         # Filter by doctor if user is a doctor
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            queryset = queryset.filter(doctor=doctor)
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            queryset = queryset.filter(doctor=self.doctor)
         
         # Filter by patient
         patient_id = self.request.GET.get('patient')
@@ -455,37 +421,60 @@ def get_patient_treatments(request, patient_id):
 @login_required
 def dashboard_stats(request):
     """Get dashboard statistics for AJAX requests"""
-    try:
-        doctor = Doctor.objects.get(user=request.user)
-        today = timezone.now().date()
-        
-        # Today's appointments
-        today_appointments = Appointment.objects.filter(
-            doctor=doctor,
-            scheduled_date=today,
-            status__in=['scheduled', 'confirmed']
-        ).count()
-        
-        # This month's revenue
-        month_start = today.replace(day=1)
-        month_revenue = Payment.objects.filter(
-            appointment__doctor=doctor,
-            payment_date__date__gte=month_start,
-            payment_status='completed'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Total patients
-        total_patients = Patient.objects.filter(
-            appointments__doctor=doctor
-        ).distinct().count()
-        
+    doctor = get_doctor(request)
+    if doctor:
+        stats = get_dashboard_stats(doctor)
         return JsonResponse({
-            'today_appointments': today_appointments,
-            'month_revenue': float(month_revenue),
-            'total_patients': total_patients
+            'today_appointments': stats.today_appointments,
+            'month_revenue': float(stats.month_revenue),
+            'total_patients': stats.total_patients
         })
-    except Doctor.DoesNotExist:
-        return JsonResponse({'error': 'Doctor profile not found'})
+    return JsonResponse({'error': 'Doctor profile not found'})
+
+
+def autocomplete_response(request, queryset):
+    """One page of autocomplete results as {'results': [{'id', 'text'}], 'more': bool}"""
+    page_size = getattr(settings, 'CRM_AUTOCOMPLETE_PAGE_SIZE', 20)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * page_size
+    objects = list(queryset[offset:offset + page_size + 1])
+    return JsonResponse({
+        'results': [{'id': obj.pk, 'text': str(obj)} for obj in objects[:page_size]],
+        'more': len(objects) > page_size
+    })
+
+
+@login_required
+def patient_autocomplete(request):
+    """Patients matching ?q= for the patient autocomplete widget"""
+    doctor = get_doctor(request)
+    queryset = doctor_patients(doctor) if doctor else Patient.objects.all()
+    queryset = queryset.only('pk', 'first_name', 'last_name', 'patient_id')
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = search_patients(queryset, query)
+    else:
+        queryset = queryset.order_by('-created_at')
+    return autocomplete_response(request, queryset)
+
+
+@login_required
+def appointment_autocomplete(request):
+    """Appointments for the appointment autocomplete widget, optionally of one ?patient="""
+    queryset = for_choices(Appointment.objects.all())
+    doctor = get_doctor(request)
+    if doctor:
+        queryset = queryset.filter(doctor=doctor)
+    patient_id = request.GET.get('patient', '')
+    if patient_id.isdigit():
+        queryset = queryset.filter(patient_id=patient_id)
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = queryset.filter(patient__in=search_patients(Patient.objects.all(), query).values('pk'))
+    return autocomplete_response(request, queryset.order_by('-scheduled_date', '-scheduled_time'))
 
 
 # Dynamic Form Views
@@ -513,78 +502,45 @@ class PatientUpdateView(LoginRequiredMixin, UpdateView):
         return super().form_valid(form)
 
 
-class AppointmentCreateView(LoginRequiredMixin, CreateView):
+class AppointmentCreateView(LoginRequiredMixin, DoctorMixin, CreateView):
     """Schedule new appointment"""
     model = Appointment
     form_class = AppointmentForm
     template_name = 'crm/appointment_form.html'
     success_url = reverse_lazy('crm:appointment_list')
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            kwargs['doctor'] = doctor
-        except Doctor.DoesNotExist:
-            pass
-        return kwargs
-    
     def form_valid(self, form):
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            form.instance.doctor = doctor
-            form.instance.clinic = doctor.clinic
-            form.instance.consultation_fee = doctor.consultation_fee
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            form.instance.doctor = self.doctor
+            form.instance.clinic = self.doctor.clinic
+            form.instance.consultation_fee = self.doctor.consultation_fee
         
         messages.success(self.request, 'Appointment scheduled successfully!')
         return super().form_valid(form)
 
 
-class TreatmentCreateView(LoginRequiredMixin, CreateView):
+class TreatmentCreateView(LoginRequiredMixin, DoctorMixin, CreateView):
     """Add new treatment"""
     model = Treatment
     form_class = TreatmentForm
     template_name = 'crm/treatment_form.html'
     success_url = reverse_lazy('crm:treatment_list')
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            kwargs['doctor'] = doctor
-        except Doctor.DoesNotExist:
-            pass
-        return kwargs
-    
     def form_valid(self, form):
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            form.instance.doctor = doctor
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            form.instance.doctor = self.doctor
         
         messages.success(self.request, 'Treatment added successfully!')
         return super().form_valid(form)
 
 
-class PrescriptionCreateView(LoginRequiredMixin, CreateView):
+class PrescriptionCreateView(LoginRequiredMixin, DoctorMixin, CreateView):
     """Create new prescription"""
     model = Prescription
     form_class = PrescriptionForm
     template_name = 'crm/prescription_form.html'
     success_url = reverse_lazy('crm:prescription_list')
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            kwargs['doctor'] = doctor
-        except Doctor.DoesNotExist:
-            pass
-        return kwargs
-    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if self.request.POST:
@@ -594,11 +550,8 @@ class PrescriptionCreateView(LoginRequiredMixin, CreateView):
         return context
     
     def form_valid(self, form):
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            form.instance.doctor = doctor
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            form.instance.doctor = self.doctor
         
         context = self.get_context_data()
         medicine_formset = context['medicine_formset']
@@ -613,49 +566,28 @@ class PrescriptionCreateView(LoginRequiredMixin, CreateView):
             return self.form_invalid(form)
 
 
-class PaymentCreateView(LoginRequiredMixin, CreateView):
+class PaymentCreateView(LoginRequiredMixin, DoctorMixin, CreateView):
     """Record new payment"""
     model = Payment
     form_class = PaymentForm
     template_name = 'crm/payment_form.html'
     success_url = reverse_lazy('crm:payment_list')
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            kwargs['doctor'] = doctor
-        except Doctor.DoesNotExist:
-            pass
-        return kwargs
-    
     def form_valid(self, form):
         messages.success(self.request, 'Payment recorded successfully!')
         return super().form_valid(form)
 
 
-class MedicalRecordCreateView(LoginRequiredMixin, CreateView):
+class MedicalRecordCreateView(LoginRequiredMixin, DoctorMixin, CreateView):
     """Add new medical record"""
     model = MedicalRecord
     form_class = MedicalRecordForm
     template_name = 'crm/medical_record_form.html'
     success_url = reverse_lazy('crm:medical_record_list')
     
-    def get_form_kwargs(self):
-        kwargs = super().get_form_kwargs()
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            kwargs['doctor'] = doctor
-        except Doctor.DoesNotExist:
-            pass
-        return kwargs
-    
     def form_valid(self, form):
-        try:
-            doctor = Doctor.objects.get(user=self.request.user)
-            form.instance.doctor = doctor
-        except Doctor.DoesNotExist:
-            pass
+        if self.doctor:
+            form.instance.doctor = self.doctor
         
         messages.success(self.request, 'Medical record added successfully!')
         return super().form_valid(form)
@@ -666,17 +598,18 @@ class MedicalRecordCreateView(LoginRequiredMixin, CreateView):
 def quick_prescription(request, patient_id):
     """Quick prescription for a specific patient"""
     patient = get_object_or_404(Patient, id=patient_id)
+    doctor = get_doctor(request)
     
     if request.method == 'POST':
-        form = PrescriptionForm(request.POST, doctor=Doctor.objects.get(user=request.user))
+        form = PrescriptionForm(request.POST, doctor=doctor)
         if form.is_valid():
             prescription = form.save(commit=False)
-            prescription.doctor = Doctor.objects.get(user=request.user)
+            prescription.doctor = doctor
             prescription.save()
             messages.success(request, f'Prescription created for {patient.full_name}!')
             return redirect('crm:patient_detail', patient_id=patient.id)
     else:
-        form = PrescriptionForm(initial={'patient': patient}, doctor=Doctor.objects.get(user=request.user))
+        form = PrescriptionForm(initial={'patient': patient}, doctor=doctor)
     
     return render(request, 'crm/quick_prescription.html', {
         'form': form,
@@ -688,19 +621,20 @@ def quick_prescription(request, patient_id):
 def quick_appointment(request, patient_id):
     """Quick appointment for a specific patient"""
     patient = get_object_or_404(Patient, id=patient_id)
+    doctor = get_doctor(request)
     
     if request.method == 'POST':
-        form = AppointmentForm(request.POST, doctor=Doctor.objects.get(user=request.user))
+        form = AppointmentForm(request.POST, doctor=doctor)
         if form.is_valid():
             appointment = form.save(commit=False)
-            appointment.doctor = Doctor.objects.get(user=request.user)
-            appointment.clinic = appointment.doctor.clinic
-            appointment.consultation_fee = appointment.doctor.consultation_fee
+            appointment.doctor = doctor
+            appointment.clinic = doctor.clinic
+            appointment.consultation_fee = doctor.consultation_fee
             appointment.save()
             messages.success(request, f'Appointment scheduled for {patient.full_name}!')
             return redirect('crm:patient_detail', patient_id=patient.id)
     else:
-        form = AppointmentForm(initial={'patient': patient}, doctor=Doctor.objects.get(user=request.user))
+        form = AppointmentForm(initial={'patient': patient}, doctor=doctor)
     
     return render(request, 'crm/quick_appointment.html', {
         'form': form,
@@ -0,0 +1,47 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class AutocompleteSelect(forms.Select):
+    """Select for large model choice fields whose options load on demand.
+
+    Only the empty and the selected options are rendered; the CRM
+    autocomplete script turns the select into a search box fed by ``url``.
+    The field still validates the posted PK against its own queryset, so
+    neither rendering nor validation reads more than the selected row.
+    ``forward`` names another field of the form whose value is passed on
+    to the endpoint (e.g. the patient whose appointments to list).
+    """
+    
+    class Media:
+        js = ['js/crm-autocomplete.js']
+    
+    def __init__(self, url, forward=None, attrs=None):
+        super().__init__(attrs)
+        self.url = url
+        self.forward = forward
+    
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        widget_attrs = context['widget']['attrs']
+        widget_attrs['data-autocomplete-url'] = str(self.url)
+        if self.forward:
+            widget_attrs['data-autocomplete-forward'] = self.forward
+        return context
+    
+    def selected_choices(self, value):
+        field = self.choices.field
+        choices = [] if field.empty_label is None else [('', field.empty_label)]
+        selected = [pk for pk in value if pk not in ('', None)]
+        if selected:
+            try:
+                choices.extend(self.choices.choice(obj) for obj in self.choices.queryset.filter(pk__in=selected))
+            except (ValueError, TypeError, ValidationError):
+                pass
+        return choices
+    
+    def optgroups(self, name, value, attrs=None):
+        return [
+            (None, [self.create_option(name, option_value, label, str(option_value) in value, index, attrs=attrs)], index)
+            for index, (option_value, label) in enumerate(self.selected_choices(value))
+        ]
@@ -56,6 +56,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -96,6 +98,23 @@ DATABASES = {
     }
 }
 
+# Analytics tracking can be moved off the CRM database onto its own alias
+# (see analytics.routers); dashboards read from the replica when one is set
+if env.bool('ANALYTICS_SEPARATE_DATABASE', default=False):
+    DATABASES['analytics'] = env.db(
+        'ANALYTICS_DATABASE_URL', default=f'sqlite:///{BASE_DIR / "analytics.sqlite3"}'
+    )
+    DATABASES['analytics'].setdefault('TEST', {})
+    if DATABASES['analytics']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES['analytics']['TEST'].setdefault('NAME', str(BASE_DIR / 'test_analytics.sqlite3'))
+if env('ANALYTICS_REPLICA_DATABASE_URL', default=None):
+    DATABASES['analytics_replica'] = env.db('ANALYTICS_REPLICA_DATABASE_URL')
+    DATABASES['analytics_replica']['TEST'] = {
+        'MIRROR': 'analytics' if 'analytics' in DATABASES else 'default'
+    }
+
+DATABASE_ROUTERS = ['analytics.routers.AnalyticsRouter']
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -146,6 +165,15 @@ CACHES = {
     }
 }
 
+# CRM views cache the signed-in user's Doctor profile briefly; saving the
+# doctor or its clinic clears the entry
+CRM_DOCTOR_CACHE_SECONDS = 60
+# Dashboard counts and revenue per doctor; appointment, payment and patient
+# saves clear them
+CRM_DASHBOARD_STATS_CACHE_SECONDS = 300
+# Results per page of the patient/appointment autocomplete endpoints
+CRM_AUTOCOMPLETE_PAGE_SIZE = 20
+
 # Session Configuration for Performance
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 SESSION_CACHE_ALIAS = 'default'
@@ -184,6 +212,97 @@ SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
+# Request instrumentation: per-route timings in memory, served at
+# /internal/metrics/ (staff) and /internal/metrics/prometheus/
+INSTRUMENTATION_ENABLED = env.bool('INSTRUMENTATION_ENABLED', default=True)
+INSTRUMENTATION_METRICS_TOKEN = env('INSTRUMENTATION_METRICS_TOKEN', default=None)  # Bearer token for scrapers
+INSTRUMENTATION_OVERHEAD_BUDGET_MS = 0.5  # Per request
+
+# Analytics
+# Queue tracking writes in-process and flush them in batches from a background thread
+ANALYTICS_BUFFERED_WRITES = env.bool('ANALYTICS_BUFFERED_WRITES', default=False)
+ANALYTICS_BUFFER_MAX_SIZE = 10000  # Records beyond this are dropped and counted
+ANALYTICS_BUFFER_BATCH_SIZE = 500
+ANALYTICS_BUFFER_FLUSH_INTERVAL = 2.0  # Seconds
+
+# Geolocation never blocks a request: lookups hit an LRU cache and a local
+# CSV range table (start_ip,end_ip,country,city); addresses missing from it
+# (all of them when no table is configured) are resolved through the remote
+# service by a background task, or stored as Unknown with deferred lookups off
+ANALYTICS_GEOIP_BACKEND = 'analytics.geolocation.RangeTableBackend'
+ANALYTICS_GEOIP_DATABASE = env('ANALYTICS_GEOIP_DATABASE', default=None)
+ANALYTICS_GEOIP_DEFERRED = env.bool('ANALYTICS_GEOIP_DEFERRED', default=True)
+ANALYTICS_GEOIP_REMOTE_URL = 'http://ip-api.com/json/{ip}'
+ANALYTICS_GEOIP_MAX_PENDING = 1000  # Addresses waiting for a remote lookup; more are dropped
+ANALYTICS_GEOIP_CACHE_SIZE = 10000
+ANALYTICS_GEOIP_CACHE_TTL = 86400  # Seconds
+
+# Periodic jobs (DailyStats rollups, ...) run on a daemon thread in each
+# worker; a cache lock lets only one worker execute each run
+ANALYTICS_SCHEDULER_ENABLED = env.bool('ANALYTICS_SCHEDULER_ENABLED', default=False)
+ANALYTICS_ROLLUP_INTERVAL = 900  # Seconds
+# Page views are split into sessions on inactivity before each rollup
+ANALYTICS_SESSION_TIMEOUT_MINUTES = 30
+ANALYTICS_SESSIONIZE_CHUNK_SIZE = 500  # Visitors per batch
+# Heartbeats are coalesced in ANALYTICS_REALTIME_CACHE and last-seen times are
+# written once per interval, by the scheduler or the first request after it;
+# without a shared cache each heartbeat updates its visitor directly
+ANALYTICS_LIVENESS_FLUSH_INTERVAL = 60  # Seconds
+
+# Real-time counters need a cache shared by every worker (Redis, Memcached,
+# database); with a per-process cache such as LocMemCache they are skipped and
+# the real-time views query the database instead
+ANALYTICS_REALTIME_CACHE = 'default'
+ANALYTICS_REALTIME_MAX_SHARDS = 64  # Worker processes that can count at once
+
+# Dashboard aggregates are cached per date range for this long
+ANALYTICS_DASHBOARD_CACHE_SECONDS = 300
+# Contact/quote submissions count as conversions when a form_submit event on
+# one of these paths was tracked within the window
+ANALYTICS_CONVERSION_PATHS = ['/contact/']
+ANALYTICS_CONVERSION_WINDOW = 120  # Seconds
+# Engagement score targets: visits reaching both count as fully engaged
+ANALYTICS_ENGAGEMENT_TARGET_PAGES = 5
+ANALYTICS_ENGAGEMENT_TARGET_SECONDS = 180
+
+# Paths need this many page timing samples to be ranked among the slowest
+ANALYTICS_TIMING_MIN_SAMPLES = 5
+
+# Page views, events and timings older than AnalyticsSettings.data_retention_days are
+# deleted in small batches; each scheduled run stops at the time budget and
+# the next one resumes
+ANALYTICS_RETENTION_DAYS = 365  # Used when no AnalyticsSettings row exists
+ANALYTICS_RETENTION_INTERVAL = 3600  # Seconds
+ANALYTICS_RETENTION_BATCH_SIZE = 5000
+ANALYTICS_RETENTION_TIME_BUDGET = 60  # Seconds per scheduled run
+ANALYTICS_RETENTION_ARCHIVE_DIR = env('ANALYTICS_RETENTION_ARCHIVE_DIR', default=None)
+
+# The tracking script queues events and posts them to /analytics/track/batch/
+ANALYTICS_BATCH_MAX_EVENTS = 100
+
+# Page titles are recorded while base.html renders; other HTML responses are
+# searched for <title> in this many leading bytes only
+ANALYTICS_TITLE_SCAN_BYTES = 8192
+
+# Log mode: the tracking endpoints append to local segment files and the
+# compact_event_log command bulk-loads sealed segments into the database
+ANALYTICS_EVENT_LOG_ENABLED = env.bool('ANALYTICS_EVENT_LOG_ENABLED', default=False)
+ANALYTICS_EVENT_LOG_DIR = env('ANALYTICS_EVENT_LOG_DIR', default=str(BASE_DIR / 'eventlog'))
+ANALYTICS_EVENT_LOG_SEGMENT_BYTES = 64 * 1024 * 1024
+ANALYTICS_EVENT_LOG_SEGMENT_SECONDS = 60  # Open segments are sealed after this long
+ANALYTICS_EVENT_LOG_FSYNC_INTERVAL = 1.0  # Seconds between fsyncs of the open segment
+ANALYTICS_EVENT_LOG_CHUNK_SIZE = 5000  # Records per bulk load
+
+# Database aliases used by analytics.routers.AnalyticsRouter
+ANALYTICS_DATABASE = 'analytics'
+ANALYTICS_REPLICA_DATABASE = 'analytics_replica'
+# Single-node SQLite profile applied to SQLite connections on the two aliases above
+ANALYTICS_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+}
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -3,7 +3,9 @@
     'use strict';
     
     // Configuration
-    const ANALYTICS_ENDPOINT = '/analytics/track/';
+    const ANALYTICS_ENDPOINT = '/analytics/track/batch/';
+    const FLUSH_INTERVAL = 10 * 1000; // 10 seconds
+    const MAX_BATCH_SIZE = 20; // Server accepts up to 100 per request
     const SESSION_TIMEOUT = 30 * 60 * 1000; // 30 minutes
     const HEARTBEAT_INTERVAL = 30 * 1000; // 30 seconds
     
@@ -12,6 +14,10 @@
     let pageStartTime = Date.now();
     let isActive = true;
     let heartbeatInterval;
+    let eventQueue = [];
+    let flushTimeout = null;
+    let timingSent = false;
+    const vitals = { lcp: null, cls: 0, inp: null };
     
     // Initialize analytics
     function init() {
@@ -24,14 +30,21 @@
         // Track page view
         trackPageView();
         
+        // Collect Web Vitals until the page is hidden
+        observeVitals();
+        
         // Set up event listeners
         setupEventListeners();
         
         // Start heartbeat
         startHeartbeat();
         
-        // Track page unload
+        // Track page unload and flush whatever is still queued
         window.addEventListener('beforeunload', trackPageUnload);
+        window.addEventListener('pagehide', function() {
+            trackPageTiming();
+            flushEvents();
+        });
         
         // Track visibility change
         document.addEventListener('visibilitychange', handleVisibilityChange);
@@ -49,7 +62,7 @@
             timestamp: new Date().toISOString()
         };
         
-        sendData('page_view', data);
+        sendData('page_view', data, true);
     }
     
     // Track page unload
@@ -61,7 +74,63 @@
             timestamp: new Date().toISOString()
         };
         
-        sendData('page_unload', data, true); // Synchronous
+        sendData('page_unload', data, true);
+    }
+    
+    // Observe a performance entry type, ignoring browsers that lack it
+    function observe(type, callback, options = {}) {
+        try {
+            new PerformanceObserver(list => callback(list.getEntries()))
+                .observe(Object.assign({ type: type, buffered: true }, options));
+        } catch (e) {
+            // Entry type not supported
+        }
+    }
+    
+    // Web Vitals that settle over the page's lifetime
+    function observeVitals() {
+        if (!('PerformanceObserver' in window)) {
+            return;
+        }
+        observe('largest-contentful-paint', entries => {
+            vitals.lcp = entries[entries.length - 1].startTime;
+        });
+        observe('layout-shift', entries => entries.forEach(entry => {
+            if (!entry.hadRecentInput) {
+                vitals.cls += entry.value;
+            }
+        }));
+        observe('event', entries => entries.forEach(entry => {
+            if (entry.interactionId) {
+                vitals.inp = Math.max(vitals.inp || 0, entry.duration);
+            }
+        }), { durationThreshold: 40 });
+    }
+    
+    // Report Navigation Timing and Web Vitals once per page, when it is hidden
+    function trackPageTiming() {
+        if (timingSent || !window.performance || !performance.getEntriesByType) {
+            return;
+        }
+        const navigation = performance.getEntriesByType('navigation')[0];
+        if (!navigation) {
+            return;
+        }
+        timingSent = true;
+        
+        const paint = performance.getEntriesByName('first-contentful-paint')[0];
+        const data = {
+            path: window.location.pathname,
+            ttfb: navigation.responseStart,
+            fcp: paint ? paint.startTime : null,
+            dom_content_loaded: navigation.domContentLoadedEventEnd || null,
+            load: navigation.loadEventEnd || null,
+            lcp: vitals.lcp,
+            cls: vitals.cls,
+            inp: vitals.inp
+        };
+        
+        sendData('page_timing', data);
     }
     
     // Track custom events
@@ -216,6 +285,8 @@
         if (document.hidden) {
             isActive = false;
             clearInterval(heartbeatInterval);
+            trackPageTiming();
+            flushEvents();
         } else {
             isActive = true;
             startHeartbeat();
@@ -239,37 +310,47 @@
         }, HEARTBEAT_INTERVAL);
     }
     
-    // Send data to server
-    function sendData(eventType, data, synchronous = false) {
-        const payload = {
+    // Queue an event; the queue is flushed in batches
+    function sendData(eventType, data, immediate = false) {
+        eventQueue.push({
             event_type: eventType,
             data: data
-        };
+        });
         
-        if (synchronous) {
-            // Use sendBeacon for synchronous requests
-            if (navigator.sendBeacon) {
-                navigator.sendBeacon(ANALYTICS_ENDPOINT, JSON.stringify(payload));
-            } else {
-                // Fallback to synchronous XMLHttpRequest
-                const xhr = new XMLHttpRequest();
-                xhr.open('POST', ANALYTICS_ENDPOINT, false);
-                xhr.setRequestHeader('Content-Type', 'application/json');
-                xhr.send(JSON.stringify(payload));
-            }
-        } else {
-            // Use fetch for asynchronous requests
-            fetch(ANALYTICS_ENDPOINT, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCSRFToken()
-                },
-                body: JSON.stringify(payload)
-            }).catch(error => {
-                console.log('Analytics tracking error:', error);
-            });
+        if (immediate || eventQueue.length >= MAX_BATCH_SIZE) {
+            flushEvents();
+        } else if (!flushTimeout) {
+            flushTimeout = setTimeout(flushEvents, FLUSH_INTERVAL);
+        }
+    }
+    
+    // Send all queued events in one request
+    function flushEvents() {
+        clearTimeout(flushTimeout);
+        flushTimeout = null;
+        
+        if (eventQueue.length === 0) {
+            return;
+        }
+        
+        const payload = JSON.stringify({ events: eventQueue.splice(0, eventQueue.length) });
+        
+        // sendBeacon survives page unloads and never blocks the page
+        if (navigator.sendBeacon && navigator.sendBeacon(ANALYTICS_ENDPOINT, payload)) {
+            return;
         }
+        
+        fetch(ANALYTICS_ENDPOINT, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: payload,
+            keepalive: true
+        }).catch(error => {
+            console.log('Analytics tracking error:', error);
+        });
     }
     
     // Get CSRF token
@@ -286,7 +367,8 @@
         trackClick: trackClick,
         trackScroll: trackScrollDepth,
         trackOutbound: trackOutboundLink,
-        trackDownload: trackDownload
+        trackDownload: trackDownload,
+        flush: flushEvents
     };
     
     // Initialize when DOM is ready
@@ -0,0 +1,153 @@
+// CRM autocomplete for <select data-autocomplete-url> (crm.widgets.AutocompleteSelect)
+(function() {
+    'use strict';
+    
+    const DEBOUNCE_DELAY = 250; // ms between the last keystroke and the request
+    
+    function enhance(select) {
+        if (select.dataset.autocompleteReady) {
+            return;
+        }
+        select.dataset.autocompleteReady = '1';
+        
+        const url = select.dataset.autocompleteUrl;
+        const forward = select.dataset.autocompleteForward;
+        const selected = select.options[select.selectedIndex];
+        
+        const wrapper = document.createElement('div');
+        wrapper.className = 'relative';
+        const input = document.createElement('input');
+        input.type = 'search';
+        input.autocomplete = 'off';
+        input.className = select.className;
+        input.placeholder = 'Type to search...';
+        input.value = selected && selected.value ? selected.text : '';
+        const list = document.createElement('ul');
+        list.className = 'absolute z-20 mt-1 w-full max-h-64 overflow-y-auto bg-white border border-gray-200 rounded-md shadow-lg hidden';
+        
+        select.parentNode.insertBefore(wrapper, select);
+        wrapper.appendChild(input);
+        wrapper.appendChild(list);
+        wrapper.appendChild(select);
+        select.style.display = 'none';
+        
+        let timer = null;
+        let page = 1;
+        let more = false;
+        let loading = false;
+        let controller = null;
+        
+        function forwardedValue() {
+            const field = forward && select.form ? select.form.elements[forward] : null;
+            return field ? field.value : '';
+        }
+        
+        function choose(id, text) {
+            let option = Array.from(select.options).find(opt => opt.value === String(id));
+            if (!option) {
+                option = new Option(text, id);
+                select.add(option);
+            }
+            select.value = String(id);
+            input.value = text;
+            list.classList.add('hidden');
+            select.dispatchEvent(new Event('change', { bubbles: true }));
+        }
+        
+        function render(results, append) {
+            if (!append) {
+                list.innerHTML = '';
+            }
+            results.forEach(function(result) {
+                const item = document.createElement('li');
+                item.className = 'px-3 py-2 cursor-pointer hover:bg-blue-50 text-sm text-gray-900';
+                item.textContent = result.text;
+                item.addEventListener('mousedown', function(event) {
+                    event.preventDefault();
+                    choose(result.id, result.text);
+                });
+                list.appendChild(item);
+            });
+            if (!list.children.length) {
+                const empty = document.createElement('li');
+                empty.className = 'px-3 py-2 text-sm text-gray-500';
+                empty.textContent = 'No matches';
+                list.appendChild(empty);
+            }
+            list.classList.remove('hidden');
+        }
+        
+        function load(append) {
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            loading = true;
+            const params = new URLSearchParams({ q: input.value.trim(), page: page });
+            if (forward) {
+                params.set(forward, forwardedValue());
+            }
+            fetch(url + '?' + params.toString(), {
+                credentials: 'same-origin',
+                signal: controller.signal,
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            })
+                .then(response => response.json())
+                .then(data => {
+                    more = data.more;
+                    render(data.results, append);
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        console.log('Error loading options:', error);
+                    }
+                })
+                .finally(() => { loading = false; });
+        }
+        
+        input.addEventListener('input', function() {
+            if (!input.value.trim()) {
+                select.value = '';
+            }
+            clearTimeout(timer);
+            timer = setTimeout(function() {
+                page = 1;
+                load(false);
+            }, DEBOUNCE_DELAY);
+        });
+        input.addEventListener('focus', function() {
+            page = 1;
+            load(false);
+        });
+        input.addEventListener('blur', function() {
+            list.classList.add('hidden');
+            const current = select.options[select.selectedIndex];
+            input.value = current && current.value ? current.text : '';
+        });
+        list.addEventListener('scroll', function() {
+            // Next page once the list is scrolled to its end
+            if (more && !loading && list.scrollTop + list.clientHeight >= list.scrollHeight - 20) {
+                page += 1;
+                load(true);
+            }
+        });
+        
+        if (forward && select.form && select.form.elements[forward]) {
+            // A different patient invalidates the chosen appointment
+            select.form.elements[forward].addEventListener('change', function() {
+                select.value = '';
+                input.value = '';
+            });
+        }
+    }
+    
+    function init() {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(enhance);
+    }
+    
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', init);
+    } else {
+        init();
+    }
+})();